@@ -168,7 +168,7 @@ export const getHorsesTableColumns: GetHorseTableColumnsType = (
             render: (record: HorseTableDataItemType) => {
                 return (
                     <>
-                        <span>{record.photos.length}</span>
+                        <span>{record.photos_count}</span>
                     </>
                 )
             },
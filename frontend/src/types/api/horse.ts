@@ -25,7 +25,8 @@ export type HorseType = {
     age: number | null
     bdate_formatted: string | null
     ddate_formatted: string | null
-    photos: GalleryPhotoType[]
+    cover: GalleryPhotoType | null
+    photos_count: number
     kind?: HorseKindType
     owner?: HorseOwnerType | null
     children?: HorseType[]
@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, Token
+
+GROUPS_CLAIM = "groups"
+PERMISSIONS_CLAIM = "perms"
+PERMISSIONS_VERSION_CLAIM = "pv"
+
+
+class PermissionClaims:
+    """Группы и права пользователя из токена (выдаются при авторизации).
+
+    Действительны, пока version совпадает с NewUser.permissions_version.
+    """
+
+    __slots__ = ("groups", "perms", "version")
+
+    def __init__(self, groups, perms, version: int):
+        self.groups = frozenset(groups)
+        self.perms = frozenset(perms)
+        self.version = version
+
+    @classmethod
+    def from_token(cls, token: Token) -> "PermissionClaims | None":
+        # Токены, выданные до появления claims, проверяются по базе
+        if PERMISSIONS_VERSION_CLAIM not in token:
+            return None
+        return cls(
+            token.get(GROUPS_CLAIM, ()),
+            token.get(PERMISSIONS_CLAIM, ()),
+            token[PERMISSIONS_VERSION_CLAIM],
+        )
+
+
+class CachedToken:
+    __slots__ = (
+        "token",
+        "expires_at",
+        "user_id",
+        "claims",
+        "user_values",
+        "user_cached_at",
+    )
+
+    def __init__(self, token: AccessToken):
+        self.token = token
+        self.expires_at = token["exp"]
+        self.user_id = token.get(api_settings.USER_ID_CLAIM)
+        self.claims = PermissionClaims.from_token(token)
+        # Поля пользователя (attname -> значение) после проверки в get_user
+        self.user_values = None
+        self.user_cached_at = 0.0
+
+
+class VerifiedTokenCache:
+    """LRU проверенных access-токенов процесса.
+
+    Ключ - SHA-256 токена, запись действует до exp токена. Проверка подписи
+    и разбор токена выполняются один раз для JWTRefreshMiddleware
+    и CachedJWTAuthentication. Неверные токены не кэшируются.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.entries: OrderedDict[bytes, CachedToken] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(raw_token: str | bytes) -> bytes:
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, raw_token: str | bytes) -> CachedToken:
+        """Возвращает запись проверенного токена, для неверного токена
+        AccessToken вызывает TokenError."""
+        key = self.get_key(raw_token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry.expires_at > time.time():
+                    self.entries.move_to_end(key)
+                    return entry
+                del self.entries[key]
+
+        entry = CachedToken(AccessToken(raw_token))
+        with self.lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate_user(self, user_id) -> None:
+        self.invalidate_users([user_id])
+
+    def invalidate_users(self, user_ids) -> None:
+        # Токены остаются проверенными, пользователь загружается заново
+        user_ids = {str(user_id) for user_id in user_ids}
+        with self.lock:
+            for entry in self.entries.values():
+                if str(entry.user_id) in user_ids:
+                    entry.user_values = None
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = VerifiedTokenCache(getattr(settings, "JWT_TOKEN_CACHE_SIZE", 1024))
+
+
+def get_user_cache_ttl() -> int:
+    return getattr(settings, "JWT_USER_CACHE_TTL", 60)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication с проверкой токенов через token_cache.
+
+    Пользователь после первой загрузки (с проверками is_active и т.п.)
+    создаётся из сохранённых в записи токена полей без запроса к базе.
+    Поля обновляются через JWT_USER_CACHE_TTL секунд, а при изменении
+    или удалении пользователя - сразу (invalidate_cached_user).
+
+    Группы и права из токена доступны в user.permission_claims, если их
+    версия совпадает с permissions_version пользователя, иначе там None
+    и проверки прав выполняются по базе.
+    """
+
+    def get_validated_token(self, raw_token: bytes) -> AccessToken:
+        self.cached_token = None
+        try:
+            self.cached_token = token_cache.get(raw_token)
+        except TokenError:
+            # Сообщение об ошибке формирует JWTAuthentication
+            return super().get_validated_token(raw_token)
+        return self.cached_token.token
+
+    def get_user(self, validated_token: AccessToken):
+        entry = getattr(self, "cached_token", None)
+        if entry is None or entry.token is not validated_token:
+            user = super().get_user(validated_token)
+            claims = PermissionClaims.from_token(validated_token)
+        else:
+            user = self.get_cached_user(entry, validated_token)
+            claims = entry.claims
+        if claims is not None and claims.version != getattr(
+            user, "permissions_version", None
+        ):
+            claims = None
+        user.permission_claims = claims
+        return user
+
+    def get_cached_user(self, entry: CachedToken, validated_token: AccessToken):
+        user_values = entry.user_values
+        if user_values is not None:
+            if time.monotonic() - entry.user_cached_at < get_user_cache_ttl():
+                return self.user_model.from_db(
+                    router.db_for_read(self.user_model),
+                    list(user_values),
+                    list(user_values.values()),
+                )
+
+        user = super().get_user(validated_token)
+        # Значения без обёрток (FieldFile и т.п.), привязанных к экземпляру
+        entry.user_values = {
+            field.attname: field.get_prep_value(getattr(user, field.attname))
+            for field in self.user_model._meta.concrete_fields
+        }
+        entry.user_cached_at = time.monotonic()
+        return user
+
+
+def invalidate_cached_user(sender, instance, **kwargs) -> None:
+    token_cache.invalidate_user(instance.pk)
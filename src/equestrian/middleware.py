@@ -2,7 +2,11 @@ from django.conf import settings
 from django.utils import timezone
 
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from profile_management.claims import update_permission_claims
+
+from .authentication import token_cache
 
 
 class JWTRefreshMiddleware:
@@ -21,7 +25,8 @@ class JWTRefreshMiddleware:
 
         if access_token:
             try:
-                AccessToken(access_token)
+                # Проверенный токен повторно использует CachedJWTAuthentication
+                token_cache.get(access_token)
                 self._set_authorization_header(request, access_token)
             except TokenError:
                 self._try_refresh(request, refresh_cookie_name)
@@ -82,6 +87,9 @@ class JWTRefreshMiddleware:
             request._jwt_clear_tokens = True
             return
 
+        # Claims refresh-токена выданы при авторизации, новый access-токен
+        # получает текущие группы и права пользователя
+        update_permission_claims(refresh)
         new_access_token = str(refresh.access_token)
         self._set_authorization_header(request, new_access_token)
         request._jwt_new_access_token = new_access_token
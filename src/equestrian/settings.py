@@ -58,6 +58,7 @@ INSTALLED_APPS = [
     "gallery",
     "service",
     "static_information",
+    "jobs",
     "drf_spectacular",
 ]
 
@@ -174,11 +175,21 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "equestrian.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# Проверенные access-токены в памяти процесса (equestrian.authentication):
+# количество токенов и время (секунд), через которое пользователь токена
+# загружается из базы заново
+JWT_TOKEN_CACHE_SIZE = 1024
+JWT_USER_CACHE_TTL = 60
+
+# Время (секунд), через которое кэш наименований пород и владельцев
+# в памяти процесса (horses.resolvers) загружается из базы заново
+HORSE_NAMES_CACHE_TTL = 60
+
 LANGUAGE_CODE = "ru-ru"
 
 TIME_ZONE = "Europe/Moscow"
@@ -194,6 +205,77 @@ if not DEBUG:
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Хранилище медиафайлов: "local" - MEDIA_ROOT, "s3" - S3-совместимое
+# хранилище (AWS S3, MinIO), в которое клиенты загружают файлы напрямую
+# по подписанным ссылкам (upload_url в /api/v1/gallery/uploads/)
+MEDIA_STORAGE = os.environ.get("MEDIA_STORAGE", "local")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY", "")
+S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY", "")
+S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+# "path" - https://host/bucket/key (MinIO), "virtual" - https://bucket.host/key
+S3_ADDRESSING_STYLE = os.environ.get("S3_ADDRESSING_STYLE", "path")
+# Адрес CDN или публичного bucket, без него выдаются подписанные ссылки
+S3_PUBLIC_URL = os.environ.get("S3_PUBLIC_URL", "")
+S3_URL_EXPIRES = 60 * 60
+if MEDIA_STORAGE == "s3":
+    STORAGES = {
+        "default": {"BACKEND": "service.s3.S3Storage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    }
+
+# Ширины уменьшенных копий фотографий и количество процессов для их генерации
+PHOTO_VARIANT_WIDTHS = [320, 640, 1280]
+PHOTO_VARIANT_WORKERS = int(os.environ.get("PHOTO_VARIANT_WORKERS", 2))
+
+# Дисковый кэш изображений, уменьшенных по запросу (/gallery/<pk>/render/)
+PHOTO_RENDER_CACHE_DIR = os.environ.get(
+    "PHOTO_RENDER_CACHE_DIR", os.path.join(BASE_DIR, "render_cache")
+)
+PHOTO_RENDER_CACHE_SIZE = (
+    int(os.environ.get("PHOTO_RENDER_CACHE_SIZE_MB", 512)) * 1024 * 1024
+)
+
+# SHA-256 загружаемых файлов считается при получении запроса
+FILE_UPLOAD_HANDLERS = [
+    "gallery.upload_handlers.HashingMemoryFileUploadHandler",
+    "gallery.upload_handlers.HashingTemporaryFileUploadHandler",
+]
+
+# Загрузка фотографий по частям (/gallery/uploads/): максимальный размер
+# одной части и файла целиком в байтах
+PHOTO_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+PHOTO_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+# Срок действия ссылки для загрузки файла напрямую в хранилище (секунд)
+PHOTO_UPLOAD_URL_EXPIRES = 60 * 60
+
+# Приём изображений (gallery.ingest): изображение, которое при декодировании
+# займёт больше PHOTO_MAX_PIXELS точек, отклоняется по заголовку файла,
+# оригиналы больше PHOTO_MAX_SIDE по большей стороне или с метаданными
+# больше PHOTO_MAX_METADATA_SIZE байт уменьшаются при загрузке
+PHOTO_MAX_PIXELS = int(os.environ.get("PHOTO_MAX_PIXELS", 50_000_000))
+PHOTO_MAX_SIDE = int(os.environ.get("PHOTO_MAX_SIDE", 4096))
+PHOTO_MAX_METADATA_SIZE = 64 * 1024
+
+# Очередь фоновых задач (manage.py runworker)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = 1
+# Задача, выполняющаяся дольше JOB_TIMEOUT секунд, выдаётся другому воркеру
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 60 * 60))
+JOB_RETENTION_DAYS = 7
+
+# Передача медиафайлов (/media/ и /gallery/<pk>/render/) прокси-серверу:
+# "nginx" - X-Accel-Redirect на внутренние location из MEDIA_ACCEL_LOCATIONS,
+# "sendfile" - X-Sendfile (Apache, lighttpd), пусто - отдаёт Django
+MEDIA_OFFLOAD = os.environ.get("MEDIA_OFFLOAD", "")
+MEDIA_ACCEL_LOCATIONS = {
+    MEDIA_ROOT: "/protected/media/",
+    PHOTO_RENDER_CACHE_DIR: "/protected/render_cache/",
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 ALLOW_DOCUMENTATION = os.environ.get("ALLOW_DOCUMENTATION")
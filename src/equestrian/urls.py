@@ -1,15 +1,17 @@
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from .settings import DEBUG, MEDIA_ROOT, MEDIA_URL
+from service.views import MediaAPIView
+
+from .settings import DEBUG, MEDIA_URL
 
 api_v1_patterns = [
     path("auth/", include("profile_management.urls_auth")),
     path("users/", include("profile_management.urls")),
     path("horses/", include("horses.urls")),
     path("gallery/", include("gallery.urls")),
+    path("jobs/", include("jobs.urls")),
     path("static_information/", include("static_information.urls")),
 ]
 
@@ -18,10 +20,10 @@ urlpatterns = [
     path("api/v1/", include(api_v1_patterns)),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="docs"),
+    path(f"{MEDIA_URL.strip('/')}/<path:path>", MediaAPIView.as_view()),
 ]
 
 if DEBUG:
     from debug_toolbar.toolbar import debug_toolbar_urls
 
-    urlpatterns += static(MEDIA_URL, document_root=MEDIA_ROOT)
     urlpatterns += debug_toolbar_urls()
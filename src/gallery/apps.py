@@ -4,3 +4,37 @@ from django.apps import AppConfig
 class GalleryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "gallery"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from profile_management.permissions import register_claim_permissions
+
+        from .blobs import on_photo_deleted, on_photos_deleted
+        from .models import Photo, PhotoVariant
+        from .signals import post_photos_delete
+        from .timeline import (
+            add_created_photo,
+            remove_deleted_photo,
+            remove_deleted_photos,
+        )
+        from .variants import on_photo_saved, on_variant_deleted
+
+        post_save.connect(on_photo_saved, sender=Photo, dispatch_uid="photo_variants")
+        post_delete.connect(on_photo_deleted, sender=Photo, dispatch_uid="photo_blobs")
+        post_save.connect(
+            add_created_photo, sender=Photo, dispatch_uid="photo_timeline_add"
+        )
+        post_delete.connect(
+            remove_deleted_photo, sender=Photo, dispatch_uid="photo_timeline_remove"
+        )
+        post_photos_delete.connect(
+            on_photos_deleted, sender=Photo, dispatch_uid="photos_blobs"
+        )
+        post_photos_delete.connect(
+            remove_deleted_photos, sender=Photo, dispatch_uid="photos_timeline_remove"
+        )
+        post_delete.connect(
+            on_variant_deleted, sender=PhotoVariant, dispatch_uid="photo_variant_files"
+        )
+        register_claim_permissions("gallery.change_photo")
@@ -0,0 +1,88 @@
+from collections.abc import Callable
+
+from django.db import transaction
+
+from profile_management.permissions import register_claim_permissions
+
+from .models import Photo
+from .signals import batch_delete, post_photos_delete, pre_photos_delete
+
+
+def delete_photos(photo_ids: list[int], data: dict) -> int:
+    """Удаляет фотографии несколькими запросами на всю пачку.
+
+    Связанные записи удаляются каскадом, счётчики файлов, ленты и обложки
+    лошадей обновляются получателями pre_photos_delete/post_photos_delete.
+    Файлы удаляются после фиксации транзакции.
+    """
+    photos = list(
+        Photo.objects.filter(id__in=photo_ids).only("id", "image", "captured_at")
+    )
+    pre_photos_delete.send(sender=Photo, photos=photos)
+    token = batch_delete.set(True)
+    try:
+        Photo.objects.filter(id__in=photo_ids).delete()
+    finally:
+        batch_delete.reset(token)
+    post_photos_delete.send(sender=Photo, photos=photos)
+    return len(photos)
+
+
+def set_categories(photo_ids: list[int], data: dict) -> int:
+    # В отличие от Photo.set_categories связи меняются сразу для всех
+    # фотографий: удаление лишних и добавление новых - по одному запросу
+    categories = data.get("category")
+    if categories is None:
+        raise ValueError("Не указаны категории category")
+    category_ids = Photo.get_category_ids(categories) if categories else []
+    through = Photo.category.through
+    removed = 0
+    if data.get("replace", True):
+        removed, _ = (
+            through.objects.filter(photo_id__in=photo_ids)
+            .exclude(photocategory_id__in=category_ids)
+            .delete()
+        )
+    added = through.objects.bulk_create(
+        [
+            through(photo_id=photo_id, photocategory_id=category_id)
+            for photo_id in photo_ids
+            for category_id in category_ids
+        ],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    return removed + len(added)
+
+
+# Действие -> (функция(id фотографий, параметры) -> количество изменений,
+# право, необходимое кроме права модератора галереи)
+BATCH_ACTIONS: dict[str, tuple[Callable, str | None]] = {
+    "delete": (delete_photos, None),
+    "set_categories": (set_categories, None),
+}
+
+
+def register_action(name: str, action: Callable, permission: str | None = None):
+    # Действия других приложений (например, добавление в альбомы лошадей)
+    BATCH_ACTIONS[name] = (action, permission)
+    if permission:
+        register_claim_permissions(permission)
+
+
+@transaction.atomic
+def run_action(name: str, photo_ids: list[int], data: dict) -> dict:
+    """Выполняет действие для фотографий в одной транзакции.
+
+    Несуществующие id пропускаются, найденные фотографии блокируются
+    до конца транзакции. При ValueError изменения отменяются.
+    """
+    action, _ = BATCH_ACTIONS[name]
+    ids = list(
+        Photo.objects.select_for_update()
+        .filter(id__in=photo_ids)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    changed = action(ids, data) if ids else 0
+    return {"action": name, "photos": len(ids), "changed": changed}
@@ -0,0 +1,215 @@
+import hashlib
+import os
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.db.models.functions import Greatest
+
+from .models import PhotoBlob
+from .signals import is_batch_delete
+
+
+def get_sha256(file) -> str:
+    # Для файлов из запроса хеш посчитан при получении
+    # (gallery.upload_handlers), остальные файлы читаются один раз
+    sha256 = getattr(file, "sha256", None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def get_blob_name(sha256: str, filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f"photos/{sha256[:2]}/{sha256}{extension}"
+
+
+def store_files(files: list) -> tuple[list[str], set[str]]:
+    """Сохраняет файлы по хешу содержимого и увеличивает счётчики ссылок.
+
+    Возвращает имена файлов в хранилище в порядке files и множество
+    записанных при этом вызове имён. Одинаковые файлы получают одно имя,
+    уже известный файл не записывается. Вызывается внутри транзакции:
+    найденные записи блокируются, чтобы файл не удалили до фиксации.
+    """
+    hashes = [get_sha256(file) for file in files]
+    counts = Counter(hashes)
+    names = dict(
+        PhotoBlob.objects.select_for_update()
+        .filter(sha256__in=counts)
+        .values_list("sha256", "name")
+    )
+    existing = set(names)
+
+    blobs = []
+    try:
+        for file, sha256 in zip(files, hashes):
+            if sha256 in names:
+                continue
+            names[sha256] = default_storage.save(get_blob_name(sha256, file.name), file)
+            blobs.append(
+                PhotoBlob(
+                    sha256=sha256,
+                    name=names[sha256],
+                    size=file.size,
+                    ref_count=counts[sha256],
+                )
+            )
+    except Exception:
+        for blob in blobs:
+            default_storage.delete(blob.name)
+        raise
+
+    written = {blob.name for blob in blobs}
+    if blobs:
+        PhotoBlob.objects.bulk_create(blobs, ignore_conflicts=True)
+        # Тот же файл мог одновременно загрузить другой запрос
+        stored = dict(
+            PhotoBlob.objects.filter(
+                sha256__in=[blob.sha256 for blob in blobs]
+            ).values_list("sha256", "name")
+        )
+        for blob in blobs:
+            if stored[blob.sha256] != blob.name:
+                default_storage.delete(blob.name)
+                written.discard(blob.name)
+                names[blob.sha256] = stored[blob.sha256]
+                existing.add(blob.sha256)
+
+    if existing:
+        PhotoBlob.objects.filter(sha256__in=existing).update(
+            ref_count=F("ref_count")
+            + Case(*[When(sha256=sha256, then=counts[sha256]) for sha256 in existing])
+        )
+    return [names[sha256] for sha256 in hashes], written
+
+
+def release_blobs(names: list[str]) -> None:
+    """Уменьшает счётчики ссылок одним запросом, файлы без ссылок
+    удаляются после фиксации транзакции."""
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    released = PhotoBlob.objects.filter(name__in=counts, ref_count__gt=0).update(
+        ref_count=Greatest(
+            F("ref_count")
+            - Case(*[When(name=name, then=count) for name, count in counts.items()]),
+            0,
+            output_field=PositiveIntegerField(),
+        )
+    )
+    if released:
+        transaction.on_commit(lambda: delete_unreferenced(list(counts)))
+
+
+def delete_unreferenced(names: list[str]) -> None:
+    # Найденные записи блокируются: store_files блокирует их же, поэтому
+    # на файл не успеет сослаться новая загрузка до удаления
+    with transaction.atomic():
+        unreferenced = list(
+            PhotoBlob.objects.select_for_update()
+            .filter(name__in=names, ref_count=0)
+            .values_list("name", flat=True)
+        )
+        PhotoBlob.objects.filter(name__in=unreferenced).delete()
+    for name in unreferenced:
+        default_storage.delete(name)
+
+
+def on_photo_deleted(sender, instance, **kwargs) -> None:
+    if not is_batch_delete():
+        release_blobs([instance.image.name])
+
+
+def on_photos_deleted(sender, photos, **kwargs) -> None:
+    release_blobs([photo.image.name for photo in photos])
+
+
+def index_photos(batch_size: int = 500) -> dict:
+    """Переводит фотографии, загруженные без учёта хешей, на общие файлы.
+
+    Фотографии с одинаковым содержимым начинают ссылаться на один файл,
+    остальные копии удаляются. Возвращает количество проиндексированных
+    фотографий, удалённых файлов, освобождённых байт и ненайденных файлов.
+    """
+    from .models import Photo
+
+    result = {"indexed": 0, "removed": 0, "freed": 0, "missing": 0}
+    last_id = 0
+    while True:
+        photos = list(
+            Photo.objects.filter(id__gt=last_id)
+            .exclude(image__in=PhotoBlob.objects.values("name"))
+            .order_by("id")
+            .only("id", "image")[:batch_size]
+        )
+        if not photos:
+            return result
+        last_id = photos[-1].id
+
+        groups = {}
+        sizes = {}
+        hashes = {}
+        for photo in photos:
+            name = photo.image.name
+            if name not in hashes:
+                try:
+                    with default_storage.open(name, "rb") as file:
+                        hashes[name] = get_sha256(file)
+                        sizes[name] = file.size
+                except OSError:
+                    result["missing"] += 1
+                    continue
+            groups.setdefault(hashes[name], []).append(photo)
+
+        with transaction.atomic():
+            blobs = {
+                blob.sha256: blob
+                for blob in PhotoBlob.objects.select_for_update().filter(
+                    sha256__in=groups
+                )
+            }
+            changed = []
+            new_blobs = []
+            for sha256, group in groups.items():
+                blob = blobs.get(sha256)
+                if blob is None:
+                    name = group[0].image.name
+                    new_blobs.append(
+                        PhotoBlob(
+                            sha256=sha256,
+                            name=name,
+                            size=sizes[name],
+                            ref_count=len(group),
+                        )
+                    )
+                else:
+                    name = blob.name
+                    blob.ref_count += len(group)
+                for photo in group:
+                    if photo.image.name != name:
+                        photo.old_name = photo.image.name
+                        photo.image = name
+                        changed.append(photo)
+            PhotoBlob.objects.bulk_create(new_blobs)
+            PhotoBlob.objects.bulk_update(blobs.values(), ["ref_count"])
+            Photo.objects.bulk_update(changed, ["image"])
+
+            # Файл может использоваться ещё не обработанными фотографиями
+            old_names = {photo.old_name for photo in changed}
+            old_names -= set(
+                Photo.objects.filter(image__in=old_names).values_list(
+                    "image", flat=True
+                )
+            )
+        for name in old_names:
+            default_storage.delete(name)
+            result["removed"] += 1
+            result["freed"] += sizes[name]
+        result["indexed"] += sum(len(group) for group in groups.values())
@@ -0,0 +1,124 @@
+import io
+import logging
+import os
+import zipfile
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+# Даты в ZIP начинаются с 1980 года
+MIN_ZIP_DATE = datetime(1980, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class ZipBuffer(io.RawIOBase):
+    """Поток без перемотки, в который zipfile пишет архив.
+
+    zipfile для такого потока записывает CRC и размер после данных файла
+    (data descriptor), поэтому архив можно отдавать по мере записи:
+    накопленные байты забираются методом pop().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def get_safe_filename(name: str, default: str) -> str:
+    try:
+        return get_valid_filename(name)
+    except SuspiciousFileOperation:
+        return default
+
+
+def get_archive_names(photos: list[tuple]) -> list[str]:
+    # Имя файла в архиве - исходное имя фотографии, расширение берётся
+    # из файла в хранилище, одинаковые имена нумеруются
+    names = []
+    used = set()
+    for photo_id, title, image, _ in photos:
+        stem = get_safe_filename(os.path.splitext(title)[0], f"photo_{photo_id}")
+        extension = os.path.splitext(image)[1].lower()
+        name = f"{stem}{extension}"
+        number = 1
+        while name.lower() in used:
+            number += 1
+            name = f"{stem} ({number}){extension}"
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def iter_zip(files: Iterable[tuple]) -> Iterator[bytes]:
+    """Отдаёт ZIP-архив частями по мере чтения файлов.
+
+    files - (имя в архиве, имя файла в хранилище, дата и время изменения).
+    Файлы сохраняются без сжатия (JPEG и WebP уже сжаты), в памяти
+    находится не больше одного блока READ_SIZE. Отсутствующие файлы
+    пропускаются: заголовки ответа к этому моменту уже отправлены.
+    """
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for name, path, modified_at in files:
+            try:
+                source = default_storage.open(path, "rb")
+            except OSError:
+                logger.warning("Файл %s не найден и пропущен в архиве", path)
+                continue
+            with source:
+                info = zipfile.ZipInfo(name, date_time=modified_at.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                # По размеру zipfile решает, нужен ли заголовок ZIP64
+                info.file_size = source.size
+                with archive.open(info, "w") as target:
+                    for chunk in source.chunks(READ_SIZE):
+                        target.write(chunk)
+                        if buffer.chunks:
+                            yield buffer.pop()
+            if buffer.chunks:
+                yield buffer.pop()
+    yield buffer.pop()
+
+
+def get_zip_response(photos: QuerySet, filename: str) -> StreamingHttpResponse:
+    # Порядок, заданный вызывающим кодом (например, порядок альбома
+    # лошади), сохраняется, иначе фотографии идут по дате добавления
+    if not photos.query.order_by:
+        photos = photos.order_by("created_at", "id")
+    photos = list(photos.values_list("id", "title", "image", "created_at"))
+    files = [
+        (name, image, timezone.localtime(max(created_at, MIN_ZIP_DATE)))
+        for name, (_, _, image, created_at) in zip(get_archive_names(photos), photos)
+    ]
+    response = StreamingHttpResponse(iter_zip(files), content_type="application/zip")
+    response["Content-Disposition"] = content_disposition_header(
+        True, f"{get_safe_filename(filename, 'photos')}.zip"
+    )
+    return response
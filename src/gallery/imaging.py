@@ -0,0 +1,165 @@
+import base64
+import io
+from datetime import datetime
+
+from PIL import ExifTags, Image, ImageOps
+
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+PLACEHOLDER_SIZE = 16
+
+
+def encode_image(image: Image.Image, image_format: str) -> bytes:
+    pil_format, options = VARIANT_FORMATS[image_format]
+    if pil_format == "JPEG" and image.mode == "RGBA":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(data: bytes, widths: list[int]) -> list[tuple]:
+    """Возвращает [(формат, ширина, высота, содержимое)] для каждой копии.
+
+    Копии больше оригинала не создаются; если оригинал меньше самой
+    маленькой ширины, создаётся одна копия в размере оригинала.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2 - 1/8).
+        # Квадратная рамка оставляет запас на поворот по EXIF
+        largest = max(widths)
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        widths = [width for width in widths if width < image.width] or [image.width]
+        result = []
+        for width in sorted(widths, reverse=True):
+            height = max(round(image.height * width / image.width), 1)
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+            for variant_format in VARIANT_FORMATS:
+                data = encode_image(image, variant_format)
+                result.append((variant_format, width, height, data))
+        return result
+
+
+def get_fit_size(size: tuple[int, int], width, height) -> tuple[int, int]:
+    # Вписывает изображение в рамку без увеличения
+    scale = min(
+        width / size[0] if width else 1,
+        height / size[1] if height else 1,
+        1,
+    )
+    return max(round(size[0] * scale), 1), max(round(size[1] * scale), 1)
+
+
+def render_image(source, width, height, image_format: str) -> bytes:
+    """Уменьшает изображение до рамки width x height (любая может быть None).
+
+    source - путь к файлу или содержимое файла.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        # Для JPEG с поворотом по EXIF ширина и высота меняются местами
+        box = max(width or 0, height or 0)
+        image.draft("RGB", (box, box))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        size = get_fit_size(image.size, width, height)
+        # reduce() уменьшает в целое число раз значительно быстрее resize()
+        factor = min(image.width // size[0], image.height // size[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.size != size:
+            image = image.resize(size, Image.Resampling.LANCZOS)
+
+        return encode_image(image, image_format)
+
+
+def get_dhash(source) -> int:
+    """Разностный хеш изображения (dHash), 64 бита.
+
+    У уменьшенных, пережатых и слегка обрезанных копий хеши отличаются
+    в нескольких битах. source - путь к файлу или содержимое файла.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        image.draft("L", (64, 64))
+        image = ImageOps.exif_transpose(image)
+        pixels = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = value << 1 | (left > pixels[row * 9 + column + 1])
+    return value
+
+
+def parse_exif_datetime(value, offset=None) -> datetime | None:
+    # Дата в EXIF хранится строкой "ГГГГ:ММ:ДД ЧЧ:ММ:СС", часовой пояс
+    # (если указан) - отдельным тегом вида "+03:00"
+    if not isinstance(value, str):
+        return None
+    value = value.strip("\x00 ")[:19]
+    date_format = "%Y:%m:%d %H:%M:%S"
+    offset = offset.strip("\x00 ") if isinstance(offset, str) else None
+    if offset:
+        value = f"{value} {offset}"
+        date_format += " %z"
+    try:
+        return datetime.strptime(value, date_format)
+    except ValueError:
+        return None
+
+
+def get_metadata(source) -> dict:
+    """Размеры с учётом поворота, ориентация и дата съёмки из EXIF,
+    а также заглушка для показа до загрузки изображения.
+
+    Заглушка - WebP размером не больше PLACEHOLDER_SIZE точек в виде
+    data URI (несколько сотен байт). source - путь к файлу или содержимое
+    файла. Дата съёмки без часового пояса возвращается без tzinfo.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        exif = image.getexif()
+        orientation = exif.get(ExifTags.Base.Orientation)
+        if orientation not in range(1, 9):
+            orientation = 1
+        exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+        taken_at = parse_exif_datetime(
+            exif_ifd.get(ExifTags.Base.DateTimeOriginal),
+            exif_ifd.get(ExifTags.Base.OffsetTimeOriginal),
+        ) or parse_exif_datetime(exif.get(ExifTags.Base.DateTime))
+
+        width, height = image.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+
+        image.draft("RGB", (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=30)
+
+    return {
+        "width": width,
+        "height": height,
+        "orientation": orientation,
+        "taken_at": taken_at,
+        "placeholder": "data:image/webp;base64,"
+        + base64.b64encode(buffer.getvalue()).decode(),
+    }
@@ -0,0 +1,260 @@
+import io
+import logging
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Value, When
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from .imaging import get_fit_size
+from .models import PhotoIngestCounter
+
+logger = logging.getLogger(__name__)
+
+# Принимаемые форматы и формат, в котором сохраняется пережатый оригинал
+INGEST_FORMATS = {
+    "JPEG": "JPEG",
+    "MPO": "JPEG",
+    "PNG": "PNG",
+    "WEBP": "WEBP",
+    "GIF": "PNG",
+}
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 90, "optimize": True},
+    "PNG": {},
+    "WEBP": {"quality": 90, "method": 4},
+}
+SAVE_MODES = {
+    "JPEG": ("RGB", "L", "CMYK"),
+    "PNG": ("RGB", "RGBA", "L", "LA", "P", "1"),
+    "WEBP": ("RGB", "RGBA"),
+}
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+# Из EXIF пережатого оригинала сохраняется только дата съёмки
+KEPT_EXIF_TAGS = (ExifTags.Base.DateTime,)
+KEPT_EXIF_IFD_TAGS = (
+    ExifTags.Base.DateTimeOriginal,
+    ExifTags.Base.OffsetTimeOriginal,
+)
+
+STATS_FIELDS = (
+    # Принято изображений, из них пережато
+    "images",
+    "rewritten",
+    # Оценка памяти (байт) на декодирование: оригиналов в полном размере,
+    # при приёме (с уменьшением JPEG при декодировании) и сохранённых файлов
+    "original_memory",
+    "ingest_memory",
+    "stored_memory",
+)
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def get_max_pixels() -> int:
+    return getattr(settings, "PHOTO_MAX_PIXELS", 50_000_000)
+
+
+def get_max_side() -> int:
+    return getattr(settings, "PHOTO_MAX_SIDE", 4096)
+
+
+def get_max_metadata_size() -> int:
+    return getattr(settings, "PHOTO_MAX_METADATA_SIZE", 64 * 1024)
+
+
+def get_memory_size(size: tuple[int, int], mode: str) -> int:
+    # Один байт на канал: точности достаточно для сравнения
+    return size[0] * size[1] * Image.getmodebands(mode)
+
+
+def get_metadata_size(image: Image.Image) -> int:
+    # EXIF (с миниатюрой и MakerNote), XMP, комментарии и т.п.
+    return sum(
+        len(value)
+        for key, value in image.info.items()
+        if key != "icc_profile" and isinstance(value, (bytes, str))
+    )
+
+
+def open_image(file) -> Image.Image:
+    """Открывает изображение, читая только заголовок.
+
+    JPEG больше PHOTO_MAX_SIDE настраивается на декодирование сразу
+    в уменьшенном в 2-8 раз масштабе (draft), после чего image.size -
+    размер при декодировании. Если при декодировании изображение займёт
+    больше PHOTO_MAX_PIXELS точек или формат не поддерживается,
+    вызывается InvalidImageError.
+    """
+    name = getattr(file, "name", None) or "Файл"
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as ex:
+        raise InvalidImageError(f"{name}: файл не является изображением") from ex
+    if image.format not in INGEST_FORMATS:
+        image.close()
+        raise InvalidImageError(f"{name}: формат {image.format} не поддерживается")
+
+    image.original_size = image.size
+    max_side = get_max_side()
+    size = get_fit_size(image.size, max_side, max_side)
+    if size != image.size:
+        image.draft(None, size)
+    if image.width * image.height > get_max_pixels():
+        image.close()
+        raise InvalidImageError(
+            f"{name}: слишком большое изображение, допустимо не более "
+            f"{get_max_pixels() // 1_000_000} Мп"
+        )
+    return image
+
+
+def validate_images(files: list) -> None:
+    """Проверяет формат и размеры изображений по заголовкам файлов."""
+    for file in files:
+        with open_image(file):
+            pass
+        file.seek(0)
+
+
+def get_kept_exif(image: Image.Image) -> bytes | None:
+    exif = image.getexif()
+    exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    kept = Image.Exif()
+    for tag in KEPT_EXIF_TAGS:
+        if tag in exif:
+            kept[tag] = exif[tag]
+    kept_ifd = {tag: exif_ifd[tag] for tag in KEPT_EXIF_IFD_TAGS if tag in exif_ifd}
+    if kept_ifd:
+        kept.get_ifd(ExifTags.IFD.Exif).update(kept_ifd)
+    # Пустой объект Exif при сохранении пропускается, поэтому передаются байты
+    return kept.tobytes() if kept or kept_ifd else None
+
+
+def rewrite_image(image: Image.Image, name: str) -> ContentFile:
+    save_format = INGEST_FORMATS[image.format]
+    options = dict(SAVE_OPTIONS[save_format])
+    exif = get_kept_exif(image)
+    if exif:
+        options["exif"] = exif
+    if image.info.get("icc_profile"):
+        options["icc_profile"] = image.info["icc_profile"]
+
+    max_side = get_max_side()
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    if image.mode not in SAVE_MODES[save_format]:
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        if image.mode not in SAVE_MODES[save_format]:
+            image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, save_format, **options)
+    file = ContentFile(
+        buffer.getvalue(),
+        name=os.path.splitext(name)[0] + EXTENSIONS[save_format],
+    )
+    file.image_size = image.size
+    file.image_mode = image.mode
+    return file
+
+
+def ingest_image(file, stats: Counter | None = None):
+    """Проверяет загруженное изображение и при необходимости пережимает его.
+
+    Оригинал больше PHOTO_MAX_SIDE по большей стороне или с метаданными
+    больше PHOTO_MAX_METADATA_SIZE уменьшается, поворачивается по EXIF,
+    из метаданных остаются цветовой профиль и дата съёмки. Остальные файлы
+    сохраняются без изменений. Возвращает file или новый файл с тем же
+    именем (расширение - по формату сохранения). Счётчики приёма
+    добавляются в stats, если он передан, иначе сохраняются после
+    фиксации транзакции.
+    """
+    with open_image(file) as image:
+        original_memory = get_memory_size(image.original_size, image.mode)
+        ingest_memory = get_memory_size(image.size, image.mode)
+        if (
+            max(image.original_size) <= get_max_side()
+            and get_metadata_size(image) <= get_max_metadata_size()
+        ):
+            result = file
+            stored_memory = original_memory
+        else:
+            result = rewrite_image(image, file.name)
+            stored_memory = get_memory_size(result.image_size, result.image_mode)
+    file.seek(0)
+
+    values = {
+        "images": 1,
+        "rewritten": int(result is not file),
+        "original_memory": original_memory,
+        "ingest_memory": ingest_memory if result is not file else 0,
+        "stored_memory": stored_memory,
+    }
+    if stats is None:
+        record_stats_on_commit(Counter(values))
+    else:
+        stats.update(values)
+    if result is not file:
+        logger.info(
+            "Изображение %s уменьшено при загрузке: %sx%s -> %sx%s, "
+            "память на декодирование %s -> %s байт",
+            file.name,
+            *image.original_size,
+            *result.image_size,
+            original_memory,
+            stored_memory,
+        )
+    return result
+
+
+def ingest_images(files: list) -> list:
+    # Счётчики сохраняются один раз для всех файлов запроса
+    stats = Counter()
+    result = [ingest_image(file, stats) for file in files]
+    record_stats_on_commit(stats)
+    return result
+
+
+def record_stats_on_commit(stats: Counter) -> None:
+    # Строки счётчиков общие для всех загрузок: обновление внутри транзакции
+    # загрузки блокировало бы их до её фиксации. Отменённые загрузки
+    # не учитываются, ошибка сохранения счётчиков не прерывает загрузку
+    transaction.on_commit(lambda: record_stats(**stats), robust=True)
+
+
+def record_stats(**values) -> None:
+    # Счётчики в базе (PhotoIngestCounter), чтобы подбирать PHOTO_MAX_SIDE
+    # и PHOTO_MAX_PIXELS по загрузкам всех процессов, включая runworker
+    values = {field: value for field, value in values.items() if value}
+    if not values:
+        return
+    PhotoIngestCounter.objects.bulk_create(
+        [PhotoIngestCounter(name=field) for field in values], ignore_conflicts=True
+    )
+    PhotoIngestCounter.objects.filter(name__in=values).update(
+        value=F("value")
+        + Case(
+            *[When(name=field, then=Value(value)) for field, value in values.items()],
+            output_field=BigIntegerField(),
+        )
+    )
+
+
+def get_stats() -> dict:
+    values = dict(
+        PhotoIngestCounter.objects.filter(name__in=STATS_FIELDS).values_list(
+            "name", "value"
+        )
+    )
+    return {field: values.get(field, 0) for field in STATS_FIELDS}
+
+
+def reset_stats() -> None:
+    PhotoIngestCounter.objects.filter(name__in=STATS_FIELDS).delete()
@@ -0,0 +1,74 @@
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.media_gc import MediaCollector
+
+
+class Command(BaseCommand):
+    help = (
+        "This command will delete media files that are not referenced by "
+        "photos, photo variants, avatars or unfinished uploads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать файлы без ссылок, ничего не удалять",
+        )
+        parser.add_argument(
+            "--quarantine",
+            action="store_true",
+            help="Переносить файлы в uploads/quarantine/ вместо удаления",
+        )
+        parser.add_argument(
+            "--min-age-hours",
+            type=int,
+            default=24,
+            help="Не трогать файлы, изменённые позже (по умолчанию 24 часа)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Проверить не больше указанного количества файлов",
+        )
+        parser.add_argument(
+            "--after",
+            default=None,
+            help="Продолжить обход после указанного файла (путь из вывода --limit)",
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, FileSystemStorage):
+            # Объекты S3 удаляются правилами жизненного цикла bucket
+            raise CommandError("Команда работает только с MEDIA_STORAGE=local")
+
+        def progress(name, size):
+            if options["verbosity"] > 1 or options["dry_run"]:
+                self.stdout.write(f"{name} ({size} байт)")
+
+        collector = MediaCollector(
+            min_age=options["min_age_hours"] * 60 * 60,
+            dry_run=options["dry_run"],
+            quarantine=options["quarantine"],
+            limit=options["limit"],
+            progress=progress,
+        )
+        try:
+            result = collector.collect(after=options["after"])
+        except Exception as ex:
+            raise CommandError(ex)
+
+        action = "Найдено" if options["dry_run"] else "Удалено"
+        if options["quarantine"] and not options["dry_run"]:
+            action = "Перенесено в карантин"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проверено файлов: {result['scanned']}, "
+                f"{action.lower()} без ссылок: {result['orphans']} "
+                f"({result['size'] / 1024 / 1024:.1f} МБ)"
+            )
+        )
+        if result["last"]:
+            self.stdout.write(f"Продолжить: --after {result['last']}")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.blobs import index_photos
+
+
+class Command(BaseCommand):
+    help = (
+        "This command will index photos by SHA-256 and merge files "
+        "with identical content"
+    )
+
+    def handle(self, *args, **options):
+        try:
+            result = index_photos()
+        except Exception as ex:
+            raise CommandError(ex)
+
+        if result["missing"]:
+            self.stderr.write(f"Не найдено файлов: {result['missing']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проиндексировано фотографий: {result['indexed']}, "
+                f"удалено копий: {result['removed']}, "
+                f"освобождено: {result['freed'] / 1024 / 1024:.1f} МБ"
+            )
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.models import Photo
+from gallery.tasks import extract_metadata
+
+
+class Command(BaseCommand):
+    help = (
+        "This command will queue extraction of dimensions, EXIF date and "
+        "placeholders for photos that do not have them yet"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Обработать все фотографии, а не только без метаданных",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Photo.objects.order_by("id")
+        if not options["all"]:
+            queryset = queryset.filter(width__isnull=True)
+
+        queued = 0
+        try:
+            ids = queryset.values_list("id", flat=True).iterator(chunk_size=1000)
+            batch = []
+            for photo_id in ids:
+                batch.append({"photo_id": photo_id})
+                if len(batch) >= 1000:
+                    queued += len(extract_metadata.enqueue_many(batch))
+                    batch = []
+            if batch:
+                queued += len(extract_metadata.enqueue_many(batch))
+        except Exception as ex:
+            raise CommandError(ex)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Поставлено в очередь фотографий: {queued} "
+                "(обрабатываются manage.py runworker)"
+            )
+        )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.similarity import compute_missing_hashes, find_similar_groups
+
+
+class Command(BaseCommand):
+    help = "This command will find groups of visually similar photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-d",
+            "--distance",
+            type=int,
+            default=6,
+            help="Максимальное расстояние Хэмминга между хешами (0-64)",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=None,
+            help="Количество процессов для подсчёта недостающих хешей",
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options["distance"] <= 64:
+            raise CommandError("Расстояние должно быть от 0 до 64")
+
+        def progress(photo, error):
+            if error is not None:
+                self.stderr.write(f"Фотография {photo.id}: {error}")
+
+        try:
+            compute_missing_hashes(workers=options["workers"], progress=progress)
+            groups = find_similar_groups(options["distance"])
+        except Exception as ex:
+            raise CommandError(ex)
+
+        for group in groups:
+            self.stdout.write(", ".join(str(photo_id) for photo_id in group))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Групп похожих фотографий: {len(groups)}, "
+                f"фотографий в них: {sum(len(group) for group in groups)}"
+            )
+        )
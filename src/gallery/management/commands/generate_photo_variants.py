@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.variants import backfill_variants
+
+
+class Command(BaseCommand):
+    help = "This command will generate resized WebP and JPEG copies of photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересоздать копии для всех фотографий, а не только для новых",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=None,
+            help="Количество процессов (по умолчанию PHOTO_VARIANT_WORKERS)",
+        )
+
+    def handle(self, *args, **options):
+        def progress(photo, error):
+            if error is not None:
+                self.stderr.write(f"Фотография {photo.id}: {error}")
+
+        try:
+            result = backfill_variants(
+                force=options["all"], workers=options["workers"], progress=progress
+            )
+        except Exception as ex:
+            raise CommandError(ex)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обработано фотографий: {result['processed']}, "
+                f"ошибок: {result['failed']}"
+            )
+        )
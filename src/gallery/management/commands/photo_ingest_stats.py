@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from gallery.ingest import get_stats, reset_stats
+
+
+def format_size(value: int) -> str:
+    return f"{value / 1024 / 1024:.1f} МБ"
+
+
+class Command(BaseCommand):
+    help = (
+        "This command will show how much decoding memory photo ingestion "
+        "saved since the counters were reset"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Обнулить счётчики после вывода"
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        saved = stats["original_memory"] - stats["stored_memory"]
+        self.stdout.write(
+            f"Принято изображений: {stats['images']}, "
+            f"уменьшено при загрузке: {stats['rewritten']}\n"
+            "Память на декодирование оригиналов: "
+            f"{format_size(stats['original_memory'])}\n"
+            "Память на декодирование при загрузке: "
+            f"{format_size(stats['ingest_memory'])}\n"
+            "Память на декодирование сохранённых файлов: "
+            f"{format_size(stats['stored_memory'])}"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Экономия при обработке файлов: {format_size(saved)}")
+        )
+        if options["reset"]:
+            reset_stats()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = (
+        "This command will recount photos per capture month for the gallery "
+        "timeline, e.g. after photos were added bypassing the API"
+    )
+
+    def handle(self, *args, **options):
+        try:
+            months = rebuild_timeline()
+        except Exception as ex:
+            raise CommandError(ex)
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано месяцев: {months}"))
@@ -0,0 +1,208 @@
+import os
+import time
+import uuid
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+
+from jobs.models import JOB_PENDING, JOB_RUNNING, Job
+from profile_management.models import NewUser
+
+from .models import Photo, PhotoBlob, PhotoUpload, PhotoVariant
+from .uploads import STAGING_DIR
+
+CHUNKS_DIR = "uploads/chunks"
+# Каталог не отдаётся через /media/ (service.views.MediaAPIView)
+QUARANTINE_DIR = "uploads/quarantine"
+
+
+def get_photo_references(names: list[str]) -> set[str]:
+    referenced = set()
+    for queryset, field in (
+        (Photo.objects, "image"),
+        (PhotoVariant.objects, "image"),
+        (PhotoBlob.objects, "name"),
+    ):
+        referenced.update(
+            queryset.filter(**{f"{field}__in": names}).values_list(field, flat=True)
+        )
+    return referenced
+
+
+def get_avatar_references(names: list[str]) -> set[str]:
+    return set(NewUser.objects.filter(photo__in=names).values_list("photo", flat=True))
+
+
+def get_chunk_references(names: list[str]) -> set[str]:
+    ids = {}
+    for name in names:
+        try:
+            ids[uuid.UUID(Path(name).stem)] = name
+        except ValueError:
+            continue
+    referenced = {
+        ids[upload_id]
+        for upload_id in PhotoUpload.objects.filter(id__in=ids).values_list(
+            "id", flat=True
+        )
+    }
+    # Фоновое завершение загрузки удаляет PhotoUpload до выполнения задачи,
+    # файлы частей остаются в её параметрах
+    return referenced | get_job_references(names)
+
+
+def get_job_references(names: list[str]) -> set[str]:
+    # Временные файлы нужны, пока задача загрузки не выполнена
+    # (при ошибке задача повторяется с теми же файлами)
+    names = set(names)
+    referenced = set()
+    payloads = Job.objects.filter(
+        Q(status=JOB_PENDING) | Q(status=JOB_RUNNING)
+    ).values_list("payload", flat=True)
+    for payload in payloads.iterator(chunk_size=1000):
+        for item in (payload or {}).get("files") or []:
+            if isinstance(item, dict) and item.get("path") in names:
+                referenced.add(item["path"])
+    return referenced
+
+
+# Каталог хранилища и функция, которая возвращает используемые имена из списка
+MEDIA_REFERENCES = {
+    "photos": get_photo_references,
+    "profile_pictures": get_avatar_references,
+    STAGING_DIR: get_job_references,
+    CHUNKS_DIR: get_chunk_references,
+}
+
+
+def walk(root: Path, directory: Path, after: tuple = ()) -> Iterator[os.DirEntry]:
+    """Обходит каталог в порядке имён, не загружая список всех файлов.
+
+    В памяти находятся отсортированные списки каталогов текущего пути,
+    поэтому память пропорциональна размеру самого большого каталога
+    (для плоского каталога photos/ - количеству фотографий). Файлы с путём
+    (относительно root) не больше after пропускаются вместе с целыми
+    каталогами, поэтому обход можно продолжить с места остановки.
+    """
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        parts = Path(entry.path).relative_to(root).parts
+        if entry.is_dir(follow_symlinks=False):
+            if parts < after[: len(parts)]:
+                continue
+            yield from walk(root, Path(entry.path), after)
+            yield entry
+        elif entry.is_file(follow_symlinks=False) and parts > after:
+            yield entry
+
+
+class MediaCollector:
+    """Поиск и удаление файлов хранилища, на которые нет ссылок в БД.
+
+    Файлы проверяются пачками по batch_size запросами name IN (...), поэтому
+    на проверку ссылок память не зависит от количества файлов (об обходе
+    каталогов см. walk). Файлы моложе min_age секунд
+    не трогаются: их могли записать до фиксации транзакции, которая
+    создаёт ссылку. При quarantine файлы переносятся в QUARANTINE_DIR,
+    а не удаляются; при dry_run только подсчитываются.
+    """
+
+    batch_size = 1000
+
+    def __init__(
+        self,
+        min_age: int = 24 * 60 * 60,
+        dry_run: bool = False,
+        quarantine: bool = False,
+        limit: int | None = None,
+        progress=None,
+    ):
+        self.root = Path(settings.MEDIA_ROOT).resolve()
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.quarantine_dir = None
+        if quarantine:
+            self.quarantine_dir = (
+                self.root / QUARANTINE_DIR / datetime.now().strftime("%Y%m%d%H%M%S")
+            )
+        self.limit = limit
+        self.progress = progress
+        self.result = {"scanned": 0, "orphans": 0, "size": 0, "last": None}
+
+    def collect(self, after: str | None = None) -> dict:
+        """Проверяет каталоги MEDIA_REFERENCES, начиная после файла after.
+
+        Если обход остановлен по limit, в result["last"] возвращается путь
+        последнего проверенного файла для следующего запуска.
+        """
+        after = tuple(Path(after).parts) if after else ()
+        # Каталоги обходятся в порядке путей, как и файлы внутри них
+        references = sorted(
+            MEDIA_REFERENCES.items(), key=lambda item: Path(item[0]).parts
+        )
+        for prefix, get_references in references:
+            directory = self.root / prefix
+            prefix_parts = Path(prefix).parts
+            if not directory.is_dir() or after[: len(prefix_parts)] > prefix_parts:
+                continue
+            if not self.collect_directory(directory, get_references, after):
+                break
+        return self.result
+
+    def collect_directory(self, directory: Path, get_references, after) -> bool:
+        batch = []
+        threshold = time.time() - self.min_age
+        for entry in walk(self.root, directory, after):
+            if entry.is_dir(follow_symlinks=False):
+                # Пустые каталоги (в основном от временных файлов загрузок)
+                if not self.dry_run and entry.stat().st_mtime < threshold:
+                    try:
+                        os.rmdir(entry.path)
+                    except OSError:
+                        pass
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime >= threshold:
+                continue
+            name = Path(entry.path).relative_to(self.root).as_posix()
+            batch.append((name, stat.st_size))
+            if len(batch) >= self.batch_size:
+                self.process(batch, get_references)
+                batch = []
+            if self.limit and self.result["scanned"] + len(batch) >= self.limit:
+                self.process(batch, get_references)
+                self.result["last"] = name
+                return False
+        self.process(batch, get_references)
+        return True
+
+    def process(self, batch: list[tuple], get_references) -> None:
+        if not batch:
+            return
+        referenced = get_references([name for name, _ in batch])
+        self.result["scanned"] += len(batch)
+        for name, size in batch:
+            if name in referenced:
+                continue
+            self.result["orphans"] += 1
+            self.result["size"] += size
+            if not self.dry_run:
+                self.remove(name)
+            if self.progress is not None:
+                self.progress(name, size)
+
+    def remove(self, name: str) -> None:
+        path = self.root / name
+        try:
+            if self.quarantine_dir is None:
+                path.unlink()
+            else:
+                target = self.quarantine_dir / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(path, target)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhotoVariant",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "image",
+                    models.ImageField(
+                        max_length=255, upload_to="photos/", verbose_name="Изображение"
+                    ),
+                ),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[("webp", "WebP"), ("jpeg", "JPEG")],
+                        max_length=4,
+                        verbose_name="Формат",
+                    ),
+                ),
+                ("width", models.PositiveIntegerField(verbose_name="Ширина")),
+                ("height", models.PositiveIntegerField(verbose_name="Высота")),
+                (
+                    "photo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="variants",
+                        to="gallery.photo",
+                        verbose_name="Фотография",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Копия изображения",
+                "verbose_name_plural": "Копии изображений",
+                "ordering": ["format", "width"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("photo", "format", "width"),
+                        name="gallery_photovariant_unique_size",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0004_photoblob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="phash",
+            field=models.BigIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Перцептивный хеш"
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0005_photo_phash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Высота"
+            ),
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="orientation",
+            field=models.PositiveSmallIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Ориентация EXIF"
+            ),
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="placeholder",
+            field=models.TextField(
+                blank=True, editable=False, null=True, verbose_name="Заглушка"
+            ),
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="taken_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Дата и время съёмки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Ширина"
+            ),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0006_photo_metadata"),
+    ]
+
+    operations = [
+        # Таблица gallery_photo_category уже создана для Photo.category,
+        # меняется только описание модели
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="PhotoCategoryLink",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "photo",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="gallery.photo",
+                            ),
+                        ),
+                        (
+                            "photocategory",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="gallery.photocategory",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "Категория изображения",
+                        "verbose_name_plural": "Категории изображения",
+                        "db_table": "gallery_photo_category",
+                        "unique_together": {("photo", "photocategory")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="photo",
+                    name="category",
+                    field=models.ManyToManyField(
+                        related_name="photos",
+                        through="gallery.PhotoCategoryLink",
+                        to="gallery.photocategory",
+                        verbose_name="Категория",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="gallery_photo_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="photocategorylink",
+            index=models.Index(
+                fields=["photocategory", "photo"], name="gallery_photo_category_idx"
+            ),
+        ),
+    ]
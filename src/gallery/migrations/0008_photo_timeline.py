@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:10
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+
+def fill_timeline(apps, schema_editor):
+    Photo = apps.get_model("gallery", "Photo")
+    PhotoTimeline = apps.get_model("gallery", "PhotoTimeline")
+    Photo.objects.update(captured_at=Coalesce("taken_at", "created_at"))
+    periods = (
+        Photo.objects.order_by()
+        .values(year=ExtractYear("captured_at"), month=ExtractMonth("captured_at"))
+        .annotate(count=Count("id"))
+    )
+    PhotoTimeline.objects.bulk_create(PhotoTimeline(**period) for period in periods)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0007_photo_list_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhotoTimeline",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField(verbose_name="Год")),
+                ("month", models.PositiveSmallIntegerField(verbose_name="Месяц")),
+                (
+                    "count",
+                    models.IntegerField(
+                        default=0, verbose_name="Количество фотографий"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Месяц ленты",
+                "verbose_name_plural": "Лента фотографий",
+                "ordering": ["-year", "-month"],
+            },
+        ),
+        migrations.AddField(
+            model_name="photo",
+            name="captured_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="Дата для ленты",
+            ),
+        ),
+        migrations.RunPython(fill_timeline, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="photo",
+            index=models.Index(
+                fields=["-captured_at", "-id"], name="gallery_photo_captured_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="phototimeline",
+            constraint=models.UniqueConstraint(
+                fields=("year", "month"), name="gallery_phototimeline_unique_month"
+            ),
+        ),
+    ]
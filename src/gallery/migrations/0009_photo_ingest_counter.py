@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0008_photo_timeline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhotoIngestCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="Счётчик"
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0, verbose_name="Значение")),
+            ],
+            options={
+                "verbose_name": "Счётчик приёма изображений",
+                "verbose_name_plural": "Счётчики приёма изображений",
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0009_photo_ingest_counter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photo",
+            name="phash_updated_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Хеш изменён"
+            ),
+        ),
+    ]
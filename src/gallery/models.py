@@ -1,8 +1,10 @@
+import uuid
 from typing import Optional, Union
 
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import UploadedFile
 from django.core.validators import MaxLengthValidator
 from django.db import models
+from django.utils import timezone
 from rest_framework.request import Request
 
 
@@ -25,7 +27,10 @@ class Photo(models.Model):
         verbose_name="Фотография", upload_to="photos/", null=False, blank=False
     )
     category: models.ManyToManyField = models.ManyToManyField(
-        to="gallery.PhotoCategory", verbose_name="Категория", related_name="photos"
+        to="gallery.PhotoCategory",
+        verbose_name="Категория",
+        related_name="photos",
+        through="gallery.PhotoCategoryLink",
     )
     created_at: models.DateTimeField = models.DateTimeField(
         verbose_name="Дата и время добавления фотографии", auto_now_add=True, null=False
@@ -38,36 +43,143 @@ class Photo(models.Model):
         related_name="gallery_created",
         on_delete=models.SET_NULL,
     )
+    phash: models.BigIntegerField = models.BigIntegerField(
+        verbose_name="Перцептивный хеш", null=True, blank=True, editable=False
+    )
+    # По нему процессы узнают о пересчитанных хешах (gallery.similarity)
+    phash_updated_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Хеш изменён", null=True, blank=True, editable=False
+    )
+    # Заполняются фоновой задачей после загрузки (gallery.tasks)
+    width: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Ширина", null=True, blank=True, editable=False
+    )
+    height: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Высота", null=True, blank=True, editable=False
+    )
+    orientation: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        verbose_name="Ориентация EXIF", null=True, blank=True, editable=False
+    )
+    taken_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата и время съёмки", null=True, blank=True, editable=False
+    )
+    placeholder: models.TextField = models.TextField(
+        verbose_name="Заглушка", null=True, blank=True, editable=False
+    )
+    # Дата съёмки, а без EXIF - добавления: по ней строится лента (gallery.timeline)
+    captured_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата для ленты", default=timezone.now, editable=False
+    )
 
     class Meta:
         verbose_name = "Изображение"
         verbose_name_plural = "Изображения"
         ordering = ["-created_at"]
+        indexes = [
+            # Постраничный вывод галереи (service.pagination.KeysetPagination)
+            models.Index(
+                fields=["-created_at", "-id"], name="gallery_photo_created_idx"
+            ),
+            models.Index(
+                fields=["-captured_at", "-id"], name="gallery_photo_captured_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Изображение {self.title}"
 
     def set_categories(self, categories: list[str], replace=False):
+        # Снимаются только связи: сами категории используются
+        # другими фотографиями
         if categories[0] == "none":
-            self.category.all().delete()
+            self.category.clear()
             self.save()
             return self
-        new_categories = []
+        category_ids = self.get_category_ids(categories)
+        if replace:
+            self.category.clear()
+        self.category.add(*category_ids)
+        self.save()
+        return self
+
+    @staticmethod
+    def get_category_ids(categories: list[Union[str | int]]) -> list[int]:
+        ids = []
+        names = []
         for category in categories:
             try:
-                category_id = int(category)
-                new_categories.append(PhotoCategory.objects.get(id=category_id))
+                ids.append(int(category))
             except ValueError:
-                new_categories.append(
-                    PhotoCategory.objects.get_or_create(name=category)[0]
+                names.append(category)
+
+        result = []
+        if ids:
+            result.extend(
+                PhotoCategory.objects.filter(id__in=ids).values_list("id", flat=True)
+            )
+        if names:
+            existing = dict(
+                PhotoCategory.objects.filter(name__in=names).values_list("name", "id")
+            )
+            created = PhotoCategory.objects.bulk_create(
+                [
+                    PhotoCategory(name=name)
+                    for name in dict.fromkeys(names)
+                    if name not in existing
+                ]
+            )
+            result.extend(existing.values())
+            result.extend(category.id for category in created)
+        return result
+
+    @staticmethod
+    def create_photos(
+        files: list,
+        description: Optional[str] = None,
+        categories: Optional[list[Union[str | int]]] = None,
+        created_by_id: Optional[int] = None,
+        uploaded: Optional[list["Photo"]] = None,
+    ) -> list["Photo"]:
+        # Фотографии добавляются одним запросом вместе с категориями.
+        # Слишком большие оригиналы уменьшаются (gallery.ingest), файл
+        # с уже известным содержимым не записывается повторно.
+        # В uploaded передаются фотографии с новыми файлами, чтобы
+        # вызывающий код мог удалить их при откате транзакции
+        from .blobs import store_files
+        from .ingest import ingest_images
+
+        files = ingest_images(files)
+        names, written = store_files(files)
+        created = Photo.objects.bulk_create(
+            [
+                Photo(
+                    title=file.name,
+                    description=description,
+                    image=name,
+                    created_by_id=created_by_id,
                 )
-            except PhotoCategory.DoesNotExist:
-                continue
-        if replace:
-            self.category.all().delete()
-        self.category.add(*[cat.id for cat in new_categories])
-        self.save()
-        return self
+                for file, name in zip(files, names)
+            ]
+        )
+        if uploaded is not None:
+            uploaded.extend(photo for photo in created if photo.image.name in written)
+        if created:
+            from .timeline import add_photos
+            from .variants import schedule_variants
+
+            add_photos(created)
+            schedule_variants(created)
+        if created and categories:
+            category_ids = Photo.get_category_ids(categories)
+            through = Photo.category.through
+            through.objects.bulk_create(
+                [
+                    through(photo_id=photo.id, photocategory_id=category_id)
+                    for photo in created
+                    for category_id in category_ids
+                ]
+            )
+        return created
 
     @staticmethod
     def get_photos(
@@ -75,29 +187,194 @@ class Photo(models.Model):
         description: Optional[str] = None,
         categories: Optional[list[Union[str | int]]] = None,
         key: str = "photos[]",
+        uploaded: Optional[list["Photo"]] = None,
     ):
         photos = request.data.getlist(key)
-        result = []
-        for photo in photos:
-            if isinstance(photo, InMemoryUploadedFile):
-                ph = Photo.objects.create(
-                    title=photo,
-                    description=description,
-                    image=photo,
-                    created_by=request.user,
-                )
-                if categories:
-                    ph.set_categories(categories)
-                result.append(ph.id)
+        created = Photo.create_photos(
+            [photo for photo in photos if isinstance(photo, UploadedFile)],
+            description=description,
+            categories=categories,
+            created_by_id=request.user.id,
+            uploaded=uploaded,
+        )
+
+        return [photo.id for photo in created] + Photo.get_existing_ids(photos)
+
+    @staticmethod
+    def get_existing_ids(photos: list) -> list[int]:
+        # Кроме файлов в списке могут передаваться id уже загруженных фотографий
         photos = [
             photo
             for photo in photos
             if isinstance(photo, str) or isinstance(photo, int)
         ]
-        result.extend(
-            list(Photo.objects.filter(id__in=photos).values_list("id", flat=True))
-        )
-        return result
+        if not photos:
+            return []
+        return list(Photo.objects.filter(id__in=photos).values_list("id", flat=True))
+
+
+PHOTO_VARIANT_FORMAT_CHOICES = [
+    ("webp", "WebP"),
+    ("jpeg", "JPEG"),
+]
+
+
+class PhotoVariant(models.Model):
+    photo: models.ForeignKey = models.ForeignKey(
+        to="gallery.Photo",
+        verbose_name="Фотография",
+        related_name="variants",
+        on_delete=models.CASCADE,
+    )
+    image: models.ImageField = models.ImageField(
+        verbose_name="Изображение", upload_to="photos/", max_length=255
+    )
+    format: models.CharField = models.CharField(
+        verbose_name="Формат", max_length=4, choices=PHOTO_VARIANT_FORMAT_CHOICES
+    )
+    width: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Ширина"
+    )
+    height: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Высота"
+    )
+
+    class Meta:
+        verbose_name = "Копия изображения"
+        verbose_name_plural = "Копии изображений"
+        ordering = ["format", "width"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["photo", "format", "width"],
+                name="gallery_photovariant_unique_size",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.photo_id} {self.width}w {self.format}"
+
+
+class PhotoTimeline(models.Model):
+    """Количество фотографий за месяц по captured_at (в TIME_ZONE).
+
+    Счётчики меняются вместе с фотографиями (gallery.timeline), поэтому
+    лента не считается GROUP BY по всей таблице при каждом запросе.
+    """
+
+    year: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        verbose_name="Год"
+    )
+    month: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        verbose_name="Месяц"
+    )
+    count: models.IntegerField = models.IntegerField(
+        verbose_name="Количество фотографий", default=0
+    )
+
+    class Meta:
+        verbose_name = "Месяц ленты"
+        verbose_name_plural = "Лента фотографий"
+        ordering = ["-year", "-month"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["year", "month"], name="gallery_phototimeline_unique_month"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.month:02}.{self.year}: {self.count}"
+
+
+class PhotoBlob(models.Model):
+    """Файл фотографии в хранилище, общий для фотографий с одинаковым
+    содержимым. Файл удаляется, когда на него не остаётся ссылок."""
+
+    sha256: models.CharField = models.CharField(
+        verbose_name="SHA-256", max_length=64, unique=True
+    )
+    name: models.CharField = models.CharField(
+        verbose_name="Путь к файлу", max_length=255, unique=True
+    )
+    size: models.PositiveBigIntegerField = models.PositiveBigIntegerField(
+        verbose_name="Размер файла"
+    )
+    ref_count: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Количество ссылок", default=0
+    )
+    created_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата и время добавления", auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = "Файл изображения"
+        verbose_name_plural = "Файлы изображений"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class PhotoUpload(models.Model):
+    id: models.UUIDField = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False
+    )
+    filename: models.CharField = models.CharField(
+        verbose_name="Имя файла", max_length=255, null=False, blank=False
+    )
+    size: models.PositiveBigIntegerField = models.PositiveBigIntegerField(
+        verbose_name="Размер файла"
+    )
+    offset: models.PositiveBigIntegerField = models.PositiveBigIntegerField(
+        verbose_name="Получено байт", default=0
+    )
+    created_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата и время начала загрузки", auto_now_add=True
+    )
+    created_by: models.ForeignKey = models.ForeignKey(
+        to="profile_management.NewUser",
+        verbose_name="Создатель",
+        related_name="photo_uploads",
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        verbose_name = "Загрузка изображения"
+        verbose_name_plural = "Загрузки изображений"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Загрузка {self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def path(self) -> str:
+        return f"uploads/chunks/{self.id}.part"
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.size
+
+
+class PhotoCategoryLink(models.Model):
+    """Связь фотографии с категорией (таблица, ранее созданная Django
+    для Photo.category, с индексом для отбора фотографий категории)."""
+
+    photo: models.ForeignKey = models.ForeignKey(
+        to="gallery.Photo", on_delete=models.CASCADE
+    )
+    photocategory: models.ForeignKey = models.ForeignKey(
+        to="gallery.PhotoCategory", on_delete=models.CASCADE
+    )
+
+    class Meta:
+        db_table = "gallery_photo_category"
+        verbose_name = "Категория изображения"
+        verbose_name_plural = "Категории изображения"
+        unique_together = [("photo", "photocategory")]
+        indexes = [
+            models.Index(
+                fields=["photocategory", "photo"],
+                name="gallery_photo_category_idx",
+            ),
+        ]
 
 
 class PhotoCategory(models.Model):
@@ -116,3 +393,22 @@ class PhotoCategory(models.Model):
 
     def __str__(self):
         return f"Категория {self.name}"
+
+
+class PhotoIngestCounter(models.Model):
+    """Счётчик приёма изображений (gallery.ingest.STATS_FIELDS).
+
+    Хранится в базе, чтобы manage.py photo_ingest_stats показывал данные
+    загрузок из всех процессов, включая runworker.
+    """
+
+    name: models.CharField = models.CharField(
+        verbose_name="Счётчик", max_length=50, unique=True
+    )
+    value: models.BigIntegerField = models.BigIntegerField(
+        verbose_name="Значение", default=0
+    )
+
+    class Meta:
+        verbose_name = "Счётчик приёма изображений"
+        verbose_name_plural = "Счётчики приёма изображений"
@@ -1,6 +1,7 @@
 from rest_framework import permissions
 
 from profile_management.models import NewUser
+from profile_management.permissions import user_has_perm
 
 
 class GalleryPermission(permissions.BasePermission):
@@ -13,4 +14,4 @@ class GalleryPermission(permissions.BasePermission):
 
 
 def get_has_gallery_moderate_permission(user: NewUser):
-    return bool(user.has_perm("gallery.change_photo"))
+    return user_has_perm(user, "gallery.change_photo")
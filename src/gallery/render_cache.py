@@ -0,0 +1,222 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+from .imaging import render_image
+from .models import Photo
+from .variants import get_executor
+
+try:
+    import fcntl
+except ImportError:  # Windows: запросы объединяются только внутри процесса
+    fcntl = None
+
+
+class RenderCache:
+    """Дисковый кэш изображений, уменьшенных по запросу.
+
+    Время последнего обращения хранится в mtime файла. Размер кэша общий
+    для всех процессов: он хранится в файле size и изменяется под
+    блокировкой cache.lock. Когда размер превышает max_size, удаляются
+    давно не запрашивавшиеся файлы, пока размер не станет меньше 90%
+    от max_size.
+    """
+
+    def __init__(self, directory, max_size: int):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.size_path = self.directory / "size"
+        self.lock_path = self.directory / "cache.lock"
+        self.lock = threading.Lock()
+        self.size_lock = threading.Lock()
+        self.pending: dict[str, Future] = {}
+
+    def get_key(self, photo: Photo, width, height, image_format: str) -> str:
+        source = f"{photo.id}:{photo.image.name}:{width}:{height}:{image_format}"
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def get_path(self, key: str, image_format: str) -> Path:
+        return self.directory / key[:2] / f"{key}.{image_format}"
+
+    def get(self, photo: Photo, width, height, image_format: str) -> tuple:
+        """Возвращает (путь к файлу, ключ), при необходимости создаёт файл.
+
+        Одновременные запросы одного размера ждут результата первого из них:
+        внутри процесса через Future, между процессами через блокировку файла.
+        """
+        key = self.get_key(photo, width, height, image_format)
+        path = self.get_path(key, image_format)
+        if self.touch(path):
+            return path, key
+
+        with self.lock:
+            future = self.pending.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self.pending[key] = Future()
+
+        if not is_owner:
+            future.result()
+            return path, key
+
+        try:
+            with self.file_lock(path.with_suffix(".lock")):
+                if not self.touch(path):
+                    self.write(path, self.render(photo, width, height, image_format))
+            future.set_result(path)
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        return path, key
+
+    @staticmethod
+    def touch(path: Path) -> bool:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def render(photo: Photo, width, height, image_format: str) -> bytes:
+        try:
+            source = photo.image.path
+        except NotImplementedError:
+            with photo.image.open("rb") as file:
+                source = file.read()
+        return (
+            get_executor()
+            .submit(render_image, source, width, height, image_format)
+            .result()
+        )
+
+    @contextmanager
+    def file_lock(self, lock_path: Path):
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        while True:
+            lock_file = open(lock_path, "ab")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Файл блокировки могли удалить при вытеснении, пока процесс
+            # ждал блокировку: тогда он открывается заново, чтобы все
+            # процессы блокировали один и тот же файл
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+        try:
+            yield
+        finally:
+            lock_file.close()
+
+    def write(self, path: Path, data: bytes) -> None:
+        # Файл появляется в кэше целиком благодаря os.replace
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        self.add_size(len(data))
+
+    def add_size(self, size: int) -> None:
+        with self.size_lock, self.file_lock(self.lock_path):
+            total = self.read_size()
+            if total is None:
+                # Размер ещё не сохранён или файл повреждён: сканирование
+                # учитывает и только что записанный файл
+                total = sum(entry[2] for entry in self.scan())
+            else:
+                total += size
+            if total > self.max_size:
+                total = self.evict()
+            self.size_path.write_text(str(total))
+
+    def read_size(self) -> int | None:
+        try:
+            return int(self.size_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def scan(self):
+        if not self.directory.exists():
+            return
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith((".lock", ".tmp")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def evict(self) -> int:
+        """Удаляет давно не запрашивавшиеся файлы, возвращает новый размер.
+
+        Вызывается под блокировкой cache.lock, поэтому кэш вытесняет
+        один процесс, а размер пересчитывается по всем файлам.
+        """
+        entries = sorted(self.scan(), key=lambda entry: entry[1])
+        size = sum(entry[2] for entry in entries)
+        target = self.max_size * 0.9
+        for path, _, file_size in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.remove_lock_file(Path(path).with_suffix(".lock"))
+            size -= file_size
+        return size
+
+    @staticmethod
+    def remove_lock_file(lock_path: Path) -> None:
+        # Файл блокировки удаляется, только если его никто не держит:
+        # процессы, открывшие его раньше, откроют новый (file_lock)
+        if fcntl is None:
+            return
+        try:
+            lock_file = open(lock_path, "rb")
+        except FileNotFoundError:
+            return
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+_render_cache = None
+
+
+def get_render_cache() -> RenderCache:
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache(
+            getattr(
+                settings,
+                "PHOTO_RENDER_CACHE_DIR",
+                os.path.join(settings.BASE_DIR, "render_cache"),
+            ),
+            getattr(settings, "PHOTO_RENDER_CACHE_SIZE", 512 * 1024 * 1024),
+        )
+    return _render_cache
@@ -1,8 +1,30 @@
+from django.conf import settings
 from rest_framework import serializers
 
 from profile_management.serializers import UserNameOnlySerializer
 
-from .models import Photo, PhotoCategory
+from .batch import BATCH_ACTIONS
+from .models import Photo, PhotoCategory, PhotoUpload
+from .uploads import get_upload_url
+
+
+class PhotoSrcsetField(serializers.Field):
+    """Копии фотографии в виде {"webp": "url 320w, url 640w", "jpeg": ...}."""
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, photo: Photo):
+        request = self.context.get("request")
+        srcset = {}
+        for variant in photo.variants.all():
+            url = variant.image.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            srcset.setdefault(variant.format, []).append(f"{url} {variant.width}w")
+        return {key: ", ".join(value) for key, value in srcset.items()}
 
 
 class PhotoCategorySerializer(serializers.ModelSerializer):
@@ -14,6 +36,7 @@ class PhotoCategorySerializer(serializers.ModelSerializer):
 class PhotoListAdminSerializer(serializers.ModelSerializer):
     created_by = UserNameOnlySerializer()
     category = PhotoCategorySerializer(many=True)
+    srcset = PhotoSrcsetField()
 
     class Meta:
         model = Photo
@@ -21,6 +44,12 @@ class PhotoListAdminSerializer(serializers.ModelSerializer):
             "title",
             "description",
             "image",
+            "srcset",
+            "width",
+            "height",
+            "orientation",
+            "taken_at",
+            "placeholder",
             "category",
             "created_at",
             "created_by",
@@ -29,13 +58,90 @@ class PhotoListAdminSerializer(serializers.ModelSerializer):
 
 class PhotoListSerializer(serializers.ModelSerializer):
     category = PhotoCategorySerializer(many=True)
+    srcset = PhotoSrcsetField()
 
     class Meta:
         model = Photo
-        fields = ["title", "description", "image", "category"]
+        fields = [
+            "title",
+            "description",
+            "image",
+            "srcset",
+            "width",
+            "height",
+            "orientation",
+            "taken_at",
+            "placeholder",
+            "category",
+        ]
 
 
 class PhotoMainInfoSerializer(serializers.ModelSerializer):
+    srcset = PhotoSrcsetField()
+
     class Meta:
         model = Photo
-        fields = ["id", "image"]
+        fields = ["id", "image", "srcset", "width", "height", "placeholder"]
+
+
+class PhotoUploadSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+    upload_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PhotoUpload
+        fields = ["id", "filename", "size", "offset", "chunk_size", "upload_url"]
+        read_only_fields = ["id", "offset"]
+
+    @staticmethod
+    def get_chunk_size(obj):
+        return settings.PHOTO_UPLOAD_CHUNK_SIZE
+
+    @staticmethod
+    def get_upload_url(obj) -> str | None:
+        # Файл целиком передаётся PUT на upload_url, если он не пустой
+        if obj.is_complete:
+            return None
+        return get_upload_url(obj)
+
+    def validate_size(self, value):
+        if not 1 <= value <= settings.PHOTO_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Размер файла должен быть от 1 до {settings.PHOTO_UPLOAD_MAX_SIZE} байт"
+            )
+        return value
+
+
+class PhotoUploadFinalizeSerializer(serializers.Serializer):
+    uploads = serializers.ListField(
+        child=serializers.UUIDField(), min_length=1, max_length=100
+    )
+    description = serializers.CharField(
+        required=False, allow_null=True, allow_blank=True, max_length=500
+    )
+    category = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False
+    )
+
+
+class PhotoBatchSerializer(serializers.Serializer):
+    action = serializers.CharField()
+    photos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=1000
+    )
+    # set_categories: категории (id или названия), replace=false - только добавить
+    category = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False
+    )
+    replace = serializers.BooleanField(required=False, default=True)
+    # attach, detach: id лошадей
+    horses = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, max_length=100
+    )
+
+    def validate_action(self, value):
+        if value not in BATCH_ACTIONS:
+            raise serializers.ValidationError(
+                f"Допустимые действия: {', '.join(BATCH_ACTIONS)}"
+            )
+        return value
@@ -0,0 +1,16 @@
+from contextvars import ContextVar
+
+from django.dispatch import Signal
+
+# Удаление фотографий пачкой (gallery.batch.delete_photos): получатели
+# обрабатывают все фотографии сразу, а обработчики pre_delete/post_delete
+# отдельных фотографий в это время ничего не делают (is_batch_delete).
+# photos - список удаляемых Photo с полями id, image и captured_at
+pre_photos_delete = Signal()
+post_photos_delete = Signal()
+
+batch_delete = ContextVar("gallery_batch_delete", default=False)
+
+
+def is_batch_delete() -> bool:
+    return batch_delete.get()
@@ -0,0 +1,220 @@
+import functools
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .imaging import get_dhash
+from .models import Photo
+
+
+def to_signed(value: int) -> int:
+    # Хеш хранится в BigIntegerField со знаком
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+
+class MultiIndexHash:
+    """Индекс 64-битных хешей для поиска по расстоянию Хэмминга.
+
+    Хеш делится на четыре части по 16 бит, для каждой части ведётся
+    отдельная таблица. Если хеши отличаются не больше чем в r битах, то
+    хотя бы одна часть отличается не больше чем в r // 4 битах, поэтому
+    проверяются только хеши из ячеек, соседних с частями искомого хеша,
+    а не все хеши индекса.
+    """
+
+    parts = 4
+    bits = 16
+
+    def __init__(self):
+        self.tables = [{} for _ in range(self.parts)]
+        self.hashes = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def split(self, value: int) -> list[int]:
+        mask = (1 << self.bits) - 1
+        return [(value >> (self.bits * part)) & mask for part in range(self.parts)]
+
+    def add(self, value: int, item) -> None:
+        self.hashes[item] = value
+        for table, key in zip(self.tables, self.split(value)):
+            table.setdefault(key, []).append(item)
+
+    @classmethod
+    @functools.cache
+    def get_masks(cls, radius: int) -> tuple[int, ...]:
+        # Все 16-битные маски, в которых установлено не больше radius бит
+        return tuple(
+            sum(1 << bit for bit in bits)
+            for count in range(radius + 1)
+            for bits in itertools.combinations(range(cls.bits), count)
+        )
+
+    def search(self, value: int, max_distance: int) -> list[tuple]:
+        """Возвращает [(расстояние, id)] по возрастанию расстояния."""
+        masks = self.get_masks(max_distance // self.parts)
+        candidates = set()
+        for table, key in zip(self.tables, self.split(value)):
+            for mask in masks:
+                items = table.get(key ^ mask)
+                if items:
+                    candidates.update(items)
+
+        result = []
+        for item in candidates:
+            distance = (self.hashes[item] ^ value).bit_count()
+            if distance <= max_distance:
+                result.append((distance, item))
+        result.sort()
+        return result
+
+
+class SimilarPhotoIndex:
+    """Индекс хешей всех фотографий в памяти процесса.
+
+    Хеши записывает runworker, поэтому актуальность индекса определяется
+    по базе: не чаще rebuild_interval секунд сравниваются количество,
+    максимальный id и время последнего изменения хеша фотографий с хешем,
+    и при изменении индекс перестраивается. Только что обработанные
+    и пересчитанные фотографии находятся с задержкой до rebuild_interval
+    секунд.
+    """
+
+    rebuild_interval = 30
+
+    def __init__(self):
+        self.index = None
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        # Другие процессы увидят изменения при следующей проверке версии
+        with self.lock:
+            self.checked_at = 0.0
+
+    @staticmethod
+    def get_version() -> tuple:
+        stats = Photo.objects.filter(phash__isnull=False).aggregate(
+            count=Count("id"), last_id=Max("id"), updated_at=Max("phash_updated_at")
+        )
+        return stats["count"], stats["last_id"], stats["updated_at"]
+
+    def get_index(self) -> MultiIndexHash:
+        with self.lock:
+            now = time.monotonic()
+            if self.index is None or now - self.checked_at > self.rebuild_interval:
+                self.checked_at = now
+                version = self.get_version()
+                if self.index is None or version != self.version:
+                    self.index = self.build()
+                    self.version = version
+            return self.index
+
+    @staticmethod
+    def build() -> MultiIndexHash:
+        index = MultiIndexHash()
+        hashes = (
+            Photo.objects.filter(phash__isnull=False)
+            .order_by()
+            .values_list("id", "phash")
+        )
+        for photo_id, phash in hashes.iterator(chunk_size=10000):
+            index.add(to_unsigned(phash), photo_id)
+        return index
+
+    def search(self, phash: int, max_distance: int) -> list[tuple]:
+        return self.get_index().search(to_unsigned(phash), max_distance)
+
+
+similar_index = SimilarPhotoIndex()
+
+
+def get_image_source(photo: Photo):
+    try:
+        return photo.image.path
+    except NotImplementedError:
+        with photo.image.open("rb") as file:
+            return file.read()
+
+
+def compute_missing_hashes(workers: int | None = None, progress=None) -> dict:
+    """Считает хеши фотографий, для которых их ещё нет, в пуле процессов."""
+    queryset = Photo.objects.filter(phash__isnull=True).order_by("id")
+    workers = workers or getattr(settings, "PHOTO_VARIANT_WORKERS", 2)
+    result = {"processed": 0, "failed": 0}
+    pending = {}
+    computed = []
+
+    def collect(return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            photo = pending.pop(future)
+            try:
+                photo.phash = to_signed(future.result())
+                photo.phash_updated_at = timezone.now()
+            except Exception as ex:
+                result["failed"] += 1
+                if progress is not None:
+                    progress(photo, ex)
+                continue
+            computed.append(photo)
+            result["processed"] += 1
+        if len(computed) >= 500 or return_when == ALL_COMPLETED:
+            Photo.objects.bulk_update(computed, ["phash", "phash_updated_at"])
+            computed.clear()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for photo in queryset.only("id", "image").iterator(chunk_size=500):
+            try:
+                source = get_image_source(photo)
+            except OSError as ex:
+                result["failed"] += 1
+                if progress is not None:
+                    progress(photo, ex)
+                continue
+            pending[executor.submit(get_dhash, source)] = photo
+            if len(pending) >= workers * 2:
+                collect(FIRST_COMPLETED)
+        collect(ALL_COMPLETED)
+
+    if result["processed"]:
+        similar_index.invalidate()
+    return result
+
+
+def find_similar_groups(max_distance: int) -> list[list[int]]:
+    """Разбивает фотографии на группы похожих (по первой фотографии группы)."""
+    index = SimilarPhotoIndex.build()
+    seen = set()
+    groups = []
+    for photo_id in sorted(index.hashes):
+        if photo_id in seen:
+            continue
+        group = [
+            item
+            for _, item in index.search(index.hashes[photo_id], max_distance)
+            if item not in seen
+        ]
+        if len(group) > 1:
+            groups.append(sorted(group))
+            seen.update(group)
+    return groups
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.queue import task
+
+from .imaging import get_dhash, get_metadata, render_variants
+from .models import Photo
+from .similarity import similar_index, to_signed
+from .timeline import set_captured_at
+from .uploads import create_staged_photos
+from .variants import get_variant_widths, read_photo, save_variants
+
+
+def save_metadata(photo: Photo, data: bytes) -> None:
+    # Размеры, заглушка и хеш сохраняются в Photo, чтобы списки
+    # фотографий отдавались без чтения файлов
+    metadata = get_metadata(data)
+    if metadata["taken_at"] is not None and timezone.is_naive(metadata["taken_at"]):
+        metadata["taken_at"] = timezone.make_aware(metadata["taken_at"])
+    with transaction.atomic():
+        Photo.objects.filter(id=photo.id).update(
+            phash=to_signed(get_dhash(data)),
+            phash_updated_at=timezone.now(),
+            **metadata,
+        )
+        set_captured_at(photo.id, metadata["taken_at"] or photo.created_at)
+    similar_index.invalidate()
+
+
+@task("gallery.generate_variants", max_attempts=3)
+def generate_variants(photo_id: int) -> int:
+    photo = Photo.objects.filter(id=photo_id).first()
+    if photo is None:
+        return 0
+    data = read_photo(photo)
+    rendered = render_variants(data, get_variant_widths())
+    save_metadata(photo, data)
+    return len(save_variants(photo, rendered))
+
+
+@task("gallery.extract_metadata", max_attempts=3)
+def extract_metadata(photo_id: int) -> bool:
+    photo = Photo.objects.filter(id=photo_id).first()
+    if photo is None:
+        return False
+    save_metadata(photo, read_photo(photo))
+    return True
+
+
+@task("gallery.process_upload", max_attempts=3)
+def process_upload(
+    files: list[dict],
+    description: str | None = None,
+    categories: list | None = None,
+    created_by_id: int | None = None,
+) -> dict:
+    uploaded = []
+    try:
+        with transaction.atomic():
+            photos = create_staged_photos(
+                files,
+                description=description,
+                categories=categories,
+                created_by_id=created_by_id,
+                uploaded=uploaded,
+            )
+    except Exception:
+        for photo in uploaded:
+            photo.image.delete(save=False)
+        raise
+    return {"photos": [photo.id for photo in photos]}
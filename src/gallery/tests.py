@@ -0,0 +1,952 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from unittest import mock, skipIf
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from jobs.models import JOB_DONE, JOB_FAILED, Job
+from jobs.queue import work
+from profile_management.models import NewUser
+
+from .blobs import index_photos
+from .imaging import get_dhash, get_metadata, render_variants
+from .ingest import (
+    InvalidImageError,
+    get_stats,
+    ingest_image,
+    ingest_images,
+    reset_stats,
+)
+from .media_gc import MediaCollector
+from .models import Photo, PhotoBlob, PhotoCategory, PhotoVariant
+from .render_cache import RenderCache, fcntl
+from .serializers import PhotoMainInfoSerializer
+from .similarity import MultiIndexHash, find_similar_groups, similar_index, to_signed
+from .tasks import process_upload
+from .timeline import rebuild_timeline, set_captured_at
+from .uploads import STAGING_DIR
+from .variants import backfill_variants
+
+
+def make_image(width, height, image_format="JPEG", orientation=None) -> bytes:
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    Image.new("RGB", (width, height), (120, 80, 40)).save(
+        buffer, image_format, exif=exif
+    )
+    return buffer.getvalue()
+
+
+class RenderVariantsTestCase(TestCase):
+    def test_widths_and_formats(self):
+        rendered = render_variants(make_image(1000, 500), [320, 640, 1280])
+        self.assertEqual(
+            sorted((fmt, width, height) for fmt, width, height, _ in rendered),
+            [
+                ("jpeg", 320, 160),
+                ("jpeg", 640, 320),
+                ("webp", 320, 160),
+                ("webp", 640, 320),
+            ],
+        )
+        for fmt, width, height, data in rendered:
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.format.lower(), fmt)
+                self.assertEqual(image.size, (width, height))
+
+    def test_small_image_keeps_original_size(self):
+        rendered = render_variants(make_image(200, 100, "PNG"), [320, 640])
+        self.assertEqual({item[1:3] for item in rendered}, {(200, 100)})
+
+    def test_exif_orientation(self):
+        rendered = render_variants(make_image(1000, 500, orientation=6), [320])
+        self.assertEqual({item[1:3] for item in rendered}, {(320, 640)})
+
+    def test_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif.get_ifd(0x8769)[0x9003] = "2024:05:17 14:30:05"
+        exif.get_ifd(0x8769)[0x9011] = "+03:00"
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 500), (120, 80, 40)).save(buffer, "JPEG", exif=exif)
+
+        metadata = get_metadata(buffer.getvalue())
+        self.assertEqual(
+            (metadata["width"], metadata["height"], metadata["orientation"]),
+            (500, 1000, 6),
+        )
+        self.assertEqual(metadata["taken_at"].isoformat(), "2024-05-17T14:30:05+03:00")
+        self.assertLess(len(metadata["placeholder"]), 1000)
+        with Image.open(
+            io.BytesIO(base64.b64decode(metadata["placeholder"].split(",")[1]))
+        ) as placeholder:
+            self.assertEqual(placeholder.size, (8, 16))
+
+        metadata = get_metadata(make_image(300, 200, "PNG"))
+        self.assertEqual((metadata["width"], metadata["height"]), (300, 200))
+        self.assertIsNone(metadata["taken_at"])
+
+
+class IngestTestCase(TestCase):
+    def setUp(self):
+        reset_stats()
+
+    @override_settings(PHOTO_MAX_SIDE=400)
+    def test_downscales_large_original(self):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = "x" * 100_000
+        exif.get_ifd(0x8769)[0x9003] = "2024:05:01 10:30:00"
+        Image.new("RGB", (1600, 1000), (120, 80, 40)).save(buffer, "PNG", exif=exif)
+        with self.captureOnCommitCallbacks(execute=True):
+            file = ingest_image(SimpleUploadedFile("horse.png", buffer.getvalue()))
+
+        with Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ("PNG", (250, 400)))
+        file.seek(0)
+        metadata = get_metadata(file.read())
+        self.assertEqual((metadata["orientation"], metadata["width"]), (1, 250))
+        self.assertEqual(metadata["taken_at"].isoformat(), "2024-05-01T10:30:00")
+        self.assertLess(file.size, 100_000)
+
+        stats = get_stats()
+        self.assertEqual((stats["images"], stats["rewritten"]), (1, 1))
+        self.assertEqual(stats["original_memory"], 1600 * 1000 * 3)
+        self.assertEqual(stats["stored_memory"], 250 * 400 * 3)
+
+    @override_settings(PHOTO_MAX_SIDE=400)
+    def test_jpeg_is_decoded_at_reduced_scale(self):
+        source = SimpleUploadedFile("horse.jpg", make_image(3200, 2000))
+        with self.captureOnCommitCallbacks(execute=True):
+            file = ingest_image(source)
+        with Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ("JPEG", (400, 250)))
+        # 3200x2000 декодируется сразу в масштабе 1/8
+        self.assertEqual(get_stats()["ingest_memory"], 400 * 250 * 3)
+
+    def test_small_file_is_kept(self):
+        source = SimpleUploadedFile("horse.jpg", make_image(400, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIs(ingest_image(source), source)
+        self.assertEqual(source.tell(), 0)
+        self.assertEqual(get_stats()["rewritten"], 0)
+
+        # Счётчики хранятся в базе и видны команде в отдельном процессе
+        output = io.StringIO()
+        call_command("photo_ingest_stats", "--reset", stdout=output)
+        self.assertIn(
+            "Принято изображений: 1, уменьшено при загрузке: 0", output.getvalue()
+        )
+        self.assertEqual(get_stats()["images"], 0)
+
+    def test_stats_are_recorded_after_commit(self):
+        files = [
+            SimpleUploadedFile(f"horse{index}.jpg", make_image(40, 30))
+            for index in range(2)
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            ingest_images(files)
+            # Строки счётчиков не изменяются до фиксации транзакции
+            self.assertEqual(get_stats()["images"], 0)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(get_stats()["images"], 2)
+
+        # Загрузка с ошибкой не учитывается, исключение не подменяется
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(InvalidImageError):
+                ingest_images(files + [SimpleUploadedFile("text.jpg", b"image")])
+        self.assertFalse(callbacks)
+
+    @override_settings(PHOTO_MAX_PIXELS=100_000)
+    def test_rejects_invalid_images(self):
+        with self.assertRaisesMessage(InvalidImageError, "слишком большое"):
+            ingest_image(SimpleUploadedFile("big.png", make_image(400, 300, "PNG")))
+        with self.assertRaisesMessage(InvalidImageError, "не является изображением"):
+            ingest_image(SimpleUploadedFile("text.jpg", b"image"))
+        with self.assertRaisesMessage(InvalidImageError, "не поддерживается"):
+            ingest_image(SimpleUploadedFile("horse.bmp", make_image(40, 30, "BMP")))
+
+
+class PhotoVariantsTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, PHOTO_VARIANT_WIDTHS=[320, 640]
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_backfill_and_srcset(self):
+        photo = Photo.objects.create(
+            title="Лошадь",
+            image=SimpleUploadedFile("horse.jpg", make_image(800, 600)),
+        )
+        result = backfill_variants(workers=1)
+        self.assertEqual(result, {"processed": 1, "failed": 0})
+        self.assertEqual(PhotoVariant.objects.filter(photo=photo).count(), 4)
+
+        srcset = PhotoMainInfoSerializer(photo).data["srcset"]
+        self.assertEqual(set(srcset), {"webp", "jpeg"})
+        self.assertRegex(
+            srcset["webp"], r"^/media/photos/horse_320w\.webp 320w, .+ 640w$"
+        )
+
+        # Фотографии с копиями повторно не обрабатываются
+        self.assertEqual(backfill_variants(workers=1)["processed"], 0)
+
+    def test_variants_job(self):
+        photo = Photo.objects.create(
+            title="Лошадь",
+            image=SimpleUploadedFile("horse.jpg", make_image(800, 600)),
+        )
+        job = Job.objects.get(name="gallery.generate_variants")
+        self.assertEqual(job.payload, {"photo_id": photo.id})
+
+        self.assertEqual(work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.result, 4)
+        self.assertEqual(PhotoVariant.objects.filter(photo=photo).count(), 4)
+        photo.refresh_from_db()
+        self.assertEqual((photo.width, photo.height, photo.orientation), (800, 600, 1))
+        self.assertIsNotNone(photo.phash)
+        data = PhotoMainInfoSerializer(photo).data
+        self.assertEqual((data["width"], data["height"]), (800, 600))
+        self.assertTrue(data["placeholder"].startswith("data:image/webp;base64,"))
+
+
+class PhotoUploadTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        schedule_variants = mock.patch("gallery.variants.schedule_variants")
+        schedule_variants.start()
+        self.addCleanup(schedule_variants.stop)
+        self.client.force_authenticate(self.moderator)
+
+    @staticmethod
+    def get_data(photos_count):
+        return {
+            "photos[]": [
+                SimpleUploadedFile(f"photo{i}.jpg", make_image(40, 30))
+                for i in range(photos_count)
+            ],
+            "description": "Выгул",
+            "category[]": ["Выгул"],
+        }
+
+    def get_staged_files(self):
+        return [
+            name
+            for _, _, names in os.walk(os.path.join(self.media_root, STAGING_DIR))
+            for name in names
+        ]
+
+    def test_sync_upload(self):
+        response = self.client.post("/api/v1/gallery/", self.get_data(2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(
+            set(Photo.objects.values_list("category__name", flat=True)), {"Выгул"}
+        )
+
+    def test_invalid_image_is_rejected(self):
+        for url in ("/api/v1/gallery/", "/api/v1/gallery/?async=true"):
+            data = self.get_data(1)
+            data["photos[]"].append(SimpleUploadedFile("text.jpg", b"image"))
+            response = self.client.post(url, data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("text.jpg", response.data["error"])
+        self.assertFalse(Photo.objects.exists())
+        self.assertEqual(self.get_staged_files(), [])
+
+    def test_async_upload(self):
+        response = self.client.post("/api/v1/gallery/?async=true", self.get_data(3))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Photo.objects.count(), 0)
+        self.assertEqual(len(self.get_staged_files()), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(work(burst=True), 1)
+        self.assertEqual(self.get_staged_files(), [])
+        self.assertEqual(Photo.objects.filter(created_by=self.moderator).count(), 3)
+        self.assertEqual(
+            set(Photo.objects.values_list("category__name", flat=True)), {"Выгул"}
+        )
+
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["status"], JOB_DONE)
+        self.assertEqual(len(job["result"]["photos"]), 3)
+
+        # Статус задачи виден только её создателю
+        self.client.force_authenticate(NewUser.objects.create(username="user"))
+        self.assertEqual(self.client.get(response["Location"]).status_code, 404)
+
+    def get_photo_files(self):
+        return [
+            name
+            for _, _, names in os.walk(os.path.join(self.media_root, "photos"))
+            for name in names
+        ]
+
+    def test_duplicate_upload_shares_file(self):
+        data = make_image(40, 30)
+        for names in (["a.jpg", "b.jpg"], ["c.jpg"]):
+            response = self.client.post(
+                "/api/v1/gallery/",
+                {"photos[]": [SimpleUploadedFile(name, data) for name in names]},
+            )
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(Photo.objects.values("image").distinct().count(), 1)
+        self.assertEqual(len(self.get_photo_files()), 1)
+        blob = PhotoBlob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Photo.objects.filter(title="a.jpg").delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(len(self.get_photo_files()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Photo.objects.all().delete()
+        self.assertFalse(PhotoBlob.objects.exists())
+        self.assertEqual(self.get_photo_files(), [])
+
+    def test_index_existing_photos(self):
+        data = make_image(40, 30)
+        for name, content in (("a.jpg", data), ("b.jpg", data), ("c.png", b"png")):
+            Photo.objects.create(title=name, image=SimpleUploadedFile(name, content))
+        self.assertEqual(len(self.get_photo_files()), 3)
+
+        result = index_photos()
+        self.assertEqual(result["indexed"], 3)
+        self.assertEqual(result["removed"], 1)
+        self.assertEqual(len(self.get_photo_files()), 2)
+        self.assertEqual(
+            sorted(PhotoBlob.objects.values_list("ref_count", flat=True)), [1, 2]
+        )
+        self.assertEqual(index_photos()["indexed"], 0)
+
+    def put_chunk(self, url, offset, data):
+        return self.client.put(
+            f"{url}?offset={offset}", data, content_type="application/octet-stream"
+        )
+
+    def test_category_export(self):
+        self.client.post("/api/v1/gallery/", self.get_data(2))
+        category = PhotoCategory.objects.get(name="Выгул")
+        photo = Photo.objects.get(title="photo1.jpg")
+        Photo.objects.create(title="photo1.jpg", image=photo.image.name).category.add(
+            category
+        )
+        Photo.objects.create(title="lost.jpg", image="photos/lost.jpg").category.add(
+            category
+        )
+
+        response = self.client.get(f"/api/v1/gallery/category/{category.id}/export/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn("attachment", response["Content-Disposition"])
+        with self.assertLogs("gallery.export", "WARNING"):
+            data = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                zf.namelist(), ["photo0.jpg", "photo1.jpg", "photo1 (2).jpg"]
+            )
+            self.assertEqual(
+                {info.compress_type for info in zf.infolist()}, {zipfile.ZIP_STORED}
+            )
+            with photo.image.open("rb") as file:
+                self.assertEqual(zf.read("photo1 (2).jpg"), file.read())
+
+        response = self.client.get("/api/v1/gallery/category/0/export/")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PHOTO_UPLOAD_CHUNK_SIZE=1000)
+    def test_chunked_upload(self):
+        data = make_image(400, 300)
+        response = self.client.post(
+            "/api/v1/gallery/uploads/",
+            {"filename": "horse.jpg", "size": len(data)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data["id"]
+        url = f"/api/v1/gallery/uploads/{upload_id}/"
+
+        self.assertEqual(self.put_chunk(url, 0, data[:1001]).status_code, 413)
+        self.assertEqual(self.put_chunk(url, 0, data[:1000]).data["offset"], 1000)
+        # Повтор уже принятой части сообщает текущее смещение
+        response = self.put_chunk(url, 0, data[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 1000)
+
+        finalize = {"uploads": [upload_id], "category": ["Выгул"]}
+        response = self.client.post(
+            "/api/v1/gallery/uploads/finalize/", finalize, format="json"
+        )
+        self.assertEqual(response.status_code, 409)
+
+        for offset in range(1000, len(data), 1000):
+            self.put_chunk(url, offset, data[offset : offset + 1000])
+        self.assertEqual(self.client.get(url).data["offset"], len(data))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/v1/gallery/uploads/finalize/", finalize, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+        photo = Photo.objects.get(id=response.data[0]["id"])
+        with photo.image.open("rb") as file:
+            self.assertEqual(file.read(), data)
+        self.assertEqual(list(photo.category.values_list("name", flat=True)), ["Выгул"])
+        self.assertFalse(os.listdir(os.path.join(self.media_root, "uploads/chunks")))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class PhotoListTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+        cls.author = NewUser.objects.create_user(username="author", password="author")
+        cls.categories = [PhotoCategory.objects.create(name=f"c{i}") for i in range(2)]
+        cls.photos = Photo.objects.bulk_create(
+            [
+                Photo(
+                    title=f"photo{i}",
+                    image=f"photos/{i}.jpg",
+                    created_by=cls.author if i % 2 else cls.moderator,
+                )
+                for i in range(7)
+            ]
+        )
+        for photo in cls.photos:
+            photo.category.add(*cls.categories)
+            PhotoVariant.objects.create(
+                photo=photo, image="photos/x.webp", format="webp", width=320, height=1
+            )
+
+    def setUp(self):
+        # Первый запрос процесса создаёт группы (ProfileManagementConfig),
+        # эти запросы не относятся к выводу галереи
+        self.client.get("/api/v1/gallery/?limit=1")
+
+    def get_all(self, url, limit):
+        titles = []
+        cursor = ""
+        while cursor is not None:
+            with self.assertNumQueries(4):
+                response = self.client.get(f"{url}&limit={limit}&cursor={cursor}")
+            self.assertEqual(response.status_code, 200)
+            titles += [item["title"] for item in response.data["items"]]
+            cursor = response.data["next_cursor"]
+        return titles
+
+    def test_cursor_pages(self):
+        category_ids = "&".join(f"category_id[]={c.id}" for c in self.categories)
+        titles = self.get_all(f"/api/v1/gallery/?{category_ids}", 3)
+        # Одинаковое время добавления упорядочивается по id
+        expected = [
+            photo.title
+            for photo in sorted(
+                self.photos,
+                key=lambda photo: (photo.created_at, photo.id),
+                reverse=True,
+            )
+        ]
+        self.assertEqual(titles, expected)
+
+        response = self.client.get("/api/v1/gallery/?limit=2&offset=6")
+        self.assertEqual(
+            [item["title"] for item in response.data["items"]], [expected[6]]
+        )
+        response = self.client.get("/api/v1/gallery/?cursor=broken")
+        self.assertEqual(response.status_code, 400)
+
+    def test_filters(self):
+        response = self.client.get("/api/v1/gallery/?title=photo3")
+        self.assertEqual(response.data["count"], 1)
+        self.assertNotIn("created_by", response.data["items"][0])
+
+        self.client.force_authenticate(self.moderator)
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                f"/api/v1/gallery/?created_by_id[]={self.author.id}"
+            )
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(response.data["items"][0]["created_by"]["first_name"], "")
+        self.assertEqual(len(response.data["items"][0]["category"]), 2)
+
+
+class PhotoTimelineTestCase(APITestCase):
+    @staticmethod
+    def create(title, captured_at):
+        return Photo.objects.create(
+            title=title,
+            image=f"photos/{title}.jpg",
+            captured_at=datetime.fromisoformat(captured_at),
+        )
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.get("/api/v1/gallery/timeline/")
+        self.photos = [
+            self.create("may", "2024-05-10T12:00:00+00:00"),
+            # 31 мая 21:30 UTC - уже июнь по Москве (TIME_ZONE)
+            self.create("june", "2024-05-31T21:30:00+00:00"),
+            self.create("december", "2023-12-31T12:00:00+00:00"),
+        ]
+
+    def get_months(self):
+        return {
+            (year["year"], month["month"]): month["count"]
+            for year in self.client.get("/api/v1/gallery/timeline/").data["years"]
+            for month in year["months"]
+        }
+
+    def test_counts(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/v1/gallery/timeline/")
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(
+            [(year["year"], year["count"]) for year in response.data["years"]],
+            [(2024, 2), (2023, 1)],
+        )
+        self.assertEqual(self.get_months(), {(2024, 6): 1, (2024, 5): 1, (2023, 12): 1})
+
+        Photo.create_photos(
+            [SimpleUploadedFile("new.jpg", make_image(40, 30))],
+        )
+        set_captured_at(
+            self.photos[0].id, datetime.fromisoformat("2023-12-01T12:00:00+00:00")
+        )
+        self.photos[2].delete()
+        now = timezone.localtime()
+        expected = {(2024, 6): 1, (2023, 12): 1, (now.year, now.month): 1}
+        self.assertEqual(self.get_months(), expected)
+        # Пересчёт по таблице фотографий даёт те же счётчики
+        rebuild_timeline()
+        self.assertEqual(self.get_months(), expected)
+
+    def test_jump_to_month(self):
+        months = self.client.get("/api/v1/gallery/timeline/").data["years"][0]
+        cursor = months["months"][1]["cursor"]
+        response = self.client.get(f"/api/v1/gallery/?order=captured&cursor={cursor}")
+        self.assertEqual(
+            [item["title"] for item in response.data["items"]], ["may", "december"]
+        )
+
+
+class PhotoBatchTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+        cls.author = NewUser.objects.create_user(username="author", password="author")
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_authenticate(self.moderator)
+        # Две фотографии с одинаковым содержимым ссылаются на один файл
+        self.photos = Photo.create_photos(
+            [
+                SimpleUploadedFile(f"photo{i}.jpg", make_image(40 + i // 2, 30))
+                for i in range(6)
+            ],
+            categories=["Старая"],
+        )
+        self.ids = [photo.id for photo in self.photos]
+        # Первый запрос процесса создаёт группы (ProfileManagementConfig)
+        self.client.get("/api/v1/gallery/timeline/")
+
+    def batch(self, action, photos, **data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/v1/gallery/batch/",
+                {"action": action, "photos": photos, **data},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data, len(queries)
+
+    def get_categories(self):
+        links = Photo.category.through.objects.order_by("photo_id", "photocategory")
+        return [
+            (photo_id, name)
+            for photo_id, name in links.values_list("photo_id", "photocategory__name")
+        ]
+
+    def test_set_categories(self):
+        data, queries = self.batch("set_categories", self.ids[:2], category=["А"])
+        self.assertEqual(data, {"action": "set_categories", "photos": 2, "changed": 4})
+        # Количество запросов не зависит от количества фотографий
+        _, more_queries = self.batch(
+            "set_categories", self.ids[2:] + [10**6], category=["А", "Б"]
+        )
+        self.assertEqual(queries, more_queries)
+        self.batch("set_categories", self.ids[:1], category=["Б"], replace=False)
+        self.assertEqual(
+            self.get_categories(),
+            [(self.ids[0], "А"), (self.ids[0], "Б"), (self.ids[1], "А")]
+            + [(photo_id, name) for photo_id in self.ids[2:] for name in ("А", "Б")],
+        )
+        self.batch("set_categories", self.ids, category=[])
+        self.assertEqual(self.get_categories(), [])
+
+    def test_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            data, queries = self.batch("delete", self.ids[:1])
+        self.assertEqual(data["changed"], 1)
+        # Файл первой фотографии остаётся у второй
+        self.assertTrue(os.path.exists(self.photos[1].image.path))
+        with self.captureOnCommitCallbacks(execute=True):
+            _, more_queries = self.batch("delete", self.ids[1:5])
+        self.assertEqual(queries, more_queries)
+
+        self.assertEqual(list(Photo.objects.values_list("id", flat=True)), self.ids[5:])
+        self.assertEqual(
+            list(PhotoBlob.objects.values_list("name", "ref_count")),
+            [(self.photos[5].image.name, 1)],
+        )
+        self.assertFalse(os.path.exists(self.photos[0].image.path))
+        self.assertEqual(self.client.get("/api/v1/gallery/timeline/").data["count"], 1)
+
+    def test_invalid_requests(self):
+        for data in (
+            {"action": "rename", "photos": self.ids},
+            {"action": "delete", "photos": []},
+            {"action": "set_categories", "photos": self.ids},
+        ):
+            response = self.client.post("/api/v1/gallery/batch/", data, format="json")
+            self.assertEqual(response.status_code, 400, data)
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            "/api/v1/gallery/batch/",
+            {"action": "delete", "photos": self.ids},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Photo.objects.count(), len(self.ids))
+
+
+class SimilarPhotosTestCase(APITestCase):
+    def setUp(self):
+        similar_index.index = None
+
+    def test_dhash_of_resized_copy(self):
+        image = Image.effect_mandelbrot((800, 600), (-2, -1.2, 1, 1.2), 100)
+        original = io.BytesIO()
+        image.convert("RGB").save(original, "JPEG", quality=95)
+        copy = io.BytesIO()
+        image.resize((320, 240)).convert("RGB").save(copy, "JPEG", quality=40)
+        other = io.BytesIO()
+        image.transpose(Image.Transpose.FLIP_LEFT_RIGHT).save(other, "PNG")
+
+        original_hash = get_dhash(original.getvalue())
+        self.assertLessEqual(
+            (original_hash ^ get_dhash(copy.getvalue())).bit_count(), 6
+        )
+        self.assertGreater(
+            (original_hash ^ get_dhash(other.getvalue())).bit_count(), 16
+        )
+
+    def test_index_matches_linear_scan(self):
+        random = __import__("random").Random(1)
+        hashes = [random.getrandbits(64) for _ in range(2000)]
+        hashes += [value ^ (1 << random.randrange(64)) for value in hashes[:200]]
+        index = MultiIndexHash()
+        for item, value in enumerate(hashes):
+            index.add(value, item)
+        for value in hashes[:50]:
+            expected = sorted(
+                ((value ^ other).bit_count(), item)
+                for item, other in enumerate(hashes)
+                if (value ^ other).bit_count() <= 10
+            )
+            self.assertEqual(index.search(value, 10), expected)
+
+    def test_similar_endpoint_and_groups(self):
+        base = 0x0F0F_F0F0_1234_ABCD
+        photos = [
+            Photo.objects.create(title=str(value), image="photos/x.jpg", phash=value)
+            for value in (
+                to_signed(base),
+                to_signed(base ^ 0b111),
+                to_signed(base ^ (1 << 63)),
+                to_signed(~base & (2**64 - 1)),
+            )
+        ]
+        Photo.objects.create(title="new", image="photos/y.jpg")
+
+        response = self.client.get(f"/api/v1/gallery/{photos[0].pk}/similar/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["id"], item["distance"]) for item in response.data["items"]],
+            [(photos[2].id, 1), (photos[1].id, 3)],
+        )
+        response = self.client.get(
+            f"/api/v1/gallery/{photos[0].pk}/similar/?distance=2"
+        )
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(
+            self.client.get(
+                f"/api/v1/gallery/{photos[0].pk}/similar/?distance=99"
+            ).status_code,
+            400,
+        )
+        self.assertEqual(
+            find_similar_groups(3), [sorted(photo.id for photo in photos[:3])]
+        )
+
+    def test_index_sees_hashes_from_other_processes(self):
+        base = 0x0F0F_F0F0_1234_ABCD
+        photo = Photo.objects.create(title="a", image="photos/a.jpg", phash=base)
+        other = Photo.objects.create(title="b", image="photos/b.jpg")
+        url = f"/api/v1/gallery/{photo.pk}/similar/"
+        self.assertEqual(self.client.get(url).data["count"], 0)
+
+        # Хеш записан runworker: invalidate() этого процесса не вызывался
+        Photo.objects.filter(pk=other.pk).update(phash=base ^ 1)
+        self.assertEqual(self.client.get(url).data["count"], 0)
+        similar_index.checked_at -= similar_index.rebuild_interval + 1
+        response = self.client.get(url)
+        self.assertEqual([item["id"] for item in response.data["items"]], [other.id])
+
+        # Хеш пересчитан: количество и id фотографий с хешем не изменились
+        Photo.objects.filter(pk=other.pk).update(
+            phash=base ^ 0xFFFF, phash_updated_at=timezone.now()
+        )
+        similar_index.checked_at -= similar_index.rebuild_interval + 1
+        self.assertEqual(self.client.get(url).data["count"], 0)
+
+
+class PhotoRenderTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        with mock.patch("gallery.variants.schedule_variants"):
+            self.photo = Photo.objects.create(
+                title="Лошадь",
+                image=SimpleUploadedFile("horse.jpg", make_image(1600, 1200)),
+            )
+        self.cache = RenderCache(f"{media_root}/render_cache", 10 * 1024 * 1024)
+        patcher = mock.patch("gallery.views.get_render_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render_and_cache_headers(self):
+        url = f"/api/v1/gallery/{self.photo.pk}/render/?w=400&h=400&fmt=jpeg"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("max-age", response["Cache-Control"])
+        with Image.open(io.BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (400, 300))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_params(self):
+        for query in ("", "w=0", "w=abc", "w=100&fmt=gif"):
+            response = self.client.get(
+                f"/api/v1/gallery/{self.photo.pk}/render/?{query}"
+            )
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_concurrent_requests_render_once(self):
+        with mock.patch.object(
+            RenderCache, "render", side_effect=lambda *args: time.sleep(0.2) or b"x"
+        ) as render:
+            threads = [
+                threading.Thread(
+                    target=self.cache.get, args=(self.photo, 200, None, "webp")
+                )
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(render.call_count, 1)
+
+    def test_eviction(self):
+        self.cache.max_size = 1000
+        with mock.patch.object(RenderCache, "render", return_value=b"x" * 400):
+            first, _ = self.cache.get(self.photo, 100, None, "webp")
+            second, _ = self.cache.get(self.photo, 200, None, "webp")
+            os.utime(first, (0, 0))
+            os.utime(second, (1, 1))
+            self.cache.get(self.photo, 100, None, "webp")  # обращение обновляет mtime
+            third, _ = self.cache.get(self.photo, 300, None, "webp")
+        self.assertTrue(first.exists())
+        self.assertFalse(second.exists())
+        self.assertTrue(third.exists())
+
+    @skipIf(fcntl is None, "Блокировка файлов недоступна")
+    def test_size_is_shared_between_processes(self):
+        # Экземпляр на процесс: размер кэша учитывает записи обоих
+        other = RenderCache(self.cache.directory, 1000)
+        self.cache.max_size = 1000
+        with mock.patch.object(RenderCache, "render", return_value=b"x" * 400):
+            first, _ = self.cache.get(self.photo, 100, None, "webp")
+            second, _ = other.get(self.photo, 200, None, "webp")
+            os.utime(first, (0, 0))
+            os.utime(second, (1, 1))
+            # Файл блокировки, который держит другой процесс, не удаляется
+            with open(first.with_suffix(".lock"), "rb") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self.cache.get(self.photo, 300, None, "webp")
+            self.assertFalse(first.exists())
+            self.assertTrue(first.with_suffix(".lock").exists())
+            self.assertTrue(second.exists())
+
+            other.get(self.photo, 400, None, "webp")
+        self.assertFalse(second.exists())
+        self.assertFalse(second.with_suffix(".lock").exists())
+        self.assertEqual(self.cache.read_size(), 800)
+
+
+class MediaGarbageTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        with mock.patch("gallery.variants.schedule_variants"):
+            self.photo = Photo.objects.create(
+                title="Лошадь",
+                image=SimpleUploadedFile("horse.jpg", make_image(40, 30)),
+            )
+        self.variant = PhotoVariant.objects.create(
+            photo=self.photo,
+            image=SimpleUploadedFile("horse_320w.webp", b"variant"),
+            format="webp",
+            width=320,
+            height=240,
+        )
+        self.orphans = [
+            "photos/deleted.jpg",
+            "photos/deleted_320w.webp",
+            "profile_pictures/old.png",
+            f"{STAGING_DIR}/abc/photo.jpg",
+            "uploads/chunks/0b3a4d2e-7a55-4f55-9d8f-3c2b1a0e9f11.part",
+        ]
+        for name in self.orphans + ["photos/recent.jpg"]:
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(b"orphan")
+        old = time.time() - 2 * 24 * 60 * 60
+        for directory, _, names in os.walk(self.media_root):
+            for name in names:
+                if name != "recent.jpg":
+                    os.utime(os.path.join(directory, name), (old, old))
+
+    def get_files(self, directory=""):
+        root = os.path.join(self.media_root, directory)
+        return sorted(
+            os.path.relpath(os.path.join(path, name), root).replace(os.sep, "/")
+            for path, _, names in os.walk(root)
+            for name in names
+        )
+
+    def test_dry_run_and_resume(self):
+        found = []
+        result = MediaCollector(
+            dry_run=True, limit=2, progress=lambda name, size: found.append(name)
+        ).collect()
+        self.assertEqual(result["scanned"], 2)
+        self.assertEqual(result["last"], "photos/deleted_320w.webp")
+        result = MediaCollector(
+            dry_run=True, progress=lambda name, size: found.append(name)
+        ).collect(after=result["last"])
+        self.assertIsNone(result["last"])
+        self.assertEqual(sorted(found), sorted(self.orphans))
+        self.assertEqual(len(self.get_files()), len(self.orphans) + 3)
+
+    def test_files_of_pending_jobs_are_kept(self):
+        # Фоновое завершение загрузки: PhotoUpload уже удалён, задача ждёт
+        chunk = self.orphans[-1]
+        job = process_upload.enqueue(files=[{"path": chunk, "name": "horse.jpg"}])
+        MediaCollector().collect()
+        self.assertIn(chunk, self.get_files())
+
+        Job.objects.filter(id=job.id).update(status=JOB_FAILED)
+        MediaCollector().collect()
+        self.assertNotIn(chunk, self.get_files())
+
+    def test_delete_and_quarantine(self):
+        MediaCollector(quarantine=True).collect()
+        self.assertEqual(
+            self.get_files(),
+            sorted(
+                [self.photo.image.name, self.variant.image.name, "photos/recent.jpg"]
+                + [
+                    f"uploads/quarantine/{name}"
+                    for name in self.get_files("uploads/quarantine")
+                ]
+            ),
+        )
+        self.assertEqual(
+            [name.split("/", 1)[1] for name in self.get_files("uploads/quarantine")],
+            sorted(self.orphans),
+        )
+        # Пустой каталог временных файлов удаляется при следующем запуске
+        result = MediaCollector(min_age=0).collect()
+        self.assertEqual(result["orphans"], 1)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.media_root, STAGING_DIR, "abc"))
+        )
+
+        # Файлы копий удаляются вместе с фотографией, а файл, оставшийся
+        # от фотографии без учёта хешей, - при следующем запуске
+        with self.captureOnCommitCallbacks(execute=True):
+            self.photo.delete()
+        self.assertEqual(self.get_files("photos"), ["horse.jpg"])
+        MediaCollector(min_age=0).collect()
+        self.assertEqual(self.get_files("photos"), [])
@@ -0,0 +1,133 @@
+from collections import Counter
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from service.pagination import KeysetPagination
+
+from .models import Photo, PhotoTimeline
+from .signals import is_batch_delete
+
+# Порядок ленты: по дате съёмки, от новых к старым
+timeline_pagination = KeysetPagination(ordering=("-captured_at", "-id"))
+
+
+def get_period(value: datetime) -> tuple[int, int]:
+    value = timezone.localtime(value)
+    return value.year, value.month
+
+
+def update_counts(changes: Counter) -> None:
+    """Прибавляет к счётчикам месяцев {(год, месяц): изменение}.
+
+    Строки месяцев создаются без перезаписи существующих, счётчики
+    меняются через F(), поэтому параллельные загрузки не теряют изменений.
+    Строки с нулём не удаляются: их мог бы увеличить параллельный запрос.
+    """
+    changes = {period: delta for period, delta in changes.items() if delta}
+    if not changes:
+        return
+    PhotoTimeline.objects.bulk_create(
+        [PhotoTimeline(year=year, month=month) for year, month in changes],
+        ignore_conflicts=True,
+    )
+    for (year, month), delta in sorted(changes.items()):
+        PhotoTimeline.objects.filter(year=year, month=month).update(
+            count=F("count") + delta
+        )
+
+
+def add_photos(photos: list[Photo]) -> None:
+    update_counts(Counter(get_period(photo.captured_at) for photo in photos))
+
+
+@transaction.atomic
+def set_captured_at(photo_id: int, captured_at: datetime) -> None:
+    """Меняет дату фотографии в ленте и счётчики месяцев.
+
+    Строка фотографии блокируется, чтобы параллельные задачи (копии
+    и метаданные) не перенесли фотографию между месяцами дважды.
+    """
+    current = (
+        Photo.objects.select_for_update()
+        .filter(id=photo_id)
+        .values_list("captured_at", flat=True)
+        .first()
+    )
+    if current is None or current == captured_at:
+        return
+    Photo.objects.filter(id=photo_id).update(captured_at=captured_at)
+    old, new = get_period(current), get_period(captured_at)
+    if old != new:
+        update_counts(Counter({old: -1, new: 1}))
+
+
+def add_created_photo(sender, instance: Photo, created: bool, raw=False, **kwargs):
+    # Фотографии из Photo.create_photos добавляются bulk_create без сигнала
+    if created and not raw:
+        add_photos([instance])
+
+
+def remove_photos(photos: list[Photo]) -> None:
+    changes = Counter()
+    for photo in photos:
+        changes[get_period(photo.captured_at)] -= 1
+    update_counts(changes)
+
+
+def remove_deleted_photo(sender, instance: Photo, **kwargs) -> None:
+    if not is_batch_delete():
+        remove_photos([instance])
+
+
+def remove_deleted_photos(sender, photos: list[Photo], **kwargs) -> None:
+    remove_photos(photos)
+
+
+@transaction.atomic
+def rebuild_timeline() -> int:
+    """Пересчитывает счётчики по таблице фотографий.
+
+    Нужен после добавления фотографий в обход Photo.create_photos
+    (SQL, восстановление из копии). Возвращает количество месяцев.
+    """
+    periods = (
+        Photo.objects.order_by()
+        .values(year=ExtractYear("captured_at"), month=ExtractMonth("captured_at"))
+        .annotate(count=Count("id"))
+    )
+    PhotoTimeline.objects.all().delete()
+    return len(PhotoTimeline.objects.bulk_create(PhotoTimeline(**p) for p in periods))
+
+
+def get_month_cursor(year: int, month: int) -> str:
+    """Cursor списка в порядке ленты, с которого начинается месяц.
+
+    Это значения ключа сразу после месяца (начало следующего): запрос
+    к базе не нужен, переход к месяцу - один запрос по индексу.
+    """
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    start = timezone.make_aware(datetime(year, month, 1))
+    return timeline_pagination.encode_values([start, 0])
+
+
+def get_timeline() -> dict:
+    years = {}
+    total = 0
+    for period in PhotoTimeline.objects.filter(count__gt=0).order_by("-year", "-month"):
+        year = years.setdefault(
+            period.year, {"year": period.year, "count": 0, "months": []}
+        )
+        year["count"] += period.count
+        year["months"].append(
+            {
+                "month": period.month,
+                "count": period.count,
+                "cursor": get_month_cursor(period.year, period.month),
+            }
+        )
+        total += period.count
+    return {"count": total, "years": list(years.values())}
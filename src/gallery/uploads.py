@@ -0,0 +1,150 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils.text import get_valid_filename
+from rest_framework.request import Request
+
+from .ingest import validate_images
+from .models import Photo, PhotoUpload
+
+STAGING_DIR = "uploads/staging"
+READ_SIZE = 64 * 1024
+
+
+def is_async_upload(request: Request) -> bool:
+    return request.query_params.get("async") == "true"
+
+
+def is_direct_upload() -> bool:
+    # Хранилище выдаёт ссылки для загрузки файлов клиентом (service.s3)
+    return hasattr(default_storage, "get_upload_url")
+
+
+def get_upload_url(upload: PhotoUpload) -> str | None:
+    if not is_direct_upload():
+        return None
+    return default_storage.get_upload_url(
+        upload.path, upload.size, expires=settings.PHOTO_UPLOAD_URL_EXPIRES
+    )
+
+
+def refresh_offset(upload: PhotoUpload) -> None:
+    """Отмечает загрузку завершённой, если файл уже передан в хранилище.
+
+    При загрузке по upload_url файл целиком записывается хранилищем,
+    минуя API, поэтому смещение определяется по размеру объекта.
+    """
+    if upload.is_complete or not is_direct_upload():
+        return
+    try:
+        size = default_storage.size(upload.path)
+    except FileNotFoundError:
+        return
+    if size == upload.size:
+        PhotoUpload.objects.filter(id=upload.id).update(offset=size)
+        upload.offset = size
+
+
+def stage_files(files: list[UploadedFile]) -> list[dict]:
+    """Сохраняет загруженные файлы во временный каталог хранилища.
+
+    Файлы, которые Django уже записал на диск, перемещаются без копирования.
+    Возвращает [{"path": путь в хранилище, "name": исходное имя}] для
+    передачи в фоновую задачу.
+    """
+    directory = f"{STAGING_DIR}/{uuid.uuid4().hex}"
+    staged = []
+    try:
+        for file in files:
+            name = get_valid_filename(file.name) or "photo"
+            staged.append(
+                {
+                    "path": default_storage.save(f"{directory}/{name}", file),
+                    "name": file.name,
+                }
+            )
+    except Exception:
+        delete_staged(staged)
+        raise
+    return staged
+
+
+def validate_staged(staged: list[dict]) -> None:
+    # Проверяются только заголовки файлов, см. gallery.ingest
+    for item in staged:
+        with default_storage.open(item["path"], "rb") as file:
+            file.name = item["name"]
+            validate_images([file])
+
+
+def delete_staged(staged: list[dict]) -> None:
+    for item in staged:
+        default_storage.delete(item["path"])
+
+
+def create_staged_photos(
+    staged: list[dict],
+    description: str | None = None,
+    categories: list | None = None,
+    created_by_id: int | None = None,
+    uploaded: list[Photo] | None = None,
+) -> list[Photo]:
+    """Создаёт фотографии из файлов stage_files в текущей транзакции.
+
+    Временные файлы удаляются после фиксации транзакции, при ошибке
+    остаются для повторной попытки.
+    """
+    files = []
+    try:
+        for item in staged:
+            files.append(File(default_storage.open(item["path"]), name=item["name"]))
+        photos = Photo.create_photos(
+            files,
+            description=description,
+            categories=categories,
+            created_by_id=created_by_id,
+            uploaded=uploaded,
+        )
+    finally:
+        for file in files:
+            file.close()
+    transaction.on_commit(lambda: delete_staged(staged))
+    return photos
+
+
+def write_chunk(upload: PhotoUpload, stream, length: int) -> int:
+    """Дописывает часть файла с текущего смещения загрузки.
+
+    Данные копируются из потока запроса блоками по READ_SIZE, поэтому
+    в памяти не держится ни часть, ни файл целиком. Если соединение
+    оборвалось, сохраняется всё, что успело прийти, и клиент продолжает
+    с нового смещения. Возвращает новое смещение.
+    """
+    path = default_storage.path(upload.path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    offset = upload.offset
+    written = 0
+    # O_CREAT без O_TRUNC: полученные ранее части сохраняются
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT, 0o644), "wb") as file:
+        file.seek(offset)
+        try:
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                file.write(data)
+                written += len(data)
+        finally:
+            # Хвост от оборванной ранее передачи отбрасывается
+            file.truncate()
+            file.flush()
+            PhotoUpload.objects.filter(id=upload.id, offset=offset).update(
+                offset=offset + written
+            )
+    upload.offset = offset + written
+    return upload.offset
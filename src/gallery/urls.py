@@ -1,15 +1,31 @@
 from django.urls import path
 
 from .views import (
+    PhotoBatchAPIView,
+    PhotoCategoryExportAPIView,
     PhotoCategoryListCreateAPIView,
     PhotoCategoryRetrieveUpdateDestroyAPIView,
     PhotoListCreateAPIView,
+    PhotoRenderAPIView,
     PhotoRetrieveUpdateDestroyAPIView,
+    PhotoSimilarAPIView,
+    PhotoTimelineAPIView,
+    PhotoUploadAPIView,
+    PhotoUploadCreateAPIView,
+    PhotoUploadFinalizeAPIView,
 )
 
 urlpatterns = [
     path("", PhotoListCreateAPIView.as_view()),
     path("<int:pk>/", PhotoRetrieveUpdateDestroyAPIView.as_view()),
+    path("<int:pk>/render/", PhotoRenderAPIView.as_view()),
+    path("<int:pk>/similar/", PhotoSimilarAPIView.as_view()),
+    path("batch/", PhotoBatchAPIView.as_view()),
+    path("timeline/", PhotoTimelineAPIView.as_view()),
+    path("uploads/", PhotoUploadCreateAPIView.as_view()),
+    path("uploads/finalize/", PhotoUploadFinalizeAPIView.as_view()),
+    path("uploads/<uuid:pk>/", PhotoUploadAPIView.as_view()),
     path("category/", PhotoCategoryListCreateAPIView.as_view()),
     path("category/<int:pk>/", PhotoCategoryRetrieveUpdateDestroyAPIView.as_view()),
+    path("category/<int:pk>/export/", PhotoCategoryExportAPIView.as_view()),
 ]
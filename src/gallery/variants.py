@@ -0,0 +1,143 @@
+import multiprocessing
+import threading
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from .imaging import render_variants
+from .models import Photo, PhotoVariant
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_widths() -> list[int]:
+    return sorted(getattr(settings, "PHOTO_VARIANT_WIDTHS", [320, 640, 1280]))
+
+
+def get_executor() -> ProcessPoolExecutor:
+    # Процессы запускаются через spawn: воркеры не наследуют соединения с БД
+    # и потоки сервера. Функции для воркеров находятся в imaging.py,
+    # который не импортирует Django
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, "PHOTO_VARIANT_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def read_photo(photo: Photo) -> bytes:
+    with photo.image.open("rb") as file:
+        return file.read()
+
+
+def save_variants(photo: Photo, rendered: list[tuple]) -> list[PhotoVariant]:
+    stem = PurePosixPath(photo.image.name)
+    variants = []
+    for variant_format, width, height, data in rendered:
+        name = str(stem.with_name(f"{stem.stem}_{width}w.{variant_format}"))
+        variants.append(
+            PhotoVariant(
+                photo_id=photo.id,
+                image=default_storage.save(name, ContentFile(data)),
+                format=variant_format,
+                width=width,
+                height=height,
+            )
+        )
+
+    old_variants = list(PhotoVariant.objects.filter(photo_id=photo.id))
+    try:
+        with transaction.atomic():
+            PhotoVariant.objects.filter(id__in=[v.id for v in old_variants]).delete()
+            PhotoVariant.objects.bulk_create(variants)
+    except IntegrityError:
+        # Фотография удалена, пока создавались копии
+        for variant in variants:
+            default_storage.delete(variant.image.name)
+        return []
+    return variants
+
+
+def on_variant_deleted(sender, instance, **kwargs) -> None:
+    # Файлы копий удаляются и при каскадном удалении фотографии
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: default_storage.delete(name))
+
+
+def schedule_variants(photos: list[Photo]) -> None:
+    """Ставит генерацию копий в очередь фоновых задач (manage.py runworker).
+
+    Задачи добавляются в текущей транзакции и выполняются только после
+    её фиксации.
+    """
+    from .tasks import generate_variants
+
+    generate_variants.enqueue_many([{"photo_id": photo.id} for photo in photos])
+
+
+def on_photo_saved(sender, instance: Photo, created: bool, raw=False, **kwargs):
+    if created and not raw:
+        schedule_variants([instance])
+
+
+def backfill_variants(force: bool = False, workers: int | None = None, progress=None):
+    """Создаёт копии для существующих фотографий в отдельном пуле процессов.
+
+    В пул одновременно отправляется не больше двух фотографий на процесс,
+    поэтому в памяти находятся только обрабатываемые файлы.
+    """
+    queryset = Photo.objects.order_by("id")
+    if not force:
+        queryset = queryset.filter(variants__isnull=True)
+
+    workers = workers or getattr(settings, "PHOTO_VARIANT_WORKERS", 2)
+    widths = get_variant_widths()
+    result = {"processed": 0, "failed": 0}
+    pending = {}
+
+    def collect(return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            photo = pending.pop(future)
+            try:
+                save_variants(photo, future.result())
+                result["processed"] += 1
+            except Exception as ex:
+                result["failed"] += 1
+                if progress is not None:
+                    progress(photo, ex)
+                continue
+            if progress is not None:
+                progress(photo, None)
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for photo in queryset.iterator(chunk_size=500):
+            try:
+                data = read_photo(photo)
+            except OSError as ex:
+                result["failed"] += 1
+                if progress is not None:
+                    progress(photo, ex)
+                continue
+            pending[executor.submit(render_variants, data, widths)] = photo
+            if len(pending) >= workers * 2:
+                collect(FIRST_COMPLETED)
+        if pending:
+            collect(ALL_COMPLETED)
+    return result
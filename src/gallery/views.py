@@ -1,18 +1,71 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from gallery.models import Photo, PhotoCategory
+from gallery.models import Photo, PhotoCategory, PhotoUpload
+from profile_management.permissions import user_has_perm
+from service.files import send_file
+from service.pagination import KeysetPagination, get_limit, get_offset
 
+from .batch import BATCH_ACTIONS, run_action
+from .export import get_zip_response
+from .imaging import VARIANT_FORMATS
+from .ingest import InvalidImageError, validate_images
 from .permissions import GalleryPermission, get_has_gallery_moderate_permission
-from .serializers import PhotoListAdminSerializer, PhotoListSerializer
+from .render_cache import get_render_cache
+from .serializers import (
+    PhotoBatchSerializer,
+    PhotoListAdminSerializer,
+    PhotoListSerializer,
+    PhotoMainInfoSerializer,
+    PhotoUploadFinalizeSerializer,
+    PhotoUploadSerializer,
+)
+from .similarity import similar_index
+from .tasks import process_upload
+from .timeline import get_timeline, timeline_pagination
+from .uploads import (
+    create_staged_photos,
+    delete_staged,
+    is_async_upload,
+    is_direct_upload,
+    refresh_offset,
+    stage_files,
+    validate_staged,
+    write_chunk,
+)
+
+
+def get_photos_response(request, photos: list[Photo]) -> Response:
+    prefetch_related_objects(photos, "variants")
+    serializer = PhotoMainInfoSerializer(
+        photos, many=True, context={"request": request}
+    )
+    return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+
+def get_job_response(request, job) -> Response:
+    # Фотографии создаются фоновой задачей, статус доступен по ссылке Location
+    return Response(
+        data={"job_id": job.id},
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": request.build_absolute_uri(job.get_absolute_url())},
+    )
 
 
 @extend_schema(tags=["Галерея"])
 class PhotoListCreateAPIView(ListCreateAPIView):
     model = Photo
     permission_classes = [GalleryPermission]
+    pagination = KeysetPagination(ordering=("-created_at", "-id"))
 
     def get_serializer_class(self, *args, **kwargs):
         has_moderate_access = kwargs.get("has_moderate_access", False)
@@ -35,7 +88,13 @@ class PhotoListCreateAPIView(ListCreateAPIView):
         if search_description:
             filter_query["description__icontains"] = search_description
         if search_category:
-            queryset = queryset.filter(category__id__in=search_category)
+            # Подзапрос вместо JOIN: фотография из нескольких выбранных
+            # категорий не дублируется, и DISTINCT не нужен
+            queryset = queryset.filter(
+                id__in=Photo.category.through.objects.filter(
+                    photocategory_id__in=search_category
+                ).values("photo_id")
+            )
 
         if has_moderate_access:
             search_created_at_start = query_params.get("search_created_at_start")
@@ -47,36 +106,29 @@ class PhotoListCreateAPIView(ListCreateAPIView):
             if search_created_at_end:
                 filter_query["created_at__lte"] = search_created_at_end
             if filter_created_by:
-                filter_query["created_by__id"] = filter_created_by
+                filter_query["created_by_id__in"] = filter_created_by
 
         queryset = queryset.filter(**filter_query)
         return queryset
 
     def paginate_queryset(self, queryset, *args, **kwargs):
         query_params = self.request.query_params
-        qp_limit = query_params.get("limit")
-        qp_offset = query_params.get("offset")
-
-        try:
-            qp_limit = int(qp_limit)
-            if qp_limit < 1:
-                qp_limit = 1
-            elif qp_limit > 100:
-                qp_limit = 100
-        except (ValueError, TypeError):
-            qp_limit = 50
-
-        try:
-            qp_offset = int(qp_offset)
-            if qp_offset < 0:
-                qp_offset = 0
-        except (ValueError, TypeError):
-            qp_offset = 0
-
-        return queryset[qp_offset : qp_limit + qp_offset]
+        # order=captured - в порядке ленты (cursor месяца из /gallery/timeline/)
+        pagination = self.pagination
+        if query_params.get("order") == "captured":
+            pagination = timeline_pagination
+        return pagination.paginate(
+            queryset,
+            limit=get_limit(query_params.get("limit")),
+            cursor=query_params.get("cursor"),
+            offset=get_offset(query_params.get("offset")),
+        )
 
     def get_queryset(self, *args, **kwargs):
-        return Photo.objects.all()
+        queryset = Photo.objects.prefetch_related("variants", "category")
+        if kwargs.get("has_moderate_access", False):
+            queryset = queryset.select_related("created_by")
+        return queryset
 
     def list(self, request, *args, **kwargs):
         has_moderate_access = (
@@ -84,14 +136,71 @@ class PhotoListCreateAPIView(ListCreateAPIView):
             and get_has_gallery_moderate_permission(request.user)
         )
         serializer = self.get_serializer_class(has_moderate_access=has_moderate_access)
-        queryset = self.get_queryset(has_moderate_access=has_moderate_access)
+        queryset = self.filter_queryset(
+            self.get_queryset(has_moderate_access=has_moderate_access),
+            has_moderate_access=has_moderate_access,
+        )
         count = queryset.count()
-        queryset = self.paginate_queryset(queryset)
-        serializer_data = serializer(queryset, many=True).data
+        try:
+            photos, next_cursor = self.paginate_queryset(queryset)
+        except ValueError as ex:
+            return Response(data={"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer_data = serializer(photos, many=True).data
         return Response(
-            data={"count": count, "items": serializer_data}, status=status.HTTP_200_OK
+            data={"count": count, "items": serializer_data, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK,
         )
 
+    @extend_schema(tags=["Галерея"], summary="Добавление фотографий")
+    def create(self, request, *args, **kwargs):
+        files = [
+            photo
+            for photo in request.data.getlist("photos[]")
+            if isinstance(photo, UploadedFile)
+        ]
+        if not files:
+            return Response(
+                data={"error": "Не выбраны фотографии"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            validate_images(files)
+        except InvalidImageError as ex:
+            return Response(data={"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        description = request.data.get("description") or None
+        categories = request.data.getlist("category[]") or None
+
+        if is_async_upload(request):
+            staged = stage_files(files)
+            try:
+                job = process_upload.enqueue(
+                    files=staged,
+                    description=description,
+                    categories=categories,
+                    created_by_id=request.user.id,
+                    created_by=request.user,
+                )
+            except Exception:
+                delete_staged(staged)
+                raise
+            return get_job_response(request, job)
+
+        uploaded = []
+        try:
+            with transaction.atomic():
+                photos = Photo.create_photos(
+                    files,
+                    description=description,
+                    categories=categories,
+                    created_by_id=request.user.id,
+                    uploaded=uploaded,
+                )
+        except Exception:
+            for photo in uploaded:
+                photo.image.delete(save=False)
+            raise
+        return get_photos_response(request, photos)
+
 
 @extend_schema(tags=["Галерея"])
 class PhotoRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
@@ -105,6 +214,309 @@ class PhotoRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
         return Photo.objects.get(pk=self.kwargs["pk"])
 
 
+@extend_schema(tags=["Галерея"])
+class PhotoRenderAPIView(APIView):
+    permission_classes = [GalleryPermission]
+    max_size = 4096
+    cache_max_age = 60 * 60 * 24 * 30
+
+    def get_size(self, param: str) -> int | None:
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        value = int(value)
+        if not 1 <= value <= self.max_size:
+            raise ValueError
+        return value
+
+    @extend_schema(
+        tags=["Галерея"], summary="Фотография, уменьшенная до заданного размера"
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            width = self.get_size("w")
+            height = self.get_size("h")
+        except ValueError:
+            return Response(
+                data={"error": f"w и h должны быть от 1 до {self.max_size}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if width is None and height is None:
+            return Response(
+                data={"error": "Укажите w или h"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        image_format = request.query_params.get("fmt", "webp")
+        if image_format not in VARIANT_FORMATS:
+            return Response(
+                data={"error": "fmt может быть только webp или jpeg"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            photo = Photo.objects.only("id", "image").get(pk=kwargs["pk"])
+        except Photo.DoesNotExist:
+            return Response(
+                data={"error": "Фотография не найдена"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        render_cache = get_render_cache()
+        options = {
+            "cache_control": f"public, max-age={self.cache_max_age}",
+            "content_type": f"image/{image_format}",
+        }
+        try:
+            path, key = render_cache.get(photo, width, height, image_format)
+            try:
+                return send_file(request, path, etag=f'"{key}"', **options)
+            except FileNotFoundError:
+                # Файл удалён из кэша между проверкой и отправкой
+                path, key = render_cache.get(photo, width, height, image_format)
+                return send_file(request, path, etag=f'"{key}"', **options)
+        except OSError:
+            return Response(
+                data={"error": "Не удалось обработать фотографию"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoSimilarAPIView(APIView):
+    permission_classes = [GalleryPermission]
+    default_distance = 10
+    max_distance = 16
+    limit = 50
+
+    @extend_schema(
+        tags=["Галерея"],
+        summary="Похожие фотографии (копии с другим размером, сжатием, кадром)",
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            distance = int(request.query_params.get("distance", self.default_distance))
+            if not 0 <= distance <= self.max_distance:
+                raise ValueError
+        except ValueError:
+            return Response(
+                data={"error": f"distance должен быть от 0 до {self.max_distance}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        photo = Photo.objects.filter(pk=kwargs["pk"]).only("id", "phash").first()
+        if photo is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if photo.phash is None:
+            return Response(
+                data={"error": "Фотография ещё не обработана"},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        matches = [
+            (match_distance, photo_id)
+            for match_distance, photo_id in similar_index.search(photo.phash, distance)
+            if photo_id != photo.id
+        ][: self.limit]
+        # Удалённые после построения индекса фотографии пропускаются
+        photos = Photo.objects.prefetch_related("variants").in_bulk(
+            [photo_id for _, photo_id in matches]
+        )
+        items = [
+            {
+                **PhotoMainInfoSerializer(
+                    photos[photo_id], context={"request": request}
+                ).data,
+                "distance": match_distance,
+            }
+            for match_distance, photo_id in matches
+            if photo_id in photos
+        ]
+        return Response(data={"count": len(items), "items": items})
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoUploadCreateAPIView(APIView):
+    permission_classes = [IsAuthenticated, GalleryPermission]
+
+    @extend_schema(
+        tags=["Галерея"],
+        summary="Начало загрузки фотографии по частям",
+        request=PhotoUploadSerializer,
+        responses=PhotoUploadSerializer,
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = PhotoUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(created_by=request.user)
+        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoUploadAPIView(APIView):
+    """Части файла передаются телом PUT /uploads/<id>/?offset=<байт>.
+
+    После обрыва связи клиент запрашивает GET /uploads/<id>/ и продолжает
+    с полученного offset. Если хранилище выдаёт upload_url, файл
+    передаётся туда целиком, а API только проверяет его наличие.
+    """
+
+    permission_classes = [IsAuthenticated, GalleryPermission]
+
+    def get_upload(self) -> PhotoUpload | None:
+        return PhotoUpload.objects.filter(
+            pk=self.kwargs["pk"], created_by=self.request.user
+        ).first()
+
+    @extend_schema(
+        tags=["Галерея"],
+        summary="Состояние загрузки по частям",
+        responses=PhotoUploadSerializer,
+    )
+    def get(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        if upload is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        refresh_offset(upload)
+        return Response(data=PhotoUploadSerializer(upload).data)
+
+    @extend_schema(
+        tags=["Галерея"],
+        summary="Передача части файла",
+        request={"application/octet-stream": bytes},
+        responses=PhotoUploadSerializer,
+    )
+    def put(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        if upload is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if is_direct_upload():
+            return Response(
+                data={"error": "Файл загружается в хранилище по upload_url"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            offset = int(request.query_params.get("offset"))
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except (TypeError, ValueError):
+            return Response(
+                data={"error": "Не указано смещение offset"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if offset != upload.offset:
+            return Response(
+                data={"error": "Неверное смещение", "offset": upload.offset},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if length > settings.PHOTO_UPLOAD_CHUNK_SIZE:
+            return Response(
+                data={
+                    "error": "Часть файла больше "
+                    f"{settings.PHOTO_UPLOAD_CHUNK_SIZE} байт"
+                },
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        if offset + length > upload.size:
+            return Response(
+                data={"error": "Часть выходит за пределы файла"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Тело запроса не разбирается парсерами DRF, а читается из потока
+        if write_chunk(upload, request.stream, length) < offset + length:
+            return Response(
+                data={"error": "Передача прервана", "offset": upload.offset},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(data=PhotoUploadSerializer(upload).data)
+
+    @extend_schema(tags=["Галерея"], summary="Отмена загрузки по частям")
+    def delete(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        if upload is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        upload.delete()
+        default_storage.delete(upload.path)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoUploadFinalizeAPIView(APIView):
+    permission_classes = [IsAuthenticated, GalleryPermission]
+
+    @extend_schema(
+        tags=["Галерея"],
+        summary="Создание фотографий из загруженных по частям файлов",
+        request=PhotoUploadFinalizeSerializer,
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = PhotoUploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload_ids = set(serializer.validated_data["uploads"])
+        description = serializer.validated_data.get("description") or None
+        categories = serializer.validated_data.get("category") or None
+
+        uploaded = []
+        job = None
+        try:
+            with transaction.atomic():
+                # Блокировка не даёт создать фотографии дважды
+                # при повторной отправке запроса
+                uploads = list(
+                    PhotoUpload.objects.select_for_update().filter(
+                        id__in=upload_ids, created_by=request.user
+                    )
+                )
+                if len(uploads) != len(upload_ids):
+                    return Response(
+                        data={"error": "Загрузки не найдены"},
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+                for upload in uploads:
+                    refresh_offset(upload)
+                incomplete = [upload.id for upload in uploads if not upload.is_complete]
+                if incomplete:
+                    return Response(
+                        data={
+                            "error": "Файлы загружены не полностью",
+                            "uploads": incomplete,
+                        },
+                        status=status.HTTP_409_CONFLICT,
+                    )
+
+                staged = [
+                    {"path": upload.path, "name": upload.filename} for upload in uploads
+                ]
+                try:
+                    validate_staged(staged)
+                except InvalidImageError as ex:
+                    return Response(
+                        data={"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST
+                    )
+                if is_async_upload(request):
+                    job = process_upload.enqueue(
+                        files=staged,
+                        description=description,
+                        categories=categories,
+                        created_by_id=request.user.id,
+                        created_by=request.user,
+                    )
+                else:
+                    photos = create_staged_photos(
+                        staged,
+                        description=description,
+                        categories=categories,
+                        created_by_id=request.user.id,
+                        uploaded=uploaded,
+                    )
+                PhotoUpload.objects.filter(id__in=upload_ids).delete()
+        except Exception:
+            for photo in uploaded:
+                photo.image.delete(save=False)
+            raise
+
+        if job is not None:
+            return get_job_response(request, job)
+        return get_photos_response(request, photos)
+
+
 @extend_schema(tags=["Галерея"])
 class PhotoCategoryListCreateAPIView(ListCreateAPIView):
     model = PhotoCategory
@@ -121,3 +533,62 @@ class PhotoCategoryRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
 
     def get_queryset(self):
         return PhotoCategory.objects.all()
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoCategoryExportAPIView(APIView):
+    permission_classes = [GalleryPermission]
+
+    @extend_schema(tags=["Галерея"], summary="ZIP-архив всех фотографий категории")
+    def get(self, request, *args, **kwargs):
+        category = PhotoCategory.objects.filter(pk=kwargs["pk"]).first()
+        if category is None:
+            return Response(
+                data={"error": "Категория не найдена"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return get_zip_response(category.photos.all(), category.name)
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoTimelineAPIView(APIView):
+    """Количество фотографий по годам и месяцам съёмки.
+
+    cursor месяца передаётся в GET /gallery/?order=captured&cursor=...,
+    чтобы открыть список с первой фотографии месяца.
+    """
+
+    permission_classes = [GalleryPermission]
+
+    @extend_schema(tags=["Галерея"], summary="Лента фотографий по месяцам")
+    def get(self, request, *args, **kwargs):
+        return Response(data=get_timeline())
+
+
+@extend_schema(tags=["Галерея"])
+class PhotoBatchAPIView(APIView):
+    """Действие сразу с несколькими фотографиями в одной транзакции:
+    delete, set_categories, attach и detach (альбомы лошадей)."""
+
+    permission_classes = [IsAuthenticated, GalleryPermission]
+
+    @extend_schema(
+        tags=["Галерея"],
+        summary="Действие с несколькими фотографиями",
+        request=PhotoBatchSerializer,
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = PhotoBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        _, permission = BATCH_ACTIONS[data["action"]]
+        if permission and not user_has_perm(request.user, permission):
+            return Response(
+                data={"error": "Недостаточно прав для действия"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        try:
+            result = run_action(data["action"], data["photos"], data)
+        except ValueError as ex:
+            return Response(data={"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data=result)
@@ -4,3 +4,31 @@ from django.apps import AppConfig
 class HorsesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "horses"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, pre_delete
+
+        from gallery.batch import register_action
+        from gallery.models import Photo
+        from gallery.signals import post_photos_delete, pre_photos_delete
+        from profile_management.permissions import register_claim_permissions
+
+        from .models import (
+            attach_photos,
+            detach_photos,
+            remember_batch_covered_horses,
+            remember_covered_horses,
+            update_batch_deleted_covers,
+            update_deleted_covers,
+        )
+        from .resolvers import breed_resolver, owner_resolver
+
+        breed_resolver.connect()
+        owner_resolver.connect()
+        pre_delete.connect(remember_covered_horses, sender=Photo)
+        post_delete.connect(update_deleted_covers, sender=Photo)
+        pre_photos_delete.connect(remember_batch_covered_horses, sender=Photo)
+        post_photos_delete.connect(update_batch_deleted_covers, sender=Photo)
+        register_claim_permissions("horses.change_horse")
+        register_action("attach", attach_photos, permission="horses.change_horse")
+        register_action("detach", detach_photos, permission="horses.change_horse")
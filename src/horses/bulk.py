@@ -0,0 +1,396 @@
+import copy
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from gallery.models import Photo
+
+from .models import Horse
+from .resolvers import breed_resolver, owner_resolver
+from .serializers import HorseBulkItemSerializer
+from .validators import CYCLE_ERROR, PARENT_SEXES, get_parent_links, validate_parent
+
+HORSE_BULK_FIELDS = [
+    "name",
+    "sex",
+    "kind",
+    "bdate",
+    "bdate_mode",
+    "ddate",
+    "ddate_mode",
+    "description",
+]
+
+REF_ERROR = "Лошадь с этим ref не сохранена из-за ошибок"
+
+
+def find_cycle_components(nodes, get_parents) -> dict:
+    """Узлы, лежащие на циклах графа, с номером их компоненты сильной
+    связности (алгоритм Тарьяна без рекурсии)."""
+    order = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = {}
+
+    def visit(node):
+        order[node] = low[node] = len(order)
+        stack.append(node)
+        on_stack.add(node)
+        work.append((node, iter(get_parents(node))))
+
+    for root in nodes:
+        if root in order:
+            continue
+        work = []
+        visit(root)
+        while work:
+            node, parents = work[-1]
+            for parent in parents:
+                if parent not in order:
+                    visit(parent)
+                    break
+                if parent in on_stack:
+                    low[node] = min(low[node], order[parent])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] != order[node]:
+                    continue
+                component = []
+                while not component or component[-1] != node:
+                    component.append(stack.pop())
+                    on_stack.discard(component[-1])
+                if len(component) > 1:
+                    for item in component:
+                        components[item] = order[node]
+    return components
+
+
+class HorseBulkWriter:
+    max_items = 10000
+    batch_size = 1000
+
+    def __init__(self, items: list, user=None):
+        self.items = items
+        self.user = user if user is not None and user.is_authenticated else None
+        self.data: dict[int, dict] = {}
+        self.errors: dict[int, dict] = {}
+        self.refs: dict[str, int] = {}
+        self.existing: dict[int, Horse] = {}
+        # Элементы, ссылающиеся через ref на элемент с данным индексом
+        self.dependents: dict[int, list[tuple[int, str]]] = {}
+
+    def add_error(self, index: int, field: str, message: str) -> None:
+        self.data.pop(index, None)
+        self.errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+    def save(self) -> dict:
+        self.validate_items()
+        self.load_existing_horses()
+        breeds = self.resolve_related(breed_resolver, "breed")
+        owners = self.resolve_related(owner_resolver, "owner")
+        self.validate_photos()
+        self.validate_parents()
+
+        if not self.data:
+            return self.get_result({})
+
+        with transaction.atomic():
+            horses = self.write_horses(
+                self.create_missing(breed_resolver, "breed", breeds),
+                self.create_missing(owner_resolver, "owner", owners),
+            )
+            self.write_parents(horses)
+            self.write_photos(horses)
+
+        cache.delete_many(
+            [
+                f"horse_{horse_id}_{key}"
+                for horse_id in self.existing
+                for key in ("sire", "dame", "photos")
+            ]
+        )
+        return self.get_result(horses)
+
+    def validate_items(self) -> None:
+        # Поля сериализатора копируются при каждом создании экземпляра,
+        # поэтому один экземпляр переиспользуется для всех элементов
+        serializers = {
+            False: HorseBulkItemSerializer(),
+            True: HorseBulkItemSerializer(partial=True),
+        }
+        for index, item in enumerate(self.items):
+            if not isinstance(item, dict):
+                self.add_error(index, "non_field_errors", "Ожидается объект")
+                continue
+            try:
+                self.data[index] = serializers["id" in item].run_validation(item)
+            except ValidationError as ex:
+                self.errors[index] = ex.detail
+
+        updated_ids = set()
+        for index, data in list(self.data.items()):
+            if "id" in data:
+                if data["id"] in updated_ids:
+                    self.add_error(index, "id", "Лошадь уже изменяется в запросе")
+                    continue
+                updated_ids.add(data["id"])
+            ref = data.get("ref")
+            if ref is None:
+                continue
+            if ref in self.refs:
+                self.add_error(index, "ref", "Повторяющийся ref")
+            else:
+                self.refs[ref] = index
+
+    def load_existing_horses(self) -> None:
+        horse_ids = set()
+        for data in self.data.values():
+            if "id" in data:
+                horse_ids.add(data["id"])
+            for field in PARENT_SEXES:
+                if isinstance(data.get(field), int):
+                    horse_ids.add(data[field])
+
+        self.existing = Horse.objects.in_bulk(horse_ids)
+
+        for index, data in list(self.data.items()):
+            if "id" in data and data["id"] not in self.existing:
+                self.add_error(index, "id", "Лошадь не найдена")
+
+    def resolve_related(self, resolver, field: str) -> dict:
+        resolved = resolver.resolve_many(data.get(field) for data in self.data.values())
+        for index, data in list(self.data.items()):
+            value = data.get(field)
+            if isinstance(value, int) and value not in resolved:
+                self.add_error(index, field, "Не найдено")
+        return resolved
+
+    def validate_photos(self) -> None:
+        photo_ids = {pk for data in self.data.values() for pk in data.get("photos", [])}
+        existing = set(
+            Photo.objects.filter(id__in=photo_ids).values_list("id", flat=True)
+        )
+        for index, data in list(self.data.items()):
+            if set(data.get("photos", [])) - existing:
+                self.add_error(index, "photos", "Некоторые фотографии не найдены")
+
+    def build_horse(self, data: dict) -> Horse:
+        # Лошадь элемента с новыми значениями полей, без сохранения
+        horse = copy.copy(self.existing[data["id"]]) if "id" in data else Horse()
+        for field in HORSE_BULK_FIELDS:
+            if field in data:
+                setattr(horse, field, data[field])
+        return horse
+
+    def validate_parents(self) -> None:
+        """Проверяет родителей как validate_sire/validate_dame: пол,
+        совпадение с ребёнком, даты и отсутствие циклов в родословной
+        с учётом связей, задаваемых в запросе."""
+        horses = {index: self.build_horse(data) for index, data in self.data.items()}
+        index_by_id = {
+            data["id"]: index for index, data in self.data.items() if "id" in data
+        }
+        # Родитель - id лошади из базы или индекс элемента запроса (по ref)
+        edges: dict[int, dict[str, int | tuple]] = {}
+
+        for index, data in list(self.data.items()):
+            for field in PARENT_SEXES:
+                value = data.get(field)
+                if value is None:
+                    continue
+                if isinstance(value, str):
+                    parent_index = self.refs.get(value)
+                    if parent_index is None:
+                        self.add_error(index, field, "Лошадь не найдена")
+                        continue
+                    self.dependents.setdefault(parent_index, []).append((index, field))
+                    if parent_index not in horses:
+                        continue
+                    node = ("item", parent_index)
+                    parent = horses[parent_index]
+                elif value in self.existing:
+                    node = value
+                    parent = horses.get(index_by_id.get(value), self.existing[value])
+                else:
+                    self.add_error(index, field, "Лошадь не найдена")
+                    continue
+                try:
+                    validate_parent(horses[index], parent, field)
+                except DjangoValidationError as ex:
+                    self.add_error(index, field, ex.message)
+                    continue
+                edges.setdefault(index, {})[field] = node
+
+        self.propagate_errors()
+        self.validate_cycles(edges)
+        self.propagate_errors()
+
+    def validate_cycles(self, edges: dict[int, dict[str, int | tuple]]) -> None:
+        # Лошади запроса - узлы ("item", индекс), остальные - id из базы
+        index_by_id = {
+            data["id"]: index for index, data in self.data.items() if "id" in data
+        }
+        links = get_parent_links(
+            set(index_by_id)
+            | {
+                node
+                for nodes in edges.values()
+                for node in nodes.values()
+                if isinstance(node, int)
+            }
+        )
+
+        def get_node(node):
+            if isinstance(node, int) and node in index_by_id:
+                return ("item", index_by_id[node])
+            return node
+
+        def get_db_parents(horse_id: int, fields):
+            sexes = {sex for field in fields for sex in PARENT_SEXES[field]}
+            return [
+                get_node(parent_id)
+                for parent_id, sex in links.get(horse_id, ())
+                if sex in sexes
+            ]
+
+        def get_parents(node):
+            if isinstance(node, int):
+                return get_db_parents(node, PARENT_SEXES)
+            data = self.data[node[1]]
+            parents = [get_node(parent) for parent in edges.get(node[1], {}).values()]
+            kept = [field for field in PARENT_SEXES if field not in data]
+            if kept and "id" in data:
+                parents += get_db_parents(data["id"], kept)
+            return parents
+
+        edges = {index: nodes for index, nodes in edges.items() if index in self.data}
+        components = find_cycle_components(
+            [("item", index) for index in edges], get_parents
+        )
+        for index, nodes in edges.items():
+            component = components.get(("item", index))
+            if component is None:
+                continue
+            for field, node in nodes.items():
+                if components.get(get_node(node)) == component:
+                    self.add_error(index, field, CYCLE_ERROR)
+
+    def propagate_errors(self) -> None:
+        # Ошибка в одной лошади делает недействительными ссылки на неё
+        queue = [index for index in self.dependents if index not in self.data]
+        while queue:
+            for index, field in self.dependents.pop(queue.pop(), ()):
+                if index in self.data:
+                    self.add_error(index, field, REF_ERROR)
+                    queue.append(index)
+
+    def create_missing(self, resolver, field: str, resolved: dict) -> dict:
+        missing = {
+            data[field]
+            for data in self.data.values()
+            if data.get(field) is not None and data[field] not in resolved
+        }
+        resolved.update(resolver.resolve_many(missing, create=True))
+        return resolved
+
+    def write_horses(self, breeds: dict, owners: dict) -> dict[int, Horse]:
+        horses = {}
+        new_horses = []
+        updated_horses = []
+        for index, data in self.data.items():
+            if "id" in data:
+                horse = self.existing[data["id"]]
+                updated_horses.append(horse)
+            else:
+                horse = Horse(created_by=self.user)
+                new_horses.append(horse)
+
+            for field in HORSE_BULK_FIELDS:
+                if field in data:
+                    setattr(horse, field, data[field])
+            if "breed" in data:
+                horse.breed_id = breeds.get(data["breed"])
+            if "owner" in data:
+                horse.owner_id = owners.get(data["owner"])
+            horses[index] = horse
+
+        Horse.objects.bulk_create(new_horses, batch_size=self.batch_size)
+        if updated_horses:
+            Horse.objects.bulk_update(
+                updated_horses,
+                HORSE_BULK_FIELDS + ["breed", "owner"],
+                batch_size=self.batch_size,
+            )
+        return horses
+
+    def write_parents(self, horses: dict[int, Horse]) -> None:
+        through = Horse.children.through
+        links = []
+        replaced = {field: [] for field in PARENT_SEXES}
+
+        for index, data in self.data.items():
+            child = horses[index]
+            for field in PARENT_SEXES:
+                if field not in data:
+                    continue
+                if child.id in self.existing:
+                    replaced[field].append(child.id)
+                value = data[field]
+                if value is None:
+                    continue
+                parent_id = (
+                    value if isinstance(value, int) else horses[self.refs[value]].id
+                )
+                links.append(through(from_horse_id=parent_id, to_horse_id=child.id))
+
+        for field, child_ids in replaced.items():
+            if child_ids:
+                through.objects.filter(
+                    to_horse_id__in=child_ids, from_horse__sex__in=PARENT_SEXES[field]
+                ).delete()
+
+        through.objects.bulk_create(
+            links, batch_size=self.batch_size, ignore_conflicts=True
+        )
+
+    def write_photos(self, horses: dict[int, Horse]) -> None:
+        through = Horse.photos.through
+        through.objects.bulk_create(
+            [
+                through(horse_id=horses[index].id, photo_id=photo_id, position=position)
+                for index, data in self.data.items()
+                for position, photo_id in enumerate(data.get("photos", []))
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        horse_ids = [
+            horses[index].id for index, data in self.data.items() if data.get("photos")
+        ]
+        for start in range(0, len(horse_ids), self.batch_size):
+            Horse.objects.filter(
+                id__in=horse_ids[start : start + self.batch_size]
+            ).update_covers()
+
+    def get_result(self, horses: dict[int, Horse]) -> dict:
+        created = []
+        updated = []
+        for index, horse in horses.items():
+            item = {"index": index, "id": horse.id, "ref": self.data[index].get("ref")}
+            if "id" in self.data[index]:
+                updated.append(item)
+            else:
+                created.append(item)
+        return {
+            "created": created,
+            "updated": updated,
+            "errors": [
+                {"index": index, "errors": errors}
+                for index, errors in sorted(self.errors.items())
+            ],
+        }
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from horses.studbook import StudbookImporter, StudbookImportError
+
+
+class Command(BaseCommand):
+    help = "This command will import horses and pedigree from CSV/XLSX studbook"
+
+    def handle(self, *args, **kwargs):
+        try:
+            with open(kwargs["path"], "rb") as file:
+                importer = StudbookImporter(
+                    file, file_format=kwargs["format"], progress=self.print_progress
+                )
+                importer.batch_size = int(kwargs["batch_size"])
+                result = importer.run()
+        except (OSError, StudbookImportError) as ex:
+            raise CommandError(ex)
+
+        for error in result["errors"]:
+            messages = "; ".join(
+                f"{field}: {', '.join(map(str, field_errors))}"
+                for field, field_errors in error["errors"].items()
+            )
+            self.stderr.write(f"Строка {error['row']}: {messages}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Строк: {result['rows']}, добавлено лошадей: {result['created']}, "
+                f"обновлено: {result['updated']}, "
+                f"связей с родителями: {result['linked']}, "
+                f"ошибок: {result['errors_count']}"
+            )
+        )
+
+    def print_progress(self, stage, rows, count):
+        if stage == "horses":
+            self.stdout.write(
+                f"Обработано строк: {rows}, добавлено и обновлено лошадей: {count}"
+            )
+        else:
+            self.stdout.write(f"Связей с родителями: {count}")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV или XLSX")
+        parser.add_argument(
+            "-f",
+            "--format",
+            action="store",
+            default=None,
+            choices=["csv", "xlsx"],
+            help="Формат файла (по умолчанию по расширению)",
+        )
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            action="store",
+            default=StudbookImporter.batch_size,
+            help="Количество строк в одной транзакции",
+        )
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+def clean_name(value) -> str:
+    return " ".join(str(value).split())
+
+
+def merge_duplicates(apps, schema_editor):
+    # Записи с одинаковым наименованием (без учёта регистра и пробелов)
+    # объединяются в запись с наименьшим id
+    Horse = apps.get_model("horses", "Horse")
+    for model_name, field in (("Breed", "breed"), ("HorseOwner", "owner")):
+        model = apps.get_model("horses", model_name)
+        kept = {}
+        duplicates = {}
+        for obj in model.objects.order_by("id"):
+            obj.name = clean_name(obj.name)
+            obj.normalized_name = obj.name.lower()
+            original = kept.setdefault(obj.normalized_name, obj)
+            if original is not obj:
+                duplicates.setdefault(original.id, []).append(obj.id)
+
+        for original_id, duplicate_ids in duplicates.items():
+            Horse.objects.filter(**{f"{field}_id__in": duplicate_ids}).update(
+                **{f"{field}_id": original_id}
+            )
+            model.objects.filter(id__in=duplicate_ids).delete()
+        model.objects.bulk_update(
+            kept.values(), ["name", "normalized_name"], batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("horses", "0007_alter_breed_description_alter_breed_name_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="breed",
+            name="normalized_name",
+            field=models.CharField(
+                editable=False,
+                max_length=50,
+                null=True,
+                verbose_name="Наименование для поиска",
+            ),
+        ),
+        migrations.AddField(
+            model_name="horseowner",
+            name="normalized_name",
+            field=models.CharField(
+                editable=False,
+                max_length=150,
+                null=True,
+                verbose_name="Наименование для поиска",
+            ),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("horses", "0008_breed_normalized_name_horseowner_normalized_name"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="breed",
+            name="normalized_name",
+            field=models.CharField(
+                editable=False,
+                max_length=50,
+                unique=True,
+                verbose_name="Наименование для поиска",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="horseowner",
+            name="normalized_name",
+            field=models.CharField(
+                editable=False,
+                max_length=150,
+                unique=True,
+                verbose_name="Наименование для поиска",
+            ),
+        ),
+    ]
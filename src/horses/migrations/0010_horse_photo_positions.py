@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0007_photo_list_indexes"),
+        ("horses", "0009_alter_breed_normalized_name_alter_horseowner_normalized_name"),
+    ]
+
+    operations = [
+        # Таблица horses_horse_photos уже создана для Horse.photos,
+        # меняется только описание модели
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="HorsePhoto",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "horse",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="photo_links",
+                                to="horses.horse",
+                            ),
+                        ),
+                        (
+                            "photo",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="horse_links",
+                                to="gallery.photo",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "Фотография лошади",
+                        "verbose_name_plural": "Фотографии лошадей",
+                        "db_table": "horses_horse_photos",
+                        "unique_together": {("horse", "photo")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="horse",
+                    name="photos",
+                    field=models.ManyToManyField(
+                        related_name="horses",
+                        through="horses.HorsePhoto",
+                        to="gallery.photo",
+                        verbose_name="Фотографии",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="horsephoto",
+            name="position",
+            field=models.PositiveIntegerField(default=0, verbose_name="Порядок"),
+        ),
+        migrations.AddIndex(
+            model_name="horsephoto",
+            index=models.Index(
+                fields=["horse", "position", "id"], name="horses_photo_position_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_cover_photo(apps, schema_editor):
+    Horse = apps.get_model("horses", "Horse")
+    HorsePhoto = apps.get_model("horses", "HorsePhoto")
+    first_photo = (
+        HorsePhoto.objects.filter(horse=OuterRef("pk"))
+        .order_by("position", "id")
+        .values("photo_id")[:1]
+    )
+    Horse.objects.update(cover_photo=Subquery(first_photo))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gallery", "0007_photo_list_indexes"),
+        ("horses", "0010_horse_photo_positions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="horse",
+            name="cover_photo",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="gallery.photo",
+                verbose_name="Обложка",
+            ),
+        ),
+        migrations.RunPython(fill_cover_photo, migrations.RunPython.noop),
+    ]
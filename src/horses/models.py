@@ -6,10 +6,12 @@ from django.core.validators import (
     MinValueValidator,
 )
 from django.db import models
-from django.db.models import Prefetch
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from gallery.models import Photo
+from gallery.signals import is_batch_delete
 
 from .validators import validate_future_date
 
@@ -37,6 +39,96 @@ HORSE_OWNER_TYPE_CHOICES = [
 ]
 
 
+def clean_name(value) -> str:
+    return " ".join(str(value).split())
+
+
+def normalize_name(value) -> str:
+    return clean_name(value).lower()
+
+
+class HorseQuerySet(models.QuerySet):
+    # Максимальное количество SQL-запросов на загрузку и сериализацию
+    # лошадей каждым профилем. Бюджеты проверяются в horses/tests.py
+    QUERY_BUDGETS = {
+        "list": 3,  # count + лошади с породой, владельцем и обложкой + копии
+        "detail": 2,  # лошадь с породой, владельцем и обложкой + копии
+        "moderation": 0,  # создатель загружается тем же запросом
+        "pedigree": 2,  # дети с обложками + копии
+        "pedigree_level": 2,  # на каждое поколение: родители с обложками + копии
+    }
+
+    @classmethod
+    def get_query_budget(
+        cls, profile: str, pedigree: int | None = None, moderation: bool = False
+    ) -> int:
+        budget = cls.QUERY_BUDGETS[profile]
+        if pedigree:
+            budget += cls.QUERY_BUDGETS["pedigree"]
+            budget += cls.QUERY_BUDGETS["pedigree_level"] * pedigree
+        if moderation:
+            budget += cls.QUERY_BUDGETS["moderation"]
+        return budget
+
+    def with_photos_summary(self):
+        """Количество фотографий и обложка вместо всех фотографий, которые
+        отдаются /horses/<pk>/photos/. Обложка загружается тем же запросом."""
+        photos_count = (
+            HorsePhoto.objects.filter(horse=OuterRef("pk"))
+            .order_by()
+            .values("horse")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return (
+            self.annotate(photos_count=Coalesce(Subquery(photos_count), Value(0)))
+            .select_related("cover_photo")
+            .prefetch_related("cover_photo__variants")
+        )
+
+    def update_covers(self) -> int:
+        """Записывает в cover_photo первую фотографию альбома (по position)
+        одним запросом для всех лошадей queryset."""
+        first_photo = (
+            HorsePhoto.objects.filter(horse=OuterRef("pk"))
+            .order_by("position", "id")
+            .values("photo_id")[:1]
+        )
+        return self.update(cover_photo=Subquery(first_photo))
+
+    def with_main_info(self):
+        return self.select_related("breed").with_photos_summary()
+
+    def for_list(self):
+        return (
+            self.annotate(children_count=models.Count("children", distinct=True))
+            .select_related("breed", "owner")
+            .with_photos_summary()
+        )
+
+    def for_detail(self):
+        return self.select_related("breed", "owner").with_photos_summary()
+
+    def for_pedigree(self, depth: int):
+        return self.prefetch_related(
+            Prefetch(
+                "children",
+                queryset=self.model.objects.with_main_info(),
+                to_attr="prefetched_children",
+            ),
+            self._get_parents_prefetch(depth),
+        )
+
+    def for_moderation(self):
+        return self.select_related("created_by")
+
+    def _get_parents_prefetch(self, depth: int) -> Prefetch:
+        queryset = self.model.objects.with_main_info()
+        if depth > 1:
+            queryset = queryset.prefetch_related(self._get_parents_prefetch(depth - 1))
+        return Prefetch("parents", queryset=queryset, to_attr="prefetched_parents")
+
+
 class Horse(models.Model):
     name: models.CharField = models.CharField(
         verbose_name="Кличка",
@@ -107,7 +199,19 @@ class Horse(models.Model):
         to="horses.Horse", verbose_name="Дети", related_name="parents"
     )
     photos: models.ManyToManyField = models.ManyToManyField(
-        to="gallery.Photo", verbose_name="Фотографии", related_name="horses"
+        to="gallery.Photo",
+        verbose_name="Фотографии",
+        related_name="horses",
+        through="horses.HorsePhoto",
+    )
+    cover_photo: models.ForeignKey = models.ForeignKey(
+        to="gallery.Photo",
+        verbose_name="Обложка",
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        on_delete=models.SET_NULL,
     )
     owner: models.ForeignKey = models.ForeignKey(
         to="horses.HorseOwner",
@@ -131,6 +235,8 @@ class Horse(models.Model):
         on_delete=models.SET_NULL,
     )
 
+    objects = HorseQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Лошадь"
         verbose_name_plural = "Лошади"
@@ -147,6 +253,17 @@ class Horse(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Обложку меняют только методы HorsePhoto, поэтому при сохранении
+        # загруженной ранее лошади она не перезаписывается старым значением
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "cover_photo"
+            ]
+        return super().save(*args, **kwargs)
+
     def get_pedigree(self, count=3, serializer=None):
         def build_pedigree_tree(horse, current_depth, max_depth):
             if horse is None or serializer is None or current_depth >= max_depth:
@@ -174,33 +291,30 @@ class Horse(models.Model):
         }
         return pedigree_data
 
-    def set_breed(self, breed: str):
-        if breed == "none":
-            self.breed = None
-            self.save()
-            return None
-        try:
-            breed_id = int(breed)
-            breed = Breed.objects.get(id=breed_id)
-        except ValueError:
-            breed = Breed.objects.get_or_create(name=breed)[0]
-        except Breed.DoesNotExist:
-            breed = None
-        self.breed = breed
-        self.save()
-        return None
-
     def set_photos(self, photos: list[int] | None = None, mode: str = "add") -> None:
+        # Меняется только альбом лошади, сами фотографии остаются в галерее
         if photos is None:
             return None
         if mode == "remove":
-            self.photos.filter(id__in=photos).delete()
+            HorsePhoto.remove(self.id, photos)
             return None
         if mode == "replace":
-            self.photos.all().delete()
-        self.photos.add(*photos)
+            HorsePhoto.objects.filter(horse_id=self.id).delete()
+        HorsePhoto.append(self.id, photos)
+        if mode == "replace":
+            Horse.objects.filter(id=self.id).update_covers()
         return None
 
+    @property
+    def cover(self) -> Photo | None:
+        return self.cover_photo
+
+    def get_photos_count(self) -> int:
+        photos_count = getattr(self, "photos_count", None)
+        if photos_count is None:
+            photos_count = self.photo_links.count()
+        return photos_count
+
     @staticmethod
     def _get_strformat(mode: int) -> str:
         if mode == DATE_MODE_CHOICES[1][0]:
@@ -210,80 +324,50 @@ class Horse(models.Model):
         return "%d.%m.%Y"
 
     def get_sire(self, prefetch_parents=False):
+        if hasattr(self, "prefetched_parents"):
+            sire = list(filter(lambda parent: parent.sex == 0, self.prefetched_parents))
+            return sire[0] if sire else None
+
         cache_key = f"horse_{self.id}_sire"
         sire = cache.get(cache_key)
         if sire:
             return sire
 
-        if hasattr(self, "prefetched_parents"):
-            sire = list(filter(lambda parent: parent.sex == 0, self.prefetched_parents))
-            if sire:
-                cache.set(cache_key, sire[0], timeout=60 * 15)
-                return sire[0]
-            return None
-
-        photos_prefetch = Prefetch(
-            "photos", queryset=Photo.objects.all(), to_attr="prefetched_photos"
-        )
-
-        prefetch = [photos_prefetch]
-
+        sire = self.parents.filter(sex=0).with_main_info()
         if prefetch_parents:
-            prefetch_parents = Prefetch(
-                lookup="parents",
-                queryset=Horse.objects.select_related("breed").prefetch_related(
-                    "photos"
-                ),
-                to_attr="prefetched_parents",
+            sire = sire.prefetch_related(
+                Prefetch(
+                    lookup="parents",
+                    queryset=Horse.objects.with_main_info(),
+                    to_attr="prefetched_parents",
+                )
             )
-            prefetch.append(prefetch_parents)
-
-        sire = (
-            self.parents.filter(sex=0)
-            .select_related("breed")
-            .prefetch_related(*prefetch)
-            .first()
-        )
+        sire = sire.first()
         cache.set(cache_key, sire, timeout=60 * 15)
         return sire
 
     def get_dame(self, prefetch_parents=False):
-        cache_key = f"horse_{self.id}_dame"
-        dame = cache.get(cache_key)
-        if dame:
-            return dame
-
         if hasattr(self, "prefetched_parents"):
             dame = list(
                 filter(lambda parent: parent.sex in [1, 2], self.prefetched_parents)
             )
-            if dame:
-                cache.set(cache_key, dame[0], timeout=60 * 15)
-                return dame[0]
-            return None
-
-        photos_prefetch = Prefetch(
-            "photos", queryset=Photo.objects.all(), to_attr="prefetched_photos"
-        )
+            return dame[0] if dame else None
 
-        prefetch = [photos_prefetch]
+        cache_key = f"horse_{self.id}_dame"
+        dame = cache.get(cache_key)
+        if dame:
+            return dame
 
+        dame = self.parents.filter(sex__in=[1, 2]).with_main_info()
         if prefetch_parents:
-            prefetch_parents = Prefetch(
-                lookup="parents",
-                queryset=Horse.objects.select_related("breed").prefetch_related(
-                    "photos"
-                ),
-                to_attr="prefetched_parents",
+            dame = dame.prefetch_related(
+                Prefetch(
+                    lookup="parents",
+                    queryset=Horse.objects.with_main_info(),
+                    to_attr="prefetched_parents",
+                )
             )
-            prefetch.append(prefetch_parents)
-
-        dame = (
-            self.parents.filter(sex__in=[1, 2])
-            .select_related("breed")
-            .prefetch_related(*prefetch)
-            .first()
-        )
+        dame = dame.first()
         cache.set(cache_key, dame, timeout=60 * 15)
         return dame
 
@@ -307,6 +391,162 @@ class Horse(models.Model):
         return self.ddate.strftime(self._get_strformat(self.ddate_mode))
 
 
+class HorsePhoto(models.Model):
+    """Фотография в альбоме лошади (таблица, ранее созданная Django для
+    Horse.photos). Порядок фотографий задаётся position, при равных
+    position - порядком добавления. Первая фотография альбома хранится
+    в Horse.cover_photo, методы изменения альбома обновляют её."""
+
+    horse: models.ForeignKey = models.ForeignKey(
+        to="horses.Horse", related_name="photo_links", on_delete=models.CASCADE
+    )
+    photo: models.ForeignKey = models.ForeignKey(
+        to="gallery.Photo", related_name="horse_links", on_delete=models.CASCADE
+    )
+    position: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Порядок", default=0
+    )
+
+    class Meta:
+        db_table = "horses_horse_photos"
+        verbose_name = "Фотография лошади"
+        verbose_name_plural = "Фотографии лошадей"
+        unique_together = [("horse", "photo")]
+        indexes = [
+            models.Index(
+                fields=["horse", "position", "id"], name="horses_photo_position_idx"
+            ),
+        ]
+
+    @classmethod
+    def append(cls, horse_id: int, photo_ids: list[int]) -> int:
+        """Добавляет фотографии в конец альбома одним запросом,
+        уже добавленные фотографии пропускаются."""
+        return cls.append_many([horse_id], photo_ids)
+
+    @classmethod
+    def append_many(cls, horse_ids: list[int], photo_ids: list[int]) -> int:
+        """Добавляет фотографии в конец альбомов нескольких лошадей.
+
+        Последние позиции всех альбомов читаются одним запросом, связи
+        создаются пачками. Возвращает количество переданных в запрос связей.
+        """
+        last = dict(
+            cls.objects.filter(horse_id__in=horse_ids)
+            .values("horse_id")
+            .annotate(position=models.Max("position"))
+            .values_list("horse_id", "position")
+        )
+        links = [
+            cls(
+                horse_id=horse_id,
+                photo_id=photo_id,
+                position=last.get(horse_id, -1) + 1 + index,
+            )
+            for horse_id in dict.fromkeys(horse_ids)
+            for index, photo_id in enumerate(dict.fromkeys(photo_ids))
+        ]
+        cls.objects.bulk_create(links, ignore_conflicts=True, batch_size=1000)
+        Horse.objects.filter(id__in=horse_ids, cover_photo__isnull=True).update_covers()
+        return len(links)
+
+    @classmethod
+    def remove(cls, horse_id: int, photo_ids: list[int]) -> int:
+        return cls.remove_many(photo_ids, [horse_id])
+
+    @classmethod
+    def remove_many(
+        cls, photo_ids: list[int], horse_ids: list[int] | None = None
+    ) -> int:
+        """Убирает фотографии из альбомов horse_ids (без них - из всех)."""
+        links = cls.objects.filter(photo_id__in=photo_ids)
+        covered = Horse.objects.filter(cover_photo_id__in=photo_ids)
+        if horse_ids is not None:
+            links = links.filter(horse_id__in=horse_ids)
+            covered = covered.filter(id__in=horse_ids)
+        deleted, _ = links.delete()
+        if deleted:
+            # Обложка меняется только у лошадей, чья обложка убрана
+            covered.update_covers()
+        return deleted
+
+    @classmethod
+    def reorder(cls, horse_id: int, photo_ids: list[int]) -> None:
+        """Ставит photo_ids в начало альбома в заданном порядке, остальные
+        фотографии следуют за ними в прежнем порядке. Изменённые позиции
+        записываются одним запросом."""
+        order = {photo_id: index for index, photo_id in enumerate(photo_ids)}
+        links = list(
+            cls.objects.filter(horse_id=horse_id)
+            .order_by("position", "id")
+            .only("id", "photo_id", "position")
+        )
+        links.sort(key=lambda link: order.get(link.photo_id, len(order)))
+        changed = []
+        for position, link in enumerate(links):
+            if link.position != position:
+                link.position = position
+                changed.append(link)
+        cls.objects.bulk_update(changed, ["position"], batch_size=1000)
+        if changed:
+            Horse.objects.filter(id=horse_id).update_covers()
+
+
+def remember_covered_horses(sender, instance: Photo, **kwargs) -> None:
+    # При удалении фотографии-обложки cover_photo обнуляется, после удаления
+    # обложкой становится следующая фотография альбома
+    if is_batch_delete():
+        return
+    instance.covered_horse_ids = list(
+        Horse.objects.filter(cover_photo_id=instance.id).values_list("id", flat=True)
+    )
+
+
+def update_deleted_covers(sender, instance: Photo, **kwargs) -> None:
+    horse_ids = getattr(instance, "covered_horse_ids", None)
+    if horse_ids:
+        Horse.objects.filter(id__in=horse_ids).update_covers()
+
+
+def remember_batch_covered_horses(sender, photos: list[Photo], **kwargs) -> None:
+    # То же при удалении пачкой (gallery.batch): один запрос на все фотографии
+    covered = {}
+    for horse_id, photo_id in Horse.objects.filter(
+        cover_photo_id__in=[photo.id for photo in photos]
+    ).values_list("id", "cover_photo_id"):
+        covered.setdefault(photo_id, []).append(horse_id)
+    for photo in photos:
+        photo.covered_horse_ids = covered.get(photo.id, [])
+
+
+def update_batch_deleted_covers(sender, photos: list[Photo], **kwargs) -> None:
+    horse_ids = [
+        horse_id
+        for photo in photos
+        for horse_id in getattr(photo, "covered_horse_ids", None) or []
+    ]
+    if horse_ids:
+        Horse.objects.filter(id__in=horse_ids).update_covers()
+
+
+def get_batch_horse_ids(data: dict) -> list[int]:
+    horse_ids = data.get("horses")
+    if not horse_ids:
+        raise ValueError("Не указаны лошади horses")
+    return list(Horse.objects.filter(id__in=horse_ids).values_list("id", flat=True))
+
+
+def attach_photos(photo_ids: list[int], data: dict) -> int:
+    # Действие "attach" для /gallery/batch/, несуществующие лошади пропускаются
+    return HorsePhoto.append_many(get_batch_horse_ids(data), photo_ids)
+
+
+def detach_photos(photo_ids: list[int], data: dict) -> int:
+    # Действие "detach": без horses фотографии убираются из всех альбомов
+    horse_ids = get_batch_horse_ids(data) if data.get("horses") else None
+    return HorsePhoto.remove_many(photo_ids, horse_ids)
+
+
 class Breed(models.Model):
     name: models.CharField = models.CharField(
         verbose_name="Наименование",
@@ -315,6 +555,12 @@ class Breed(models.Model):
         max_length=50,
         validators=[MinLengthValidator(5), MaxLengthValidator(50)],
     )
+    normalized_name: models.CharField = models.CharField(
+        verbose_name="Наименование для поиска",
+        max_length=50,
+        unique=True,
+        editable=False,
+    )
     description: models.CharField = models.CharField(
         verbose_name="Описание",
         null=True,
@@ -331,6 +577,11 @@ class Breed(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name = clean_name(self.name)
+        self.normalized_name = normalize_name(self.name)
+        return super().save(*args, **kwargs)
+
 
 class HorseOwner(models.Model):
     name: models.CharField = models.CharField(
@@ -340,6 +591,12 @@ class HorseOwner(models.Model):
         max_length=150,
         validators=[MaxLengthValidator(150)],
     )
+    normalized_name: models.CharField = models.CharField(
+        verbose_name="Наименование для поиска",
+        max_length=150,
+        unique=True,
+        editable=False,
+    )
     description: models.CharField = models.CharField(
         verbose_name="Описание",
         null=True,
@@ -365,3 +622,8 @@ class HorseOwner(models.Model):
     phone_number: models.JSONField = models.JSONField(
         verbose_name="Номера телефонов", null=True, blank=True, default=list
     )
+
+    def save(self, *args, **kwargs):
+        self.name = clean_name(self.name)
+        self.normalized_name = normalize_name(self.name)
+        return super().save(*args, **kwargs)
@@ -1,6 +1,7 @@
 from rest_framework import permissions
 
 from profile_management.models import NewUser
+from profile_management.permissions import user_has_perm
 
 
 class HorsePermission(permissions.BasePermission):
@@ -13,4 +14,4 @@ class HorsePermission(permissions.BasePermission):
 
 
 def get_has_horses_moderate_permission(user: NewUser):
-    return bool(user.has_perm("horses.change_horse"))
+    return user_has_perm(user, "horses.change_horse")
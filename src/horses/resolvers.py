@@ -0,0 +1,133 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Breed, HorseOwner, clean_name, normalize_name
+
+
+class NameResolver:
+    """Кэш соответствия наименований и id в памяти процесса.
+
+    Наименования сравниваются без учёта регистра и лишних пробелов.
+    Изменение или удаление записи сразу сбрасывает кэш своего процесса
+    (и других процессов, если настроен общий кэш Django). Без общего кэша
+    другие процессы и runworker загружают наименования заново через
+    HORSE_NAMES_CACHE_TTL секунд.
+    """
+
+    batch_size = 1000
+
+    def __init__(self, model):
+        self.model = model
+        self.version_key = f"{model._meta.label_lower}_names_version"
+        self.version = None
+        self.names: dict[str, int] = {}
+        self.ids: set[int] = set()
+        self.cleared_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def connect(self) -> None:
+        for signal in (post_save, post_delete):
+            signal.connect(
+                self.invalidate,
+                sender=self.model,
+                weak=False,
+                dispatch_uid=f"{self.version_key}_{signal is post_save}",
+            )
+
+    def invalidate(self, **kwargs) -> None:
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+        self.clear()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.names = {}
+            self.ids = set()
+            self.version = cache.get(self.version_key)
+            self.cleared_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        ttl = getattr(settings, "HORSE_NAMES_CACHE_TTL", 60)
+        return (
+            time.monotonic() - self.cleared_at > ttl
+            or cache.get(self.version_key) != self.version
+        )
+
+    def remember(self, names: dict[str, int]) -> None:
+        with self.lock:
+            self.names.update(names)
+            self.ids.update(names.values())
+
+    def resolve(self, value, create: bool = False) -> int | None:
+        if value is None:
+            return None
+        return self.resolve_many([value], create=create).get(value)
+
+    def resolve_many(self, values, create: bool = False) -> dict:
+        """Возвращает {значение: id} для найденных id и наименований.
+
+        При create=True отсутствующие наименования добавляются одним
+        запросом, повторы наименований не создают дубликатов.
+        """
+        if self.is_stale():
+            self.clear()
+
+        values = {value for value in values if value is not None}
+        ids = {value for value in values if isinstance(value, int)}
+        names = {value: normalize_name(value) for value in values - ids}
+        keys = {key: value for value, key in names.items()}
+
+        missing_ids = ids - self.ids
+        if missing_ids:
+            found = self.model.objects.filter(id__in=missing_ids).values_list(
+                "id", flat=True
+            )
+            with self.lock:
+                self.ids.update(found)
+
+        found = {key: self.names[key] for key in keys if key in self.names}
+        missing = [key for key in keys if key not in found]
+        if missing:
+            loaded = self.fetch(missing)
+            self.remember(loaded)
+            found.update(loaded)
+
+        missing = [key for key in keys if key not in found]
+        if missing and create:
+            self.model.objects.bulk_create(
+                [
+                    self.model(name=clean_name(keys[key]), normalized_name=key)
+                    for key in missing
+                ],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            # Созданные записи попадают в кэш только после фиксации транзакции
+            created = self.fetch(missing)
+            transaction.on_commit(lambda: self.remember(created))
+            found.update(created)
+
+        resolved = {pk: pk for pk in ids & self.ids}
+        for value, key in names.items():
+            if key in found:
+                resolved[value] = found[key]
+        return resolved
+
+    def fetch(self, keys: list[str]) -> dict[str, int]:
+        names = {}
+        for start in range(0, len(keys), self.batch_size):
+            names.update(
+                self.model.objects.filter(
+                    normalized_name__in=keys[start : start + self.batch_size]
+                ).values_list("normalized_name", "id")
+            )
+        return names
+
+
+breed_resolver = NameResolver(Breed)
+owner_resolver = NameResolver(HorseOwner)
@@ -1,16 +1,39 @@
 from datetime import datetime
 
-from django.core.cache import cache
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from gallery.ingest import InvalidImageError, validate_images
 from gallery.models import Photo
 from gallery.serializers import PhotoMainInfoSerializer
+from gallery.uploads import delete_staged, is_async_upload, stage_files
 from profile_management.serializers import UserNameOnlySerializer
 
-from .models import Breed, Horse, HorseOwner
-from .validators import validate_phone_numbers
+from .models import (
+    DATE_MODE_CHOICES,
+    KIND_CHOICES,
+    SEX_CHOICES,
+    Breed,
+    Horse,
+    HorseOwner,
+    HorsePhoto,
+    normalize_name,
+)
+from .resolvers import breed_resolver, owner_resolver
+from .tasks import attach_photos
+from .validators import validate_future_date, validate_phone_numbers
+
+
+def get_pedigree_depth(request) -> int | None:
+    pedigree = None if request is None else request.query_params.get("pedigree")
+    try:
+        pedigree = int(pedigree)
+    except (TypeError, ValueError):
+        return None
+    return min(max(pedigree, 1), 5)
 
 
 class HorseOwnerNameOnlySerializer(serializers.ModelSerializer):
@@ -30,6 +53,14 @@ class HorseOwnerSerializer(serializers.ModelSerializer):
     def get_phone_number(obj):
         return obj.phone_number
 
+    def validate_name(self, value):
+        queryset = HorseOwner.objects.filter(normalized_name=normalize_name(value))
+        if self.instance is not None:
+            queryset = queryset.exclude(id=self.instance.id)
+        if queryset.exists():
+            raise ValidationError("Владелец с таким наименованием уже существует")
+        return value
+
     def create(self, validated_data):
         phone_numbers = self.context.get("request").POST.getlist("phone_number[]")
         if phone_numbers:
@@ -60,6 +91,14 @@ class BreedSerializer(serializers.ModelSerializer):
         model = Breed
         fields = ["id", "name", "description"]
 
+    def validate_name(self, value):
+        queryset = Breed.objects.filter(normalized_name=normalize_name(value))
+        if self.instance is not None:
+            queryset = queryset.exclude(id=self.instance.id)
+        if queryset.exists():
+            raise ValidationError("Порода с таким наименованием уже существует")
+        return value
+
 
 class BreedNameOnlySerializer(serializers.ModelSerializer):
     class Meta:
@@ -67,9 +106,25 @@ class BreedNameOnlySerializer(serializers.ModelSerializer):
         fields = ["id", "name"]
 
 
+class HorseCoverField(serializers.Field):
+    """Обложка альбома лошади, все фотографии отдаются /horses/<pk>/photos/."""
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, horse: Horse):
+        cover = horse.cover
+        if cover is None:
+            return None
+        return PhotoMainInfoSerializer(cover, context=self.context).data
+
+
 class HorseMainInfoSerializer(serializers.ModelSerializer):
     breed = BreedNameOnlySerializer()
-    photos = serializers.SerializerMethodField()
+    cover = HorseCoverField()
+    photos_count = serializers.IntegerField(source="get_photos_count", read_only=True)
 
     class Meta:
         model = Horse
@@ -82,24 +137,21 @@ class HorseMainInfoSerializer(serializers.ModelSerializer):
             "ddate_formatted",
             "description",
             "age",
-            "photos",
+            "cover",
+            "photos_count",
         ]
 
-    def get_photos(self, obj):
-        cache_key = f"horse_{obj.id}_photos"
-        photos = cache.get(cache_key)
-        if photos:
-            return PhotoMainInfoSerializer(photos, many=True).data
-        photos = getattr(obj, "prefetched_photos", None)
-        if photos is None:
-            photos = obj.photos.all()
-        cache.set(cache_key, photos, timeout=60 * 15)
-        return PhotoMainInfoSerializer(photos, many=True).data
+
+class HorsePhotosSerializer(serializers.Serializer):
+    photos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=1000
+    )
 
 
 class HorseSerializer(serializers.ModelSerializer):
     breed = BreedNameOnlySerializer(read_only=True)
-    photos = PhotoMainInfoSerializer(many=True, read_only=True)
+    cover = HorseCoverField()
+    photos_count = serializers.IntegerField(source="get_photos_count", read_only=True)
     owner = HorseOwnerNameOnlySerializer(read_only=True)
 
     class Meta:
@@ -115,24 +167,14 @@ class HorseSerializer(serializers.ModelSerializer):
             "owner",
             "bdate_formatted",
             "ddate_formatted",
-            "photos",
+            "cover",
+            "photos_count",
         ]
 
     def to_representation(self, instance: Horse):
         data = super().to_representation(instance)
 
-        request = self.context.get("request")
-        pedigree = (
-            None if request is None else request.query_params.get("pedigree", None)
-        )
-        try:
-            pedigree = int(pedigree)
-            if pedigree < 1:
-                pedigree = 1
-            elif pedigree > 5:
-                pedigree = 5
-        except (TypeError, ValueError):
-            pedigree = None
+        pedigree = get_pedigree_depth(self.context.get("request"))
 
         if self.context.get("has_moderate_access", False):
             data["bdate"] = instance.bdate
@@ -156,58 +198,165 @@ class HorseSerializer(serializers.ModelSerializer):
     def get_children(obj: Horse):
         children = getattr(obj, "prefetched_children", None)
         if children is None:
-            children = obj.children.select_related("breed").prefetch_related("photos")
+            children = obj.children.with_main_info()
 
         return HorseMainInfoSerializer(children, many=True).data
 
-    def create(self, validated_data):
-        post_data = self.context.get("request").POST
-
-        dates_data = {
-            "bdate": post_data.get("bdate"),
-            "bdate_mode": post_data.get("bdate_mode"),
-            "ddate": post_data.get("ddate"),
-            "ddate_mode": post_data.get("ddate_mode"),
-        }
-
-        if dates_data["bdate"]:
-            try:
-                dates_data["bdate"] = datetime.strptime(
-                    dates_data["bdate"], "%Y-%m-%d"
-                ).date()
-            except ValueError:
-                dates_data["bdate"] = None
-        if dates_data["ddate"]:
+    @staticmethod
+    def get_dates_data(post_data) -> dict:
+        dates_data = {}
+        for field in ("bdate", "ddate"):
+            value = post_data.get(field)
+            if value:
+                try:
+                    dates_data[field] = datetime.strptime(value, "%Y-%m-%d").date()
+                except ValueError:
+                    dates_data[field] = None
             try:
-                dates_data["ddate"] = datetime.strptime(
-                    dates_data["ddate"], "%Y-%m-%d"
-                ).date()
-            except ValueError:
-                dates_data["ddate"] = None
+                dates_data[f"{field}_mode"] = int(post_data.get(f"{field}_mode"))
+            except (TypeError, ValueError):
+                continue
+        return dates_data
 
-        horse = Horse.objects.create(**validated_data, **dates_data)
+    @staticmethod
+    def get_related_id(resolver, value) -> int | None:
+        if value == "none":
+            return None
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            pass
+        return resolver.resolve(value, create=True)
 
+    def set_related(self, horse: Horse, post_data) -> None:
+        # Породы и владельцы разрешаются до записи лошади,
+        # чтобы лошадь сохранялась одним запросом
         breed = post_data.get("breed")
-        photos = post_data.get("photos[]")
         owner = post_data.get("owner")
-
         if breed is not None:
-            horse.set_breed(breed)
-        if photos:
-            photos = Photo.get_photos(
-                request=self.context.get("request"),
-                description=f"Фотография {horse.name}",
-                categories=["Фотографии лошадей"],
-            )
-            horse.set_photos(photos)
+            horse.breed_id = self.get_related_id(breed_resolver, breed)
         if owner is not None:
-            try:
-                owner_id = int(owner)
-                owner = HorseOwner.objects.get(id=owner_id)
-            except (TypeError, ValueError):
-                owner = HorseOwner.objects.create(name=owner)
-            except HorseOwner.DoesNotExist:
-                owner = None
-            horse.owner = owner
-            horse.save()
+            horse.owner_id = self.get_related_id(owner_resolver, owner)
+
+    def create(self, validated_data):
+        request = self.context.get("request")
+        post_data = request.data
+
+        horse = Horse(**validated_data, **self.get_dates_data(post_data))
+        # При ?async=true файлы только сохраняются во временный каталог,
+        # а фотографии создаются фоновой задачей (photos_job)
+        self.photos_job = None
+        files = [
+            photo
+            for photo in post_data.getlist("photos[]")
+            if isinstance(photo, UploadedFile)
+        ]
+        try:
+            validate_images(files)
+        except InvalidImageError as ex:
+            raise ValidationError({"photos": str(ex)})
+        staged = []
+        if is_async_upload(request):
+            staged = stage_files(files)
+        uploaded = []
+        try:
+            with transaction.atomic():
+                self.set_related(horse, post_data)
+                horse.save()
+                if post_data.get("photos[]"):
+                    if is_async_upload(request):
+                        photos = Photo.get_existing_ids(post_data.getlist("photos[]"))
+                    else:
+                        photos = Photo.get_photos(
+                            request=request,
+                            description=f"Фотография {horse.name}",
+                            categories=["Фотографии лошадей"],
+                            uploaded=uploaded,
+                        )
+                    HorsePhoto.append(horse.id, photos)
+                    horse.refresh_from_db(fields=["cover_photo"])
+                if staged:
+                    self.photos_job = attach_photos.enqueue(
+                        horse_id=horse.id,
+                        files=staged,
+                        created_by_id=request.user.id,
+                        created_by=request.user,
+                    )
+        except Exception:
+            delete_staged(staged)
+            for photo in uploaded:
+                photo.image.delete(save=False)
+            raise
         return horse
+
+    def update(self, instance: Horse, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        with transaction.atomic():
+            self.set_related(instance, self.context.get("request").data)
+            instance.save()
+        return instance
+
+
+class IdOrNameField(serializers.Field):
+    default_error_messages = {
+        "invalid": "Укажите id или наименование",
+        "min_length": "Не менее {min_length} символов",
+        "max_length": "Не более {max_length} символов",
+    }
+
+    def __init__(self, min_length=None, max_length=None, **kwargs):
+        self.min_length = min_length
+        self.max_length = max_length
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail("invalid")
+        if isinstance(data, int):
+            return data
+        data = data.strip()
+        if data.isdigit():
+            return int(data)
+        if not data:
+            self.fail("invalid")
+        if self.min_length is not None and len(data) < self.min_length:
+            self.fail("min_length", min_length=self.min_length)
+        if self.max_length is not None and len(data) > self.max_length:
+            self.fail("max_length", max_length=self.max_length)
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
+class HorseBulkItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False, min_value=1)
+    ref = serializers.CharField(required=False, max_length=100)
+    name = serializers.CharField(max_length=50)
+    sex = serializers.ChoiceField(choices=SEX_CHOICES, required=False)
+    kind = serializers.ChoiceField(choices=KIND_CHOICES, required=False)
+    bdate = serializers.DateField(
+        required=False, allow_null=True, validators=[validate_future_date]
+    )
+    bdate_mode = serializers.ChoiceField(choices=DATE_MODE_CHOICES, required=False)
+    ddate = serializers.DateField(
+        required=False, allow_null=True, validators=[validate_future_date]
+    )
+    ddate_mode = serializers.ChoiceField(choices=DATE_MODE_CHOICES, required=False)
+    description = serializers.CharField(
+        max_length=500, required=False, allow_null=True, allow_blank=True
+    )
+    breed = IdOrNameField(min_length=5, max_length=50, required=False, allow_null=True)
+    owner = IdOrNameField(max_length=150, required=False, allow_null=True)
+    sire = IdOrNameField(max_length=100, required=False, allow_null=True)
+    dame = IdOrNameField(max_length=100, required=False, allow_null=True)
+    photos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False
+    )
+
+    @staticmethod
+    def validate_ref(value):
+        if value.strip().isdigit():
+            raise ValidationError("ref не может состоять только из цифр")
+        return value.strip()
@@ -0,0 +1,307 @@
+import csv
+import io
+from array import array
+from datetime import date, datetime
+from pathlib import Path
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .bulk import HORSE_BULK_FIELDS
+from .models import KIND_CHOICES, SEX_CHOICES, Horse, normalize_name
+from .resolvers import breed_resolver, owner_resolver
+from .serializers import HorseBulkItemSerializer
+
+HEADER_ALIASES = {
+    "кличка": "name",
+    "пол": "sex",
+    "тип": "kind",
+    "дата рождения": "bdate",
+    "дата смерти": "ddate",
+    "порода": "breed",
+    "владелец": "owner",
+    "мать": "sire",
+    "отец": "dame",
+    "описание": "description",
+}
+
+# Форматы дат и соответствующий режим из DATE_MODE_CHOICES
+DATE_FORMATS = [
+    ("%Y-%m-%d", 0),
+    ("%d.%m.%Y", 0),
+    ("%Y-%m", 2),
+    ("%m.%Y", 2),
+    ("%Y", 1),
+]
+
+# sire - мать, dame - отец. Ключ индекса лошадей: (кличка, жеребец/мерин)
+PARENT_FIELDS = [
+    ("sire", False, "Мать {} не найдена"),
+    ("dame", True, "Отец {} не найден"),
+]
+
+
+class StudbookImportError(Exception):
+    pass
+
+
+def clean_value(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ""):
+        return None
+    return value
+
+
+def get_file_format(name: str, file_format: str | None = None) -> str:
+    file_format = file_format or ("xlsx" if Path(name).suffix == ".xlsx" else "csv")
+    if file_format not in ("csv", "xlsx"):
+        raise StudbookImportError("Поддерживаются только файлы CSV и XLSX")
+    return file_format
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date(), 0
+    if isinstance(value, date):
+        return value, 0
+    if isinstance(value, int):
+        value = str(value)
+    for date_format, mode in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date(), mode
+        except ValueError:
+            continue
+    return value, 0
+
+
+class StudbookImporter:
+    """Импорт лошадей и родословной из CSV/XLSX.
+
+    Строка файла обновляет лошадь с той же кличкой (без учёта регистра
+    и лишних пробелов) и датой рождения, в том числе лошадь без даты
+    рождения, если дата не указана. Остальные строки добавляют лошадей,
+    поэтому повторный импорт того же файла не создаёт дубликатов.
+    """
+
+    batch_size = 1000
+    max_errors = 1000
+
+    def __init__(self, file, file_format=None, user=None, progress=None):
+        self.file = file
+        self.format = get_file_format(getattr(file, "name", None) or "", file_format)
+        self.user = user if user is not None and user.is_authenticated else None
+        self.progress = progress
+        self.serializer = HorseBulkItemSerializer()
+        self.labels = {
+            "sex": {normalize_name(label): value for value, label in SEX_CHOICES},
+            "kind": {normalize_name(label): value for value, label in KIND_CHOICES},
+        }
+
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.linked = 0
+        self.errors = []
+        self.errors_count = 0
+        # id добавленной лошади для каждой строки файла (0 - строка с ошибкой)
+        self.row_horse_ids = array("q")
+
+    def run(self) -> dict:
+        self.build_indexes()
+        self.insert_horses()
+        self.link_parents()
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "updated": self.updated,
+            "linked": self.linked,
+            "errors_count": self.errors_count,
+            "errors": self.errors,
+        }
+
+    def report_progress(self, stage: str, count: int) -> None:
+        if self.progress is not None:
+            self.progress(stage, self.rows, count)
+
+    def add_error(self, row_number: int, errors) -> None:
+        self.errors_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def build_indexes(self) -> None:
+        # Родители ищутся по кличке и полу, обновляемые лошади -
+        # по кличке и дате рождения
+        self.horses = {}
+        self.horse_keys = {}
+        horses = (
+            Horse.objects.values_list("id", "name", "sex", "bdate")
+            .order_by("id")
+            .iterator(chunk_size=5000)
+        )
+        for pk, name, sex, bdate in horses:
+            name = normalize_name(name)
+            self.horses[(name, sex != 0)] = pk
+            self.horse_keys.setdefault((name, bdate), pk)
+
+    def iter_rows(self):
+        self.file.seek(0)
+        rows = self.iter_xlsx() if self.format == "xlsx" else self.iter_csv()
+        header = None
+        for row_number, values in enumerate(rows, start=1):
+            if header is None:
+                header = [normalize_name(value or "") for value in values]
+                header = [HEADER_ALIASES.get(value, value) for value in header]
+                continue
+            if all(clean_value(value) is None for value in values):
+                continue
+            yield row_number, dict(zip(header, values))
+
+    def iter_csv(self):
+        stream = io.TextIOWrapper(
+            getattr(self.file, "file", self.file), encoding="utf-8-sig", newline=""
+        )
+        try:
+            try:
+                dialect = csv.Sniffer().sniff(stream.read(4096), delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            stream.seek(0)
+            yield from csv.reader(stream, dialect)
+        finally:
+            stream.detach()
+
+    def iter_xlsx(self):
+        try:
+            from openpyxl import load_workbook
+        except ImportError as ex:
+            raise StudbookImportError("Для импорта XLSX необходим openpyxl") from ex
+
+        workbook = load_workbook(self.file, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    def parse_row(self, values: dict) -> dict:
+        item = {}
+        for field in ("name", "description", "breed", "owner"):
+            value = clean_value(values.get(field))
+            if value is not None:
+                item[field] = str(value) if field != "breed" else value
+        for field in ("sex", "kind"):
+            value = clean_value(values.get(field))
+            if value is not None:
+                item[field] = self.labels[field].get(normalize_name(value), value)
+        for field in ("bdate", "ddate"):
+            value = clean_value(values.get(field))
+            if value is not None:
+                item[field], item[f"{field}_mode"] = parse_date(value)
+        return item
+
+    def insert_horses(self) -> None:
+        batch = []
+        for ordinal, (row_number, values) in enumerate(self.iter_rows()):
+            self.rows += 1
+            self.row_horse_ids.append(0)
+            try:
+                data = self.serializer.run_validation(self.parse_row(values))
+            except ValidationError as ex:
+                self.add_error(row_number, ex.detail)
+                continue
+            batch.append((ordinal, row_number, data))
+            if len(batch) >= self.batch_size:
+                self.flush_horses(batch)
+                batch = []
+        if batch:
+            self.flush_horses(batch)
+
+    def flush_horses(self, batch: list) -> None:
+        with transaction.atomic():
+            breeds = breed_resolver.resolve_many(
+                (data.get("breed") for _, _, data in batch), create=True
+            )
+            owners = owner_resolver.resolve_many(
+                (data.get("owner") for _, _, data in batch), create=True
+            )
+            existing = Horse.objects.in_bulk(
+                self.horse_keys.get(self.get_horse_key(data)) for _, _, data in batch
+            )
+            rows = []
+            new_horses = {}
+            updated_horses = {}
+            for ordinal, row_number, data in batch:
+                errors = {
+                    field: ["Не найдено"]
+                    for field, resolved in (("breed", breeds), ("owner", owners))
+                    if data.get(field) is not None and data[field] not in resolved
+                }
+                if errors:
+                    self.add_error(row_number, errors)
+                    continue
+                key = self.get_horse_key(data)
+                horse = existing.get(self.horse_keys.get(key))
+                if horse is not None:
+                    updated_horses[horse.id] = horse
+                else:
+                    # Повтор строки в пачке меняет ту же новую лошадь
+                    horse = new_horses.setdefault(key, Horse(created_by=self.user))
+                for field in HORSE_BULK_FIELDS:
+                    if field in data:
+                        setattr(horse, field, data[field])
+                if "breed" in data:
+                    horse.breed_id = breeds.get(data["breed"])
+                if "owner" in data:
+                    horse.owner_id = owners.get(data["owner"])
+                rows.append((ordinal, horse))
+            Horse.objects.bulk_create(list(new_horses.values()))
+            if updated_horses:
+                Horse.objects.bulk_update(
+                    list(updated_horses.values()),
+                    HORSE_BULK_FIELDS + ["breed", "owner"],
+                )
+
+        for ordinal, horse in rows:
+            self.row_horse_ids[ordinal] = horse.id
+            self.horses[(normalize_name(horse.name), horse.sex != 0)] = horse.id
+        for key, horse in new_horses.items():
+            self.horse_keys.setdefault(key, horse.id)
+        self.created += len(new_horses)
+        self.updated += len(updated_horses)
+        self.report_progress("horses", self.created + self.updated)
+
+    @staticmethod
+    def get_horse_key(data: dict) -> tuple:
+        return normalize_name(data["name"]), data.get("bdate")
+
+    def link_parents(self) -> None:
+        # Второй проход: к этому моменту в индексе есть все лошади файла,
+        # поэтому родители могут находиться ниже ребёнка
+        through = Horse.children.through
+        links = []
+        for ordinal, (row_number, values) in enumerate(self.iter_rows()):
+            child_id = self.row_horse_ids[ordinal]
+            if not child_id:
+                continue
+            for field, is_male, message in PARENT_FIELDS:
+                name = clean_value(values.get(field))
+                if name is None:
+                    continue
+                parent_id = self.horses.get((normalize_name(name), is_male))
+                if parent_id is None or parent_id == child_id:
+                    self.add_error(row_number, {field: [message.format(name)]})
+                    continue
+                links.append(through(from_horse_id=parent_id, to_horse_id=child_id))
+            if len(links) >= self.batch_size:
+                self.flush_links(links)
+                links = []
+        if links:
+            self.flush_links(links)
+
+    def flush_links(self, links: list) -> None:
+        with transaction.atomic():
+            Horse.children.through.objects.bulk_create(links, ignore_conflicts=True)
+        self.linked += len(links)
+        self.report_progress("parents", self.linked)
@@ -0,0 +1,47 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from gallery.uploads import create_staged_photos, delete_staged
+from jobs.queue import task
+from profile_management.models import NewUser
+
+from .models import Horse, HorsePhoto
+
+
+@task("horses.attach_photos", max_attempts=3)
+def attach_photos(horse_id: int, files: list[dict], created_by_id=None) -> dict:
+    horse = Horse.objects.filter(id=horse_id).only("id", "name").first()
+    if horse is None:
+        # Лошадь удалили до обработки фотографий
+        delete_staged(files)
+        return {"photos": []}
+
+    uploaded = []
+    try:
+        with transaction.atomic():
+            photos = create_staged_photos(
+                files,
+                description=f"Фотография {horse.name}",
+                categories=["Фотографии лошадей"],
+                created_by_id=created_by_id,
+                uploaded=uploaded,
+            )
+            HorsePhoto.append(horse.id, [photo.id for photo in photos])
+    except Exception:
+        for photo in uploaded:
+            photo.image.delete(save=False)
+        raise
+    return {"photos": [photo.id for photo in photos]}
+
+
+@task("horses.import_studbook", max_attempts=3)
+def import_studbook(files: list[dict], file_format: str, created_by_id=None) -> dict:
+    # studbook импортирует сериализаторы, которые импортируют этот модуль
+    from .studbook import StudbookImporter
+
+    # Повторный запуск после ошибки обновляет уже добавленных лошадей
+    user = NewUser.objects.filter(id=created_by_id).first()
+    with default_storage.open(files[0]["path"], "rb") as file:
+        result = StudbookImporter(file, file_format=file_format, user=user).run()
+    delete_staged(files)
+    return result
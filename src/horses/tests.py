@@ -0,0 +1,658 @@
+import datetime
+import io
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import request_started
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from gallery.models import Photo
+from jobs.models import Job
+from jobs.queue import work
+from profile_management.models import NewUser
+
+from .models import Breed, Horse, HorseOwner, HorsePhoto, HorseQuerySet
+from .resolvers import breed_resolver, owner_resolver
+
+
+def make_image() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), (120, 80, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class HorseQueryBudgetTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        breed = Breed.objects.create(name="Тракененская")
+        owner = HorseOwner.objects.create(name="Конный клуб")
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+
+        # Задачи первого запроса (создание групп) не входят в бюджеты
+        request_started.send(sender=cls)
+
+        generation = []
+        for number in range(6):
+            mare = cls._create_horse(f"Кобыла {number}", 0, breed, owner)
+            stallion = cls._create_horse(f"Жеребец {number}", 1, breed, owner)
+            for child in generation:
+                mare.children.add(child)
+                stallion.children.add(child)
+            generation = [mare, stallion]
+        cls.horse = Horse.objects.get(name="Кобыла 0")
+
+    @classmethod
+    def _create_horse(cls, name, sex, breed, owner):
+        horse = Horse.objects.create(
+            name=name, sex=sex, breed=breed, owner=owner, created_by=cls.moderator
+        )
+        horse.photos.add(
+            *[
+                Photo.objects.create(title=f"{name} {i}", image=f"photos/{name}{i}.jpg")
+                for i in range(2)
+            ]
+        )
+        return horse
+
+    def setUp(self):
+        cache.clear()
+
+    def assertWithinBudget(self, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            "\n".join(query["sql"] for query in queries.captured_queries),
+        )
+        return response
+
+    def test_list_budget(self):
+        self.assertWithinBudget(
+            "/api/v1/horses/", HorseQuerySet.get_query_budget("list")
+        )
+
+    def test_list_pedigree_budget(self):
+        for depth in range(1, 6):
+            cache.clear()
+            self.assertWithinBudget(
+                f"/api/v1/horses/?pedigree={depth}",
+                HorseQuerySet.get_query_budget("list", pedigree=depth),
+            )
+
+    def test_list_moderation_budget(self):
+        self.client.force_authenticate(self.moderator)
+        self.assertWithinBudget(
+            "/api/v1/horses/?pedigree=3",
+            HorseQuerySet.get_query_budget("list", pedigree=3, moderation=True),
+        )
+
+    def test_detail_budget(self):
+        self.assertWithinBudget(
+            f"/api/v1/horses/{self.horse.pk}/",
+            HorseQuerySet.get_query_budget("detail"),
+        )
+
+    def test_detail_pedigree_budget(self):
+        for depth in range(1, 6):
+            cache.clear()
+            response = self.assertWithinBudget(
+                f"/api/v1/horses/{self.horse.pk}/?pedigree={depth}",
+                HorseQuerySet.get_query_budget("detail", pedigree=depth),
+            )
+            self.assertIsNotNone(response.data["pedigree"]["sire"])
+
+    def test_detail_moderation_budget(self):
+        self.client.force_authenticate(self.moderator)
+        response = self.assertWithinBudget(
+            f"/api/v1/horses/{self.horse.pk}/?pedigree=5",
+            HorseQuerySet.get_query_budget("detail", pedigree=5, moderation=True),
+        )
+        self.assertIn("created_by", response.data)
+
+
+class NameResolverTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        owner_resolver.clear()
+
+    def test_names_are_normalized(self):
+        first = owner_resolver.resolve("  Конный   клуб ", create=True)
+        second = owner_resolver.resolve("КОННЫЙ КЛУБ", create=True)
+        self.assertEqual(first, second)
+        self.assertEqual(HorseOwner.objects.get().name, "Конный клуб")
+
+    def test_cached_names_skip_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            owner_id = owner_resolver.resolve("Конный клуб", create=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(owner_resolver.resolve("конный клуб"), owner_id)
+
+    def test_rename_invalidates_cache(self):
+        owner_id = owner_resolver.resolve("Конный клуб", create=True)
+        owner = HorseOwner.objects.get(id=owner_id)
+        owner.name = "Частный владелец"
+        owner.save()
+        self.assertIsNone(owner_resolver.resolve("Конный клуб"))
+        self.assertEqual(owner_resolver.resolve("частный владелец"), owner_id)
+
+    def test_cache_expires_after_ttl(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            owner_id = owner_resolver.resolve("Конный клуб", create=True)
+        # Переименование в другом процессе: сигналы здесь не срабатывают
+        HorseOwner.objects.filter(id=owner_id).update(
+            name="Частный владелец", normalized_name="частный владелец"
+        )
+        self.assertEqual(owner_resolver.resolve("Конный клуб"), owner_id)
+        with override_settings(HORSE_NAMES_CACHE_TTL=0):
+            owner_resolver.cleared_at -= 1
+            self.assertIsNone(owner_resolver.resolve("Конный клуб"))
+            self.assertEqual(owner_resolver.resolve("частный владелец"), owner_id)
+
+
+class HorseCreateTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+        request_started.send(sender=cls)
+
+    def setUp(self):
+        cache.clear()
+        breed_resolver.clear()
+        owner_resolver.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Копии фотографий проверяются в gallery/tests.py
+        schedule_variants = mock.patch("gallery.variants.schedule_variants")
+        schedule_variants.start()
+        self.addCleanup(schedule_variants.stop)
+        self.client.force_authenticate(self.moderator)
+
+    @staticmethod
+    def get_data(photos_count):
+        return {
+            "name": "Жеребёнок",
+            "sex": 1,
+            "breed": "Тракененская",
+            "owner": "Конный клуб",
+            "bdate": "2020-05-01",
+            "bdate_mode": 0,
+            "photos[]": [
+                SimpleUploadedFile(f"photo{i}.jpg", make_image(), "image/jpeg")
+                for i in range(photos_count)
+            ],
+        }
+
+    def post_horse(self, photos_count):
+        data = self.get_data(photos_count)
+        with (
+            self.captureOnCommitCallbacks(execute=True),
+            CaptureQueriesContext(connection) as queries,
+        ):
+            response = self.client.post("/api/v1/horses/", data)
+        self.assertEqual(response.status_code, 201)
+        return response, queries
+
+    def test_query_count_does_not_depend_on_photos(self):
+        self.post_horse(1)
+        response, queries = self.post_horse(3)
+        self.assertEqual(len(self.post_horse(5)[1]), len(queries))
+
+        horse = Horse.objects.get(id=response.data["id"])
+        self.assertEqual(horse.photos.count(), 3)
+        self.assertEqual(HorseOwner.objects.count(), 1)
+        self.assertEqual(
+            set(horse.photos.values_list("category__name", flat=True)),
+            {"Фотографии лошадей"},
+        )
+
+    def test_async_photos(self):
+        response = self.client.post("/api/v1/horses/?async=true", self.get_data(2))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["photos_count"], 0)
+        self.assertIsNone(response.data["cover"])
+        self.assertEqual(Photo.objects.count(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(work(burst=True), 1)
+        horse = Horse.objects.get(id=response.data["id"])
+        self.assertEqual(horse.photos.count(), 2)
+        self.assertEqual(
+            set(horse.photos.values_list("category__name", flat=True)),
+            {"Фотографии лошадей"},
+        )
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["id"], response.data["job_id"])
+        self.assertEqual(len(job["result"]["photos"]), 2)
+
+    def test_photos_export(self):
+        horse_id = self.post_horse(2)[0].data["id"]
+        other_id = self.post_horse(0)[0].data["id"]
+        links = list(HorsePhoto.objects.filter(horse_id=horse_id).order_by("id"))
+        # Архив в порядке альбома, фотография из альбома другой лошади
+        # не повторяется
+        HorsePhoto.objects.filter(id=links[0].id).update(position=2)
+        HorsePhoto.objects.create(horse_id=other_id, photo_id=links[1].photo_id)
+        response = self.client.get(f"/api/v1/horses/{horse_id}/photos/export/")
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(zf.namelist(), ["photo1.jpg", "photo0.jpg"])
+            self.assertEqual(zf.read("photo1.jpg"), make_image())
+
+    def test_create_is_atomic(self):
+        with mock.patch.object(Photo, "get_photos", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post_horse(1)
+        self.assertFalse(Horse.objects.exists())
+        self.assertFalse(HorseOwner.objects.exists())
+        self.assertFalse(Breed.objects.exists())
+
+
+class HorseBulkTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+        request_started.send(sender=cls)
+        cls.mare = Horse.objects.create(name="Кобыла", sex=0)
+        cls.stallion = Horse.objects.create(name="Жеребец", sex=1)
+
+    def setUp(self):
+        cache.clear()
+        breed_resolver.clear()
+        owner_resolver.clear()
+        self.client.force_authenticate(self.moderator)
+
+    def post_items(self, items):
+        return self.client.post("/api/v1/horses/bulk/", {"items": items}, "json")
+
+    def get_errors(self, response) -> dict:
+        return {item["index"]: item["errors"] for item in response.data["errors"]}
+
+    def test_refs_and_item_errors(self):
+        response = self.post_items(
+            [
+                {
+                    "ref": "mother",
+                    "name": "Мать",
+                    "sex": 0,
+                    "bdate": "2015-01-01",
+                    "breed": "Тракененская",
+                    "owner": "Конный клуб",
+                },
+                {
+                    "ref": "foal",
+                    "name": "Жеребёнок",
+                    "sex": 1,
+                    "bdate": "2021-05-01",
+                    "sire": "mother",
+                    "dame": self.stallion.id,
+                    "breed": " тракененская ",
+                },
+                {"name": "Дочь", "sex": 0, "sire": self.stallion.id},
+                {"ref": "lost", "name": "Без фото", "sex": 0, "photos": [999999]},
+                {"name": "Сирота", "sire": "lost"},
+                {"name": "Без матери", "sire": "missing"},
+                {"name": ""},
+                {"name": "Старше матери", "bdate": "2014-01-01", "sire": "mother"},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        created = {
+            item["ref"] or item["index"]: item["id"]
+            for item in response.data["created"]
+        }
+        self.assertEqual(set(created), {"mother", "foal"})
+
+        errors = self.get_errors(response)
+        self.assertEqual(set(errors), {2, 3, 4, 5, 6, 7})
+        self.assertEqual(errors[2]["sire"], ["Мать не может быть жеребцом или мерином"])
+        self.assertEqual(
+            errors[4]["sire"], ["Лошадь с этим ref не сохранена из-за ошибок"]
+        )
+        self.assertEqual(errors[5]["sire"], ["Лошадь не найдена"])
+        self.assertIn("name", errors[6])
+        self.assertEqual(
+            errors[7]["sire"],
+            ["Дата рождения матери не может быть больше даты рождения лошади"],
+        )
+
+        foal = Horse.objects.get(id=created["foal"])
+        self.assertEqual(
+            set(foal.parents.values_list("id", flat=True)),
+            {created["mother"], self.stallion.id},
+        )
+        # Порода создана один раз для обоих вариантов написания
+        self.assertEqual(Breed.objects.get().id, foal.breed_id)
+        self.assertEqual(HorseOwner.objects.get().name, "Конный клуб")
+
+    def test_update_by_id(self):
+        foal = Horse.objects.create(name="Жеребёнок", sex=1, bdate="2020-01-01")
+        self.stallion.children.add(foal)
+        response = self.post_items(
+            [
+                {"id": foal.id, "name": "Ветер", "sire": "mother"},
+                {"ref": "mother", "name": "Новая мать", "sex": 0},
+                {"id": 999999, "name": "Нет такой"},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"][0]["id"], foal.id)
+        self.assertEqual(self.get_errors(response)[2]["id"], ["Лошадь не найдена"])
+
+        foal.refresh_from_db()
+        self.assertEqual(foal.name, "Ветер")
+        self.assertEqual(
+            set(foal.parents.values_list("name", flat=True)), {"Новая мать", "Жеребец"}
+        )
+
+        response = self.post_items([{"id": foal.id, "sire": None}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(foal.parents.all()), [self.stallion])
+
+    def test_parent_cycles(self):
+        # Кобыла и жеребец становятся родителями друг друга в одном запросе
+        response = self.post_items(
+            [
+                {"id": self.mare.id, "dame": self.stallion.id},
+                {"id": self.stallion.id, "sire": self.mare.id},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = self.get_errors(response)
+        self.assertEqual(errors[0]["dame"], ["Лошадь не может быть предком самой себя"])
+        self.assertEqual(errors[1]["sire"], ["Лошадь не может быть предком самой себя"])
+
+        # Цикл через связь, которая уже есть в базе, и цикл через ref
+        self.mare.children.add(self.stallion)
+        response = self.post_items(
+            [
+                {"id": self.mare.id, "dame": self.stallion.id},
+                {"id": self.stallion.id, "name": "Гром"},
+                {"ref": "a", "name": "Первая", "sex": 0, "sire": "b"},
+                {"ref": "b", "name": "Вторая", "sex": 0, "sire": "a"},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        errors = self.get_errors(response)
+        self.assertEqual(set(errors), {0, 2, 3})
+        self.assertEqual(errors[0]["dame"], ["Лошадь не может быть предком самой себя"])
+        self.assertEqual(response.data["updated"][0]["id"], self.stallion.id)
+        self.assertFalse(self.mare.parents.exists())
+
+        # Те же проверки при добавлении родителя одной лошади
+        response = self.client.post(
+            f"/api/v1/horses/{self.mare.id}/pedigree/dame/",
+            {"ped_horses": [self.stallion.id]},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["error"], "Лошадь не может быть предком самой себя"
+        )
+
+    def test_invalid_refs_chain(self):
+        items = [{"ref": "h0", "name": "Первая", "sex": 0, "photos": [999999]}]
+        items += [
+            {
+                "ref": f"h{number}",
+                "name": f"Лошадь {number}",
+                "sex": 0,
+                "sire": f"h{number - 1}",
+            }
+            for number in range(1, 2000)
+        ]
+        response = self.post_items(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data["errors"]), 2000)
+        self.assertFalse(Horse.objects.filter(name__startswith="Лошадь").exists())
+
+
+STUDBOOK_CSV = """Кличка;Пол;Дата рождения;Порода;Мать;Отец
+Гроза;Кобыла;01.05.2020;Тракененская;Буря;Вихрь
+Буря;кобыла;2010-03;Тракененская;;
+Вихрь;Жеребец;2009;тракененская;;
+Ошибка;Кобыла;32.13.2020;;;
+Сирота;Кобыла;2015-06-01;;Неизвестная;
+"""
+
+
+class HorseStudbookTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = NewUser.objects.create_superuser(username="admin", password="admin")
+        request_started.send(sender=cls)
+
+    def setUp(self):
+        cache.clear()
+        breed_resolver.clear()
+        owner_resolver.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def import_file(self, content: bytes, name: str = "studbook.csv") -> dict:
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(
+            "/api/v1/horses/import/",
+            {"file": SimpleUploadedFile(name, content)},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 202)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(work(burst=True), 1)
+        self.assertEqual(self.client.get(response["Location"]).status_code, 200)
+        job = Job.objects.get(id=response.data["job_id"])
+        # Временный файл удаляется после импорта
+        self.assertFalse(default_storage.exists(job.payload["files"][0]["path"]))
+        return job.result
+
+    def test_csv_import_and_reimport(self):
+        result = self.import_file(STUDBOOK_CSV.encode())
+        self.assertEqual(
+            {key: result[key] for key in ("rows", "created", "updated", "linked")},
+            {"rows": 5, "created": 4, "updated": 0, "linked": 2},
+        )
+        self.assertEqual(
+            {error["row"]: set(error["errors"]) for error in result["errors"]},
+            {5: {"bdate"}, 6: {"sire"}},
+        )
+
+        foal = Horse.objects.get(name="Гроза")
+        self.assertEqual(
+            (str(foal.bdate), foal.bdate_mode, foal.sex), ("2020-05-01", 0, 0)
+        )
+        self.assertEqual(
+            sorted(foal.parents.values_list("name", flat=True)), ["Буря", "Вихрь"]
+        )
+        mare = Horse.objects.get(name="Буря")
+        self.assertEqual((str(mare.bdate), mare.bdate_mode), ("2010-03-01", 2))
+        stallion = Horse.objects.get(name="Вихрь")
+        self.assertEqual(
+            (str(stallion.bdate), stallion.bdate_mode, stallion.sex),
+            ("2009-01-01", 1, 1),
+        )
+        self.assertEqual(Breed.objects.count(), 1)
+
+        # Повторный импорт обновляет тех же лошадей
+        content = STUDBOOK_CSV.replace("Вихрь;Жеребец;2009;", "Вихрь;Мерин;2009;")
+        result = self.import_file(content.encode())
+        self.assertEqual((result["created"], result["updated"]), (0, 4))
+        self.assertEqual(Horse.objects.count(), 4)
+        stallion.refresh_from_db()
+        self.assertEqual(stallion.sex, 2)
+        self.assertEqual(foal.parents.count(), 2)
+
+    def test_xlsx_import(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["Кличка", "Пол", "Дата рождения", "Мать"])
+        sheet.append(["Гроза", "Кобыла", datetime.date(2020, 5, 1), "Буря"])
+        sheet.append(["Буря", "Кобыла", 2010.0, None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        result = self.import_file(buffer.getvalue(), "studbook.xlsx")
+        self.assertEqual(
+            (result["created"], result["linked"], result["errors"]), (2, 1, [])
+        )
+        mare = Horse.objects.get(name="Буря")
+        self.assertEqual((str(mare.bdate), mare.bdate_mode), ("2010-01-01", 1))
+
+    def test_invalid_requests(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.post("/api/v1/horses/import/", {}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/api/v1/horses/import/",
+            {"file": SimpleUploadedFile("studbook.csv", b""), "format": "ods"},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+
+class HorsePhotosTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = NewUser.objects.create_superuser(
+            username="moderator", password="moderator"
+        )
+        cls.horse = Horse.objects.create(name="Гром")
+        cls.photos = [
+            Photo.objects.create(title=f"photo{i}", image=f"photos/{i}.jpg")
+            for i in range(5)
+        ]
+        request_started.send(sender=cls)
+
+    def setUp(self):
+        self.url = f"/api/v1/horses/{self.horse.id}/photos/"
+        self.client.force_authenticate(self.moderator)
+
+    def get_album(self):
+        ids = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(f"{self.url}?limit=2&cursor={cursor}")
+            self.assertEqual(response.status_code, 200)
+            ids += [item["id"] for item in response.data["items"]]
+            cursor = response.data["next_cursor"]
+        return ids
+
+    def test_album(self):
+        ids = [photo.id for photo in self.photos]
+        response = self.client.post(self.url, {"photos": ids[:3]}, format="json")
+        self.assertEqual(response.data, {"photos_count": 3})
+        self.client.post(self.url, {"photos": [ids[1], ids[4]]}, format="json")
+        self.assertEqual(self.get_album(), [ids[0], ids[1], ids[2], ids[4]])
+
+        response = self.client.patch(
+            self.url, {"photos": [ids[4], ids[2]]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_album(), [ids[4], ids[2], ids[0], ids[1]])
+        response = self.client.patch(self.url, {"photos": [ids[3]]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.delete(self.url, {"photos": [ids[4]]}, format="json")
+        self.assertEqual(response.data, {"photos_count": 3})
+        self.assertTrue(Photo.objects.filter(id=ids[4]).exists())
+
+        horse = self.client.get(f"/api/v1/horses/{self.horse.id}/").data
+        self.assertEqual(horse["cover"]["id"], ids[2])
+        self.assertEqual(horse["photos_count"], 3)
+        horses = self.client.get("/api/v1/horses/?has_photo=true").data
+        self.assertEqual([item["id"] for item in horses["items"]], [self.horse.id])
+
+    def test_cover(self):
+        ids = [photo.id for photo in self.photos]
+
+        def get_cover():
+            return Horse.objects.values_list("cover_photo", flat=True).get(
+                id=self.horse.id
+            )
+
+        self.client.post(self.url, {"photos": ids[:3]}, format="json")
+        self.assertEqual(get_cover(), ids[0])
+        self.client.patch(self.url, {"photos": [ids[2]]}, format="json")
+        self.assertEqual(get_cover(), ids[2])
+        self.client.delete(self.url, {"photos": [ids[2]]}, format="json")
+        self.assertEqual(get_cover(), ids[0])
+
+        # Сохранение загруженной ранее лошади не меняет обложку
+        horse = Horse.objects.get(id=self.horse.id)
+        self.photos[0].delete()
+        self.assertEqual(get_cover(), ids[1])
+        horse.save()
+        self.assertEqual(get_cover(), ids[1])
+
+        horse.set_photos([ids[4], ids[3]], mode="replace")
+        self.assertEqual(get_cover(), ids[4])
+        horse.set_photos([ids[4], ids[3]], mode="remove")
+        self.assertIsNone(get_cover())
+
+    def test_batch_actions(self):
+        ids = [photo.id for photo in self.photos]
+        other = Horse.objects.create(name="Буря")
+
+        def batch(action, photos, **data):
+            response = self.client.post(
+                "/api/v1/gallery/batch/",
+                {"action": action, "photos": photos, **data},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+            return dict(Horse.objects.values_list("id", "cover_photo"))
+
+        covers = batch("attach", ids[:3], horses=[self.horse.id, other.id, 10**6])
+        self.assertEqual(covers, {self.horse.id: ids[0], other.id: ids[0]})
+        self.assertEqual(self.get_album(), ids[:3])
+        covers = batch("detach", [ids[0]], horses=[self.horse.id])
+        self.assertEqual(covers, {self.horse.id: ids[1], other.id: ids[0]})
+        covers = batch("delete", [ids[1]])
+        self.assertEqual(covers, {self.horse.id: ids[2], other.id: ids[0]})
+        covers = batch("detach", [ids[0]])
+        self.assertEqual(covers, {self.horse.id: ids[2], other.id: ids[2]})
+
+        response = self.client.post(
+            "/api/v1/gallery/batch/",
+            {"action": "attach", "photos": ids},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_requests(self):
+        response = self.client.post(self.url, {"photos": [0]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {"photos": [10**6]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(HorsePhoto.objects.exists())
+        response = self.client.get("/api/v1/horses/0/photos/")
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            self.url, {"photos": [self.photos[0].id]}, format="json"
+        )
+        self.assertIn(response.status_code, (401, 403))
@@ -3,17 +3,25 @@ from django.urls import path
 from .views import (
     BreedDetailAPIView,
     BreedListCreateAPIView,
+    HorseBulkAPIView,
     HorseDetailAPIView,
     HorseListCreateAPIView,
     HorseOwnersDetailAPIView,
     HorseOwnersListCreateAPIView,
     HorsePedigreeAPIView,
+    HorsePhotosAPIView,
+    HorsePhotosExportAPIView,
+    HorseStudbookImportAPIView,
 )
 
 urlpatterns = [
     path("", HorseListCreateAPIView.as_view()),
+    path("bulk/", HorseBulkAPIView.as_view()),
+    path("import/", HorseStudbookImportAPIView.as_view()),
     path("<int:pk>/", HorseDetailAPIView.as_view()),
     path("<int:pk>/pedigree/<str:mode>/", HorsePedigreeAPIView.as_view()),
+    path("<int:pk>/photos/", HorsePhotosAPIView.as_view()),
+    path("<int:pk>/photos/export/", HorsePhotosExportAPIView.as_view()),
     path("breeds/", BreedListCreateAPIView.as_view()),
     path("breeds/<int:pk>/", BreedDetailAPIView.as_view()),
     path("owners/", HorseOwnersListCreateAPIView.as_view()),
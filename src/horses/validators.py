@@ -9,78 +9,104 @@ def validate_future_date(value):
         raise ValidationError("Дата не может быть в будущем")
 
 
-def validate_sire(child, sire):
-    if child == sire:
-        raise ValidationError("Мать и ребёнок не могут совпадать")
-    if sire.sex != 0:
-        raise ValidationError("Мать не может быть жеребцом или мерином")
-
-    selected_sire = child.parents.filter(sex=0).first()
-    if selected_sire:
-        raise ValidationError(f"Мать {child}: {selected_sire}")
-
-    if child.bdate and sire.bdate:
-        child_bdate = child.bdate
-        sire_bdate = sire.bdate
-
-        if child.bdate_mode == 1 or sire.bdate_mode == 1:
-            child_bdate.replace(month=1, day=1)
-            sire_bdate.replace(month=1, day=1)
+# Как и в HorsePedigreeAPIView: sire - мать, dame - отец
+PARENT_SEXES = {
+    "sire": (0,),
+    "dame": (1, 2),
+}
+
+PARENT_ERRORS = {
+    "sire": {
+        "self": "Мать и ребёнок не могут совпадать",
+        "sex": "Мать не может быть жеребцом или мерином",
+        "bdate": "Дата рождения матери не может быть больше даты рождения лошади",
+        "ddate": "Дата смерти матери не может быть раньше даты рождения лошади",
+    },
+    "dame": {
+        "self": "Отец и ребёнок не могут совпадать",
+        "sex": "Отец не может быть кобылой",
+        "bdate": "Дата рождения отца не может быть больше даты рождения лошади",
+    },
+}
+
+CYCLE_ERROR = "Лошадь не может быть предком самой себя"
+
+
+def truncate_date(value: date, *modes: int) -> date:
+    # Даты сравниваются с точностью менее точной из двух
+    if 1 in modes:
+        return value.replace(month=1, day=1)
+    if 2 in modes:
+        return value.replace(day=1)
+    return value
+
+
+def validate_parent(child, parent, field: str):
+    """Проверки родителя без запросов к базе (пол, совпадение, даты),
+    общие для HorsePedigreeAPIView и HorseBulkWriter."""
+    errors = PARENT_ERRORS[field]
+    if child is parent or (child.pk is not None and child.pk == parent.pk):
+        raise ValidationError(errors["self"])
+    if parent.sex not in PARENT_SEXES[field]:
+        raise ValidationError(errors["sex"])
+
+    if child.bdate and parent.bdate:
+        modes = (child.bdate_mode, parent.bdate_mode)
+        if truncate_date(parent.bdate, *modes) > truncate_date(child.bdate, *modes):
+            raise ValidationError(errors["bdate"])
+
+    if "ddate" in errors and child.bdate and parent.ddate:
+        modes = (child.bdate_mode, parent.ddate_mode)
+        if truncate_date(parent.ddate, *modes) < truncate_date(child.bdate, *modes):
+            raise ValidationError(errors["ddate"])
+
+
+def get_parent_links(horse_ids) -> dict[int, list[tuple[int, int]]]:
+    """Связи {ребёнок: [(родитель, пол родителя)]} для лошадей и всех их
+    предков, по запросу на поколение."""
+    from .models import Horse
+
+    through = Horse.children.through
+    links = {}
+    frontier = set(horse_ids)
+    while frontier:
+        for child_id in frontier:
+            links[child_id] = []
+        rows = list(
+            through.objects.filter(to_horse_id__in=frontier).values_list(
+                "to_horse_id", "from_horse_id", "from_horse__sex"
+            )
+        )
+        for child_id, parent_id, sex in rows:
+            links[child_id].append((parent_id, sex))
+        frontier = {parent_id for _, parent_id, _ in rows} - links.keys()
+    return links
 
-        if child.bdate_mode == 2 or sire.bdate_mode == 2:
-            child_bdate.replace(day=1)
-            sire_bdate.replace(day=1)
 
-        if child_bdate > sire_bdate:
-            raise ValidationError(
-                "Дата рождения матери не может быть " "больше даты рождения лошади"
-            )
+def validate_not_descendant(child, parent):
+    links = get_parent_links([parent.pk])
+    if child.pk in links:
+        raise ValidationError(CYCLE_ERROR)
 
-        if sire.ddate:
-            sire_ddate = sire.ddate
-            child_bdate = child.bdate
 
-            if child.bdate_mode == 1 or sire.ddate_mode == 1:
-                child_bdate.replace(month=1, day=1)
-                sire_ddate.replace(month=1, day=1)
+def validate_sire(child, sire):
+    validate_parent(child, sire, "sire")
 
-            if child.bdate_mode == 2 or sire.ddate_mode == 2:
-                child_bdate.replace(day=1)
-                sire_ddate.replace(day=1)
+    selected_sire = child.parents.filter(sex=0).first()
+    if selected_sire:
+        raise ValidationError(f"Мать {child}: {selected_sire}")
 
-            if sire_ddate < child_bdate:
-                raise ValidationError(
-                    "Дата смерти матери не может быть " "раньше даты рождения лошади"
-                )
+    validate_not_descendant(child, sire)
 
 
 def validate_dame(child, dame):
-    if child == dame:
-        raise ValidationError("Мать и отец не могут совпадать")
-
-    if dame.sex == 0:
-        raise ValidationError("Отец не может быть кобылой")
+    validate_parent(child, dame, "dame")
 
     selected_dame = child.parents.filter(sex__in=[1, 2]).first()
     if selected_dame:
         raise ValidationError(f"Отец {child}: {selected_dame}")
 
-    if child.bdate and dame.bdate:
-        child_bdate = child.bdate
-        dame_bdate = dame.bdate
-
-        if child.bdate_mode == 1 or dame.bdate_mode == 1:
-            child_bdate.replace(month=1, day=1)
-            dame_bdate.replace(month=1, day=1)
-
-        if child.bdate_mode == 2 or dame.bdate_mode == 2:
-            child_bdate.replace(day=1)
-            dame_bdate.replace(day=1)
-
-        if child_bdate > dame_bdate:
-            raise ValidationError(
-                "Дата рождения отца не может быть " "больше даты рождения лошади"
-            )
+    validate_not_descendant(child, dame)
 
 
 def validate_child(horse, child):
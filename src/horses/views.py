@@ -1,12 +1,21 @@
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Prefetch
+from django.db import transaction
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Breed, Horse, HorseOwner
+from gallery.export import get_zip_response
+from gallery.models import Photo
+from gallery.serializers import PhotoMainInfoSerializer
+from gallery.uploads import delete_staged, stage_files
+from service.pagination import KeysetPagination, get_limit
+
+from .bulk import HorseBulkWriter
+from .models import Breed, Horse, HorseOwner, HorsePhoto
 from .permissions import HorsePermission, get_has_horses_moderate_permission
 from .serializers import (
     BreedNameOnlySerializer,
@@ -14,11 +23,28 @@ from .serializers import (
     HorseMainInfoSerializer,
     HorseOwnerNameOnlySerializer,
     HorseOwnerSerializer,
+    HorsePhotosSerializer,
     HorseSerializer,
+    get_pedigree_depth,
 )
+from .studbook import StudbookImportError, get_file_format
+from .tasks import import_studbook
 from .validators import validate_child, validate_dame, validate_sire
 
 
+def get_horse_detail_queryset(request, has_moderate_access=False):
+    queryset = Horse.objects.for_detail()
+
+    pedigree = get_pedigree_depth(request)
+    if pedigree:
+        queryset = queryset.for_pedigree(pedigree)
+
+    if has_moderate_access:
+        queryset = queryset.for_moderation()
+
+    return queryset
+
+
 @extend_schema(tags=["Лошади"])
 class HorseListCreateAPIView(ListCreateAPIView):
     model = Horse
@@ -102,17 +128,17 @@ class HorseListCreateAPIView(ListCreateAPIView):
             query_dict["description__icontains"] = description
 
         if has_photo == "true":
-            query_dict["photos_c__gte"] = 1
+            query_dict["photos_count__gte"] = 1
         elif has_photo == "false":
-            query_dict["photos_c"] = 0
+            query_dict["photos_count"] = 0
 
         if children_count:
             try:
                 cc = int(children_count)
                 if cc == -1:
-                    query_dict["children_c__gte"] = 1
+                    query_dict["children_count__gte"] = 1
                 if cc >= 0:
-                    query_dict["children_c"] = cc
+                    query_dict["children_count"] = cc
             except ValueError:
                 pass
 
@@ -155,36 +181,14 @@ class HorseListCreateAPIView(ListCreateAPIView):
         return sort_list
 
     def get_queryset(self, *args, **kwargs):
-        prefetch_query = ["photos"]
-
-        if self.request.query_params.get("pedigree"):
-            prefetch_children = Prefetch(
-                lookup="children",
-                queryset=Horse.objects.select_related("breed").prefetch_related(
-                    "photos"
-                ),
-                to_attr="prefetched_children",
-            )
+        queryset = Horse.objects.for_list()
 
-            prefetch_parents = Prefetch(
-                lookup="parents",
-                queryset=Horse.objects.select_related("breed").prefetch_related(
-                    "photos"
-                ),
-                to_attr="prefetched_parents",
-            )
-
-            prefetch_query.append(prefetch_children)
-            prefetch_query.append(prefetch_parents)
+        pedigree = get_pedigree_depth(self.request)
+        if pedigree:
+            queryset = queryset.for_pedigree(pedigree)
 
-        queryset = (
-            Horse.objects.annotate(
-                children_count=Count("children", distinct=True),
-                photos_count=Count("photos", distinct=True),
-            )
-            .select_related("breed", "owner")
-            .prefetch_related(*prefetch_query)
-        )
+        if kwargs.get("has_moderate_access", False):
+            queryset = queryset.for_moderation()
 
         return queryset.filter(**self.build_query_dict()).order_by(
             *self.get_sort_list()
@@ -231,6 +235,24 @@ class HorseListCreateAPIView(ListCreateAPIView):
             data={"count": count, "items": serializer_data}, status=status.HTTP_200_OK
         )
 
+    @extend_schema(tags=["Лошади"], summary="Добавление лошади")
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        if serializer.photos_job is None:
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        # Фотографии обрабатываются в фоне, статус доступен по ссылке Location
+        return Response(
+            data={**serializer.data, "job_id": serializer.photos_job.id},
+            status=status.HTTP_202_ACCEPTED,
+            headers={
+                "Location": request.build_absolute_uri(
+                    serializer.photos_job.get_absolute_url()
+                )
+            },
+        )
+
 
 @extend_schema(tags=["Лошади"])
 class HorseDetailAPIView(RetrieveUpdateDestroyAPIView):
@@ -238,19 +260,19 @@ class HorseDetailAPIView(RetrieveUpdateDestroyAPIView):
     permission_classes = [HorsePermission]
     serializer_class = HorseSerializer
 
-    def get_queryset(self):
-        return Horse.objects.all()
+    def get_queryset(self, has_moderate_access=False):
+        return get_horse_detail_queryset(self.request, has_moderate_access)
 
     @extend_schema(tags=["Лошади"], summary="Получение одной лошади")
     def retrieve(self, request, *args, **kwargs):
-        try:
-            instance = Horse.objects.get(pk=kwargs["pk"])
-        except Horse.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
         has_moderate_access = (
             request.user.is_authenticated
             and get_has_horses_moderate_permission(request.user)
         )
+        try:
+            instance = self.get_queryset(has_moderate_access).get(pk=kwargs["pk"])
+        except Horse.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = self.serializer_class(
             instance,
             context={"request": request, "has_moderate_access": has_moderate_access},
@@ -260,7 +282,7 @@ class HorseDetailAPIView(RetrieveUpdateDestroyAPIView):
     @extend_schema(tags=["Лошади"], summary="Изменение лошади")
     def patch(self, request, *args, **kwargs):
         try:
-            instance = Horse.objects.get(pk=kwargs["pk"])
+            instance = self.get_queryset(True).get(pk=kwargs["pk"])
         except Horse.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = self.serializer_class(
@@ -270,9 +292,7 @@ class HorseDetailAPIView(RetrieveUpdateDestroyAPIView):
             context={"request": request, "has_moderate_access": True},
         )
         if serializer.is_valid():
-            horse = serializer.save()
-            if request.data.get("breed") is not None:
-                horse.set_breed(request.data.get("breed"))
+            serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -291,7 +311,7 @@ class HorsePedigreeAPIView(APIView):
         if horse.bdate:
             query_dict["bdate__year__lte"] = horse.bdate.year
 
-        return Horse.objects.filter(**query_dict).exclude(id=horse.pk)
+        return Horse.objects.with_main_info().filter(**query_dict).exclude(id=horse.pk)
 
     def get_children_queryset(self, horse: Horse):
         query_dict = dict()
@@ -300,7 +320,17 @@ class HorsePedigreeAPIView(APIView):
         if horse.ddate:
             query_dict["bdate__year__lte"] = horse.ddate.year
 
-        return Horse.objects.filter(**query_dict).exclude(id=horse.pk)
+        return Horse.objects.with_main_info().filter(**query_dict).exclude(id=horse.pk)
+
+    def get_horse_response(self, horse: Horse):
+        horse = get_horse_detail_queryset(self.request, True).get(pk=horse.pk)
+        return Response(
+            data=HorseSerializer(
+                instance=horse,
+                context={"request": self.request, "has_moderate_access": True},
+            ).data,
+            status=status.HTTP_200_OK,
+        )
 
     def get(self, request, *args, **kwargs):
         mode = kwargs.get("mode")
@@ -387,13 +417,7 @@ class HorsePedigreeAPIView(APIView):
             return Response(
                 data={"error": ex.message}, status=status.HTTP_400_BAD_REQUEST
             )
-        return Response(
-            data=HorseSerializer(
-                instance=horse,
-                context={"request": self.request, "has_moderate_access": True},
-            ).data,
-            status=status.HTTP_200_OK,
-        )
+        return self.get_horse_response(horse)
 
     def delete(self, request, *args, **kwargs):
         mode = kwargs.get("mode")
@@ -452,17 +476,204 @@ class HorsePedigreeAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND,
                 )
             horse.children.remove(*ped_horses)
+        return self.get_horse_response(horse)
+
+
+@extend_schema(tags=["Лошади"])
+class HorseBulkAPIView(APIView):
+    permission_classes = [HorsePermission]
+
+    @extend_schema(tags=["Лошади"], summary="Массовое добавление и изменение лошадей")
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get("items")
+        if not isinstance(items, list) or not items:
+            return Response(
+                data={"error": "Передайте список лошадей в items"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > HorseBulkWriter.max_items:
+            return Response(
+                data={
+                    "error": "Невозможно обработать более "
+                    f"{HorseBulkWriter.max_items} лошадей за запрос"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = HorseBulkWriter(items, user=request.user).save()
         return Response(
-            data=HorseSerializer(
-                horse, context={"request": self.request, "has_moderate_access": True}
-            ).data,
-            status=status.HTTP_200_OK,
+            data=result,
+            status=(
+                status.HTTP_200_OK
+                if result["created"] or result["updated"]
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+
+@extend_schema(tags=["Лошади"])
+class HorseStudbookImportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    @extend_schema(tags=["Лошади"], summary="Импорт племенной книги из CSV/XLSX")
+    def post(self, request, *args, **kwargs):
+        file = request.FILES.get("file")
+        if file is None:
+            return Response(
+                data={"error": "Файл племенной книги не передан. Используйте file"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            file_format = get_file_format(file.name, request.data.get("format"))
+        except StudbookImportError as ex:
+            return Response(data={"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        staged = stage_files([file])
+        try:
+            job = import_studbook.enqueue(
+                files=staged,
+                file_format=file_format,
+                created_by_id=request.user.id,
+                created_by=request.user,
+            )
+        except Exception:
+            delete_staged(staged)
+            raise
+        # Импорт выполняется в фоне, результат доступен по ссылке Location
+        return Response(
+            data={"job_id": job.id},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": request.build_absolute_uri(job.get_absolute_url())},
         )
 
 
 @extend_schema(tags=["Лошади"])
 class HorsePhotosAPIView(APIView):
-    pass
+    permission_classes = [HorsePermission]
+    pagination = KeysetPagination(ordering=("position", "id"))
+
+    def get_photos_response(self, horse_id: int) -> Response:
+        return Response(
+            data={"photos_count": HorsePhoto.objects.filter(horse_id=horse_id).count()},
+            status=status.HTTP_200_OK,
+        )
+
+    def change_photos(self, request, pk: int, action) -> Response:
+        serializer = HorsePhotosSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        photo_ids = list(dict.fromkeys(serializer.validated_data["photos"]))
+        with transaction.atomic():
+            # Изменения альбома одной лошади выполняются по очереди
+            horse = Horse.objects.select_for_update().filter(pk=pk).only("id").first()
+            if horse is None:
+                return Response(
+                    data={"error": "Лошадь не найдена"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            error = action(horse, photo_ids)
+            if error:
+                return Response(
+                    data={"error": error}, status=status.HTTP_400_BAD_REQUEST
+                )
+        return self.get_photos_response(horse.id)
+
+    @extend_schema(
+        tags=["Лошади"],
+        summary="Фотографии лошади (постранично, cursor из next_cursor)",
+    )
+    def get(self, request, *args, **kwargs):
+        if not Horse.objects.filter(pk=kwargs["pk"]).exists():
+            return Response(
+                data={"error": "Лошадь не найдена"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        links = HorsePhoto.objects.filter(horse_id=kwargs["pk"])
+        count = links.count()
+        try:
+            links, next_cursor = self.pagination.paginate(
+                links.select_related("photo").prefetch_related("photo__variants"),
+                limit=get_limit(request.query_params.get("limit")),
+                cursor=request.query_params.get("cursor"),
+            )
+        except ValueError as ex:
+            return Response(data={"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        items = [
+            {
+                **PhotoMainInfoSerializer(
+                    link.photo, context={"request": request}
+                ).data,
+                "position": link.position,
+            }
+            for link in links
+        ]
+        return Response(
+            data={"count": count, "items": items, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK,
+        )
+
+    @extend_schema(
+        tags=["Лошади"],
+        summary="Добавление фотографий в конец альбома",
+        request=HorsePhotosSerializer,
+    )
+    def post(self, request, *args, **kwargs):
+        def add(horse, photo_ids):
+            existing = set(
+                Photo.objects.filter(id__in=photo_ids).values_list("id", flat=True)
+            )
+            if len(existing) != len(photo_ids):
+                return "Некоторые фотографии не найдены"
+            HorsePhoto.append(horse.id, photo_ids)
+
+        return self.change_photos(request, kwargs["pk"], add)
+
+    @extend_schema(
+        tags=["Лошади"],
+        summary="Изменение порядка: photos в начало альбома в указанном порядке",
+        request=HorsePhotosSerializer,
+    )
+    def patch(self, request, *args, **kwargs):
+        def reorder(horse, photo_ids):
+            linked = HorsePhoto.objects.filter(
+                horse_id=horse.id, photo_id__in=photo_ids
+            ).count()
+            if linked != len(photo_ids):
+                return "Некоторые фотографии не добавлены к лошади"
+            HorsePhoto.reorder(horse.id, photo_ids)
+
+        return self.change_photos(request, kwargs["pk"], reorder)
+
+    @extend_schema(
+        tags=["Лошади"],
+        summary="Удаление фотографий из альбома (фотографии остаются в галерее)",
+        request=HorsePhotosSerializer,
+    )
+    def delete(self, request, *args, **kwargs):
+        def remove(horse, photo_ids):
+            HorsePhoto.remove(horse.id, photo_ids)
+
+        return self.change_photos(request, kwargs["pk"], remove)
+
+
+@extend_schema(tags=["Лошади"])
+class HorsePhotosExportAPIView(APIView):
+    permission_classes = [HorsePermission]
+
+    @extend_schema(tags=["Лошади"], summary="ZIP-архив всех фотографий лошади")
+    def get(self, request, *args, **kwargs):
+        horse = Horse.objects.filter(pk=kwargs["pk"]).only("id", "name").first()
+        if horse is None:
+            return Response(
+                data={"error": "Лошадь не найдена"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        photos = Photo.objects.filter(horse_links__horse=horse).order_by(
+            "horse_links__position", "horse_links__id"
+        )
+        return get_zip_response(photos, horse.name)
 
 
 @extend_schema(tags=["Породы лошадей"])
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.worker import run_pool
+
+
+class Command(BaseCommand):
+    help = "This command will run background job workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=getattr(settings, "JOB_WORKERS", 2),
+            help="Количество процессов (по умолчанию JOB_WORKERS)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=getattr(settings, "JOB_POLL_INTERVAL", 1),
+            help="Пауза между проверками пустой очереди в секундах",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Выполнить задачи из очереди и завершить работу",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("Количество процессов должно быть больше нуля")
+        if options["poll_interval"] <= 0:
+            raise CommandError("Пауза между проверками должна быть больше нуля")
+
+        self.stdout.write(f"Запуск воркеров: {options['workers']}")
+        run_pool(options["workers"], options["poll_interval"], burst=options["burst"])
+        self.stdout.write(self.style.SUCCESS("Воркеры остановлены"))
@@ -0,0 +1,86 @@
+from django.db import models
+from django.utils import timezone
+
+JOB_PENDING = 0
+JOB_RUNNING = 1
+JOB_DONE = 2
+JOB_FAILED = 3
+
+JOB_STATUS_CHOICES = [
+    (JOB_PENDING, "В очереди"),
+    (JOB_RUNNING, "Выполняется"),
+    (JOB_DONE, "Выполнено"),
+    (JOB_FAILED, "Ошибка"),
+]
+
+
+class Job(models.Model):
+    name: models.CharField = models.CharField(
+        verbose_name="Задача", max_length=100, null=False, blank=False
+    )
+    payload: models.JSONField = models.JSONField(
+        verbose_name="Параметры", default=dict, blank=True
+    )
+    status: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        verbose_name="Статус", choices=JOB_STATUS_CHOICES, default=JOB_PENDING
+    )
+    attempts: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        verbose_name="Количество попыток", default=0
+    )
+    max_attempts: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(
+        verbose_name="Максимальное количество попыток", default=5
+    )
+    run_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Запустить не раньше", default=timezone.now
+    )
+    locked_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата и время запуска", null=True, blank=True
+    )
+    locked_by: models.CharField = models.CharField(
+        verbose_name="Обработчик", max_length=100, null=True, blank=True
+    )
+    result: models.JSONField = models.JSONField(
+        verbose_name="Результат", null=True, blank=True
+    )
+    last_error: models.TextField = models.TextField(
+        verbose_name="Последняя ошибка", null=True, blank=True
+    )
+    created_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата и время добавления", auto_now_add=True
+    )
+    created_by: models.ForeignKey = models.ForeignKey(
+        to="profile_management.NewUser",
+        verbose_name="Создатель",
+        null=True,
+        blank=True,
+        related_name="jobs",
+        on_delete=models.SET_NULL,
+    )
+    finished_at: models.DateTimeField = models.DateTimeField(
+        verbose_name="Дата и время завершения", null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ["-created_at"]
+        indexes = [
+            # Воркеры выбирают задачи только из очереди и зависших,
+            # поэтому завершённые задачи в индекс не попадают
+            models.Index(
+                fields=["run_at"],
+                name="jobs_job_pending_idx",
+                condition=models.Q(status=JOB_PENDING),
+            ),
+            models.Index(
+                fields=["locked_at"],
+                name="jobs_job_running_idx",
+                condition=models.Q(status=JOB_RUNNING),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Задача {self.name} ({self.id})"
+
+    def get_absolute_url(self):
+        return f"/api/v1/jobs/{self.id}/"
@@ -0,0 +1,192 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, Job
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 6 * 60 * 60
+
+tasks: dict[str, "Task"] = {}
+
+
+class Task:
+    """Функция, которая выполняется в процессе runworker.
+
+    Параметры сохраняются в базе в JSON, поэтому функция принимает только
+    именованные аргументы простых типов и возвращает JSON-совместимый
+    результат.
+    """
+
+    def __init__(self, func, name: str, max_attempts: int, retry_delay: int):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, run_at=None, created_by=None, **payload) -> Job:
+        return self.enqueue_many([payload], run_at=run_at, created_by=created_by)[0]
+
+    def enqueue_many(
+        self, payloads: list[dict], run_at=None, created_by=None
+    ) -> list[Job]:
+        """Добавляет задачи в очередь одним запросом.
+
+        Задачи видны воркерам только после фиксации текущей транзакции.
+        """
+        fields = {
+            "name": self.name,
+            "max_attempts": self.max_attempts,
+            "created_by": created_by,
+        }
+        if run_at is not None:
+            fields["run_at"] = run_at
+        return Job.objects.bulk_create(
+            [Job(payload=payload, **fields) for payload in payloads]
+        )
+
+
+def task(name: str | None = None, max_attempts: int = 5, retry_delay: int = 10):
+    """Регистрирует функцию как фоновую задачу."""
+
+    def decorator(func) -> Task:
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        tasks[task_name] = Task(func, task_name, max_attempts, retry_delay)
+        return tasks[task_name]
+
+    return decorator
+
+
+def get_retry_delay(retry_delay: int, attempts: int) -> timedelta:
+    # Случайная добавка разносит повторы задач, упавших одновременно
+    delay = min(retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return timedelta(seconds=delay * random.uniform(1, 1.25))
+
+
+def get_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_ready_jobs():
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, "JOB_TIMEOUT", 60 * 60))
+    return Job.objects.filter(
+        Q(status=JOB_PENDING, run_at__lte=now)
+        | Q(status=JOB_RUNNING, locked_at__lt=stale)
+    )
+
+
+def claim(worker_id: str) -> Job | None:
+    """Забирает одну задачу, готовую к выполнению.
+
+    В PostgreSQL строка блокируется через SELECT ... FOR UPDATE SKIP LOCKED,
+    поэтому воркеры не ждут друг друга. Условный UPDATE не даёт выдать
+    задачу дважды в базах без блокировки строк (SQLite). Задачи, которые
+    выполняются дольше JOB_TIMEOUT, считаются зависшими и выдаются повторно.
+    """
+    ready = get_ready_jobs()
+    with transaction.atomic():
+        job_id = (
+            ready.select_for_update(skip_locked=True)
+            .order_by("run_at")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = ready.filter(id=job_id).update(
+            status=JOB_RUNNING,
+            locked_at=timezone.now(),
+            locked_by=worker_id,
+            attempts=F("attempts") + 1,
+        )
+        if not claimed:
+            return None
+        return Job.objects.get(id=job_id)
+
+
+def execute(job: Job, worker_id: str) -> None:
+    job_task = tasks.get(job.name)
+    try:
+        if job.attempts > job.max_attempts:
+            # Воркер каждый раз завершался, не дойдя до конца задачи
+            raise RuntimeError("Превышено количество попыток")
+        if job_task is None:
+            # Задача могла появиться в новой версии, которая ещё не
+            # развёрнута на этом сервере
+            raise LookupError(f"Задача {job.name} не зарегистрирована")
+        result = job_task.func(**job.payload)
+    except Exception:
+        fields = {"last_error": traceback.format_exc()}
+        if job.attempts < job.max_attempts:
+            retry_delay = job_task.retry_delay if job_task is not None else 60
+            fields["status"] = JOB_PENDING
+            fields["run_at"] = timezone.now() + get_retry_delay(
+                retry_delay, job.attempts
+            )
+            logger.warning("Задача %s (%s) будет повторена", job.name, job.id)
+        else:
+            fields["status"] = JOB_FAILED
+            fields["finished_at"] = timezone.now()
+            logger.error("Задача %s (%s) не выполнена", job.name, job.id)
+    else:
+        fields = {"status": JOB_DONE, "result": result, "finished_at": timezone.now()}
+
+    Job.objects.filter(id=job.id, locked_by=worker_id).update(
+        locked_at=None, locked_by=None, **fields
+    )
+
+
+def work(
+    worker_id: str | None = None,
+    stop_event: threading.Event | None = None,
+    poll_interval: float | None = None,
+    burst: bool = False,
+) -> int:
+    """Выполняет задачи, пока не установлен stop_event.
+
+    При burst=True возвращается, как только очередь опустеет.
+    Возвращает количество обработанных задач.
+    """
+    worker_id = worker_id or get_worker_id()
+    stop_event = stop_event or threading.Event()
+    if poll_interval is None:
+        poll_interval = getattr(settings, "JOB_POLL_INTERVAL", 1)
+
+    processed = 0
+    while not stop_event.is_set():
+        close_old_connections()
+        job = claim(worker_id)
+        if job is None:
+            if burst:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        execute(job, worker_id)
+        processed += 1
+    return processed
+
+
+def purge_jobs() -> int:
+    """Удаляет выполненные задачи старше JOB_RETENTION_DAYS.
+
+    Задачи с ошибкой остаются для разбора.
+    """
+    days = getattr(settings, "JOB_RETENTION_DAYS", 7)
+    deleted, _ = Job.objects.filter(
+        status=JOB_DONE, finished_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
+    return deleted
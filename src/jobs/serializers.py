@@ -0,0 +1,29 @@
+from rest_framework import serializers
+
+from .models import JOB_FAILED, Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source="get_status_display")
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "name",
+            "status",
+            "status_display",
+            "attempts",
+            "result",
+            "error",
+            "created_at",
+            "finished_at",
+        ]
+
+    @staticmethod
+    def get_error(obj: Job):
+        # Трассировка остаётся в админке, клиенту сообщается только факт ошибки
+        if obj.status == JOB_FAILED:
+            return "Не удалось выполнить задачу"
+        return None
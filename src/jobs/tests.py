@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, Job
+from .queue import claim, task, work
+
+calls = []
+
+
+@task("jobs.tests.add")
+def add(a: int, b: int) -> int:
+    calls.append((a, b))
+    return a + b
+
+
+@task("jobs.tests.fail", max_attempts=2, retry_delay=30)
+def fail():
+    raise ValueError("Ошибка")
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_work(self):
+        job = add.enqueue(a=2, b=3)
+        later = add.enqueue(run_at=timezone.now() + timedelta(hours=1), a=1, b=1)
+
+        self.assertEqual(work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JOB_DONE)
+        self.assertEqual(job.result, 5)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.locked_by)
+        self.assertEqual(calls, [(2, 3)])
+        self.assertEqual(Job.objects.get(id=later.id).status, JOB_PENDING)
+
+    def test_retry_with_backoff(self):
+        job = fail.enqueue()
+        with self.assertLogs("jobs.queue", "WARNING"):
+            work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JOB_PENDING)
+        self.assertIn("ValueError", job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=29))
+
+        # Повтор до наступления run_at не выполняется
+        self.assertEqual(work(burst=True), 0)
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        with self.assertLogs("jobs.queue", "ERROR"):
+            work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, JOB_FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_stale_job_is_reclaimed(self):
+        job = add.enqueue(a=1, b=2)
+        self.assertEqual(claim("first").id, job.id)
+        self.assertIsNone(claim("second"))
+
+        Job.objects.filter(id=job.id).update(
+            locked_at=timezone.now() - timedelta(days=1)
+        )
+        reclaimed = claim("second")
+        self.assertEqual(reclaimed.id, job.id)
+        self.assertEqual(reclaimed.status, JOB_RUNNING)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertEqual(reclaimed.locked_by, "second")
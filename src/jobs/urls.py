@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import JobRetrieveAPIView
+
+urlpatterns = [
+    path("<int:pk>/", JobRetrieveAPIView.as_view()),
+]
@@ -0,0 +1,28 @@
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Job
+from .serializers import JobSerializer
+
+
+@extend_schema(tags=["Фоновые задачи"])
+class JobRetrieveAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=["Фоновые задачи"],
+        summary="Статус фоновой задачи",
+        responses=JobSerializer,
+    )
+    def get(self, request, *args, **kwargs):
+        queryset = Job.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(created_by=request.user)
+        try:
+            job = queryset.get(pk=kwargs["pk"])
+        except Job.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(JobSerializer(job).data)
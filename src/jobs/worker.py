@@ -0,0 +1,88 @@
+import logging
+import multiprocessing
+import signal
+import time
+from multiprocessing.connection import wait
+
+logger = logging.getLogger(__name__)
+
+# Модуль импортируется дочерними процессами до настройки Django,
+# поэтому модели и queue.py импортируются внутри функций
+
+
+def worker_main(stop_event, poll_interval: float, burst: bool) -> None:
+    # Прерывание с клавиатуры получает вся группа процессов, а воркер
+    # должен дописать текущую задачу и выйти по stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import django
+
+    django.setup()
+
+    from .queue import work
+
+    work(stop_event=stop_event, poll_interval=poll_interval, burst=burst)
+
+
+def run_pool(
+    processes: int,
+    poll_interval: float,
+    burst: bool = False,
+    purge_interval: int = 60 * 60,
+) -> None:
+    """Запускает воркеры в отдельных процессах и следит за ними.
+
+    Упавший процесс перезапускается. Первый SIGINT/SIGTERM просит воркеры
+    завершиться после текущей задачи, второй останавливает их сразу.
+    """
+    from django.db import connection
+
+    from .queue import purge_jobs
+
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    pool = []
+
+    def start():
+        process = context.Process(
+            target=worker_main, args=(stop_event, poll_interval, burst)
+        )
+        process.start()
+        return process
+
+    def stop(signum, frame):
+        if stop_event.is_set():
+            for process in pool:
+                process.terminate()
+        stop_event.set()
+
+    handlers = {
+        signum: signal.signal(signum, stop)
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    purged_at = 0.0
+    try:
+        pool.extend(start() for _ in range(processes))
+        while pool:
+            wait([process.sentinel for process in pool], timeout=1)
+            for process in [process for process in pool if not process.is_alive()]:
+                pool.remove(process)
+                if process.exitcode and not stop_event.is_set():
+                    logger.error(
+                        "Воркер %s завершился с кодом %s и будет перезапущен",
+                        process.pid,
+                        process.exitcode,
+                    )
+                    time.sleep(1)
+                    pool.append(start())
+
+            if not burst and time.monotonic() - purged_at > purge_interval:
+                purge_jobs()
+                connection.close()
+                purged_at = time.monotonic()
+    finally:
+        stop_event.set()
+        for process in pool:
+            process.join()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
@@ -9,7 +9,45 @@ class ProfileManagementConfig(AppConfig):
     name = "profile_management"
 
     def ready(self):
+        from django.contrib.auth.models import Group
+        from django.db.models.signals import (
+            m2m_changed,
+            post_delete,
+            post_save,
+            pre_delete,
+        )
+
+        from equestrian.authentication import invalidate_cached_user
+
+        from . import claims
+        from .models import NewUser
+
         request_started.connect(self.run_startup_tasks, weak=False)
+        # Пользователь из кэша токенов загружается заново после изменения
+        post_save.connect(
+            invalidate_cached_user, sender=NewUser, dispatch_uid="jwt_user_cache"
+        )
+        post_delete.connect(
+            invalidate_cached_user, sender=NewUser, dispatch_uid="jwt_user_cache"
+        )
+        # Изменение групп и прав отзывает claims выданных токенов
+        for through in (NewUser.groups.through, NewUser.user_permissions.through):
+            m2m_changed.connect(
+                claims.on_user_relations_changed,
+                sender=through,
+                dispatch_uid=f"jwt_claims_{through._meta.model_name}",
+            )
+        m2m_changed.connect(
+            claims.on_group_permissions_changed,
+            sender=Group.permissions.through,
+            dispatch_uid="jwt_claims_group_permissions",
+        )
+        post_save.connect(
+            claims.on_group_saved, sender=Group, dispatch_uid="jwt_claims_group"
+        )
+        pre_delete.connect(
+            claims.on_group_deleted, sender=Group, dispatch_uid="jwt_claims_group"
+        )
 
     def run_startup_tasks(self, sender, **kwargs):
         request_started.disconnect(self.run_startup_tasks)
@@ -0,0 +1,84 @@
+from collections.abc import Iterable
+
+from django.contrib.auth.models import Group
+from django.db.models import F
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+
+from equestrian.authentication import (
+    GROUPS_CLAIM,
+    PERMISSIONS_CLAIM,
+    PERMISSIONS_VERSION_CLAIM,
+    token_cache,
+)
+
+from .models import NewUser
+from .permissions import CLAIM_PERMISSIONS
+
+
+def set_permission_claims(token: Token, user: NewUser) -> None:
+    token[GROUPS_CLAIM] = sorted(user.groups.values_list("name", flat=True))
+    # Права суперпользователя проверяются по флагу is_superuser. Все права
+    # пользователя могут не поместиться в cookie (4 КБ), поэтому передаются
+    # только проверяемые через user_has_perm
+    token[PERMISSIONS_CLAIM] = (
+        []
+        if user.is_superuser
+        else sorted(user.get_all_permissions() & CLAIM_PERMISSIONS)
+    )
+    token[PERMISSIONS_VERSION_CLAIM] = user.permissions_version
+
+
+def update_permission_claims(token: Token) -> None:
+    """Обновляет claims токена по текущим группам и правам пользователя
+    (при обновлении access-токена по refresh-токену)."""
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    user = NewUser.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+    if user is not None:
+        set_permission_claims(token, user)
+
+
+def bump_permissions_version(user_ids: Iterable[int]) -> None:
+    # Claims выданных токенов перестают действовать, пользователь из кэша
+    # токенов загружается заново, чтобы увидеть новую версию
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    NewUser.objects.filter(id__in=user_ids).update(
+        permissions_version=F("permissions_version") + 1
+    )
+    token_cache.invalidate_users(user_ids)
+
+
+def on_user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # NewUser.groups и NewUser.user_permissions
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        bump_permissions_version([instance.pk])
+    elif action == "pre_clear":
+        bump_permissions_version(instance.user_set.values_list("id", flat=True))
+    else:
+        bump_permissions_version(pk_set)
+
+
+def on_group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        users = NewUser.objects.filter(groups=instance)
+    elif action == "pre_clear":
+        users = NewUser.objects.filter(groups__permissions=instance)
+    else:
+        users = NewUser.objects.filter(groups__in=pk_set)
+    bump_permissions_version(users.values_list("id", flat=True).distinct())
+
+
+def on_group_deleted(sender, instance: Group, **kwargs):
+    bump_permissions_version(instance.user_set.values_list("id", flat=True))
+
+
+def on_group_saved(sender, instance: Group, created: bool, **kwargs):
+    # В claims хранятся названия групп
+    if not created:
+        bump_permissions_version(instance.user_set.values_list("id", flat=True))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("profile_management", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="newuser",
+            name="permissions_version",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Версия прав"
+            ),
+        ),
+    ]
@@ -13,6 +13,11 @@ class NewUser(AbstractUser):
         blank=True,
         default="profile_photos/base_avatar.png",
     )
+    # Увеличивается при изменении групп и прав, токены со старым значением
+    # в claim "pv" проверяются по базе (profile_management.claims)
+    permissions_version: models.PositiveIntegerField = models.PositiveIntegerField(
+        verbose_name="Версия прав", default=0, editable=False
+    )
 
     class Meta:
         verbose_name = "Пользователь"
@@ -2,6 +2,11 @@ from rest_framework import permissions
 
 from profile_management.models import NewUser
 
+# Права, которые проверяют классы разрешений приложений (регистрируются
+# в AppConfig.ready()). Только они передаются в claims токена, остальные
+# права проверяются по базе
+CLAIM_PERMISSIONS: set[str] = set()
+
 
 class UserPermission(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -11,4 +16,27 @@ class UserPermission(permissions.BasePermission):
 
 
 def get_has_users_admin_permission(user: NewUser):
-    return bool(user.groups.filter(name="UserAdmin").exists())
+    return user_in_group(user, "UserAdmin")
+
+
+def user_in_group(user: NewUser, group_name: str) -> bool:
+    # permission_claims задаёт CachedJWTAuthentication, если claims токена
+    # актуальны; иначе (сессия, старый токен) проверка выполняется по базе
+    claims = getattr(user, "permission_claims", None)
+    if claims is not None:
+        return group_name in claims.groups
+    return bool(user.groups.filter(name=group_name).exists())
+
+
+def register_claim_permissions(*perms: str) -> None:
+    CLAIM_PERMISSIONS.update(perms)
+
+
+def user_has_perm(user: NewUser, perm: str) -> bool:
+    claims = getattr(user, "permission_claims", None)
+    if claims is None or perm not in CLAIM_PERMISSIONS:
+        return bool(user.has_perm(perm))
+    # Как ModelBackend: у неактивного пользователя прав нет
+    if not user.is_active:
+        return False
+    return user.is_superuser or perm in claims.perms
@@ -1,7 +1,9 @@
 from typing import ClassVar
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from .claims import set_permission_claims
 from .models import NewUser
 from django.contrib.auth.models import Group
 
@@ -86,6 +88,15 @@ class UserSerializer(serializers.ModelSerializer):
         return user
     
 
+class PermissionClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user: NewUser):
+        # Группы и права в токене избавляют от запросов при проверке прав
+        token = super().get_token(user)
+        set_permission_claims(token, user)
+        return token
+
+
 class UserGroupsMetadataSerializer(serializers.ModelSerializer):
     _GROUPS_TRANSLATE_REGISTRY: ClassVar[dict[str, str]] = {
         "UserAdmin": "Администратор пользователей",
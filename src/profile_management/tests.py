@@ -0,0 +1,165 @@
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.tokens import AccessToken
+
+from equestrian.authentication import (
+    CachedJWTAuthentication,
+    VerifiedTokenCache,
+    token_cache,
+)
+
+from .models import NewUser
+from .permissions import user_has_perm, user_in_group
+
+
+class TokenCacheTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = NewUser.objects.create_user(username="rider", password="rider")
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def get_me(self, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/auth/me", **kwargs)
+        return response, len(queries)
+
+    def test_cookie_token_is_decoded_once(self):
+        decode = mock.patch.object(
+            TokenBackend, "decode", autospec=True, side_effect=TokenBackend.decode
+        )
+        with decode as mocked:
+            self.client.cookies["access_token"] = self.token
+            first, first_queries = self.get_me()
+            second, second_queries = self.get_me()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        # Токен проверен один раз для middleware и DRF, пользователь
+        # второго запроса создан из кэша без запроса к базе
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(second_queries, first_queries - 1)
+
+    def test_user_changes_are_applied(self):
+        header = {"HTTP_AUTHORIZATION": f"Bearer {self.token}"}
+        self.assertEqual(self.get_me(**header)[0].status_code, 200)
+        self.user.first_name = "Анна"
+        self.user.save()
+        self.assertEqual(self.get_me(**header)[0].data["first_name"], "Анна")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me(**header)[0].status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        with override_settings(JWT_USER_CACHE_TTL=0):
+            _, first_queries = self.get_me(**header)
+            # Без срока хранения пользователь загружается каждый раз
+            self.assertEqual(self.get_me(**header)[1], first_queries)
+
+    def test_invalid_and_evicted_tokens(self):
+        response, _ = self.get_me(HTTP_AUTHORIZATION="Bearer broken")
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(token_cache.entries)
+
+        cache = VerifiedTokenCache(max_size=2)
+        tokens = [str(AccessToken.for_user(self.user)) for _ in range(3)]
+        entries = [cache.get(token) for token in tokens]
+        self.assertIs(cache.get(tokens[2]), entries[2])
+        self.assertEqual(
+            list(cache.entries), [cache.get_key(token) for token in tokens[1:]]
+        )
+
+
+class PermissionClaimsTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name="UserAdmin")
+        cls.user = NewUser.objects.create_user(username="admin", password="admin")
+        cls.user.groups.add(cls.group)
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    def login(self):
+        response = self.client.post(
+            "/api/v1/auth/token", {"username": "admin", "password": "admin"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return AccessToken(response.cookies["access_token"].value)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def test_login_token_claims(self):
+        token = self.login()
+        self.assertEqual(token["groups"], ["UserAdmin"])
+        self.assertEqual(token["perms"], [])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/users/page_metadata")
+        self.assertEqual(response.status_code, 200)
+        # Группа пользователя взята из токена, а не из базы
+        self.assertFalse(
+            [query for query in queries if "newuser_groups" in query["sql"]]
+        )
+
+        # Исключение из группы отзывает claims выданного токена
+        self.user.groups.remove(self.group)
+        response = self.client.get("/api/v1/users/page_metadata")
+        self.assertEqual(response.status_code, 403)
+
+        # Access-токен, обновлённый по refresh-токену, получает текущие claims
+        del self.client.cookies["access_token"]
+        response = self.client.get("/api/v1/auth/me")
+        token = AccessToken(response.cookies["access_token"].value)
+        self.assertEqual(token["groups"], [])
+        self.user.refresh_from_db()
+        self.assertEqual(token["pv"], self.user.permissions_version)
+
+    def test_permission_checks_use_claims(self):
+        self.group.permissions.add(
+            *Permission.objects.filter(
+                codename__in=["change_horse", "add_breed"],
+                content_type__app_label="horses",
+            )
+        )
+        token = self.login()
+        # В токен попадают только права, проверяемые классами разрешений
+        self.assertEqual(token["perms"], ["horses.change_horse"])
+        self.authenticate(token)
+        user = self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.assertTrue(user_in_group(user, "UserAdmin"))
+            self.assertFalse(user_in_group(user, "GalleryModerator"))
+            self.assertTrue(user_has_perm(user, "horses.change_horse"))
+            self.assertFalse(user_has_perm(user, "gallery.change_photo"))
+        # Остальные права проверяются по базе
+        self.assertTrue(user_has_perm(user, "horses.add_breed"))
+
+        # Новые права группы: claims устарели, проверка идёт по базе
+        self.group.permissions.add(
+            Permission.objects.get(
+                codename="change_photo", content_type__app_label="gallery"
+            )
+        )
+        user = self.authenticate(token)
+        self.assertIsNone(user.permission_claims)
+        self.assertTrue(user_has_perm(user, "gallery.change_photo"))
+
+        # Старые токены без claims проверяются по базе
+        user = self.authenticate(AccessToken.for_user(self.user))
+        self.assertIsNone(user.permission_claims)
+        self.assertTrue(user_in_group(user, "UserAdmin"))
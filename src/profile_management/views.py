@@ -15,12 +15,19 @@ from profile_management.permissions import UserPermission
 from profile_management.swager_schemas import CustomTokenObtainPairViewExtendSchema, LogoutViewExtendSchema, UserInfoRetrieveAPIViewExtendSchema, UserListCreateAPIViewExtendSchema, UserPageMetaDataAPIViewExtendSchema, UserRetrieveUpdateDestroyAPIViewExtendSchema
 
 from .models import NewUser
-from .serializers import UserPageMetadataSerializer, UserSelfSerializer, UserSerializer
+from .serializers import (
+    PermissionClaimsTokenObtainPairSerializer,
+    UserPageMetadataSerializer,
+    UserSelfSerializer,
+    UserSerializer,
+)
 
 
 @extend_schema(tags=["Пользователи: авторизация"])
 @extend_schema_view(**CustomTokenObtainPairViewExtendSchema)
 class CustomTokenObtainPairView(TokenObtainPairView):
+    serializer_class = PermissionClaimsTokenObtainPairSerializer
+
     def post(self, request, *args, **kwargs):
         response = super().post(request, *args, **kwargs)
 
@@ -0,0 +1,178 @@
+import hashlib
+import io
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileRange:
+    """Часть открытого файла [start, end) с интерфейсом файла.
+
+    fileno() возвращает дескриптор исходного файла, смещение которого
+    установлено на start, поэтому сервер (gunicorn) передаёт часть файла
+    через sendfile, ограничивая длину заголовком Content-Length.
+    """
+
+    def __init__(self, file, start: int, end: int):
+        self.file = file
+        self.name = file.name
+        self.start = start
+        self.end = end
+        file.seek(start)
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.file.tell() - self.start
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            position = self.end + offset
+        elif whence == io.SEEK_CUR:
+            position = self.file.tell() + offset
+        else:
+            position = self.start + offset
+        self.file.seek(min(max(position, self.start), self.end))
+        return self.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.end - self.file.tell()
+        if size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(max(size, 0))
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def get_etag(path: Path, stat: os.stat_result) -> str:
+    # Файл заменяется только целиком, поэтому путь, размер и время изменения
+    # однозначно определяют содержимое
+    source = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f'"{hashlib.sha256(source.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Проверяет, совпадает ли etag с одним из тегов If-None-Match.
+
+    Заголовок - "*" или список тегов через запятую, теги сравниваются
+    целиком без учёта признака слабого тега W/ (слабое сравнение).
+    """
+    etags = parse_etags(header)
+    if etags == ["*"]:
+        return True
+    return etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in etags}
+
+
+def get_range(header: str, size: int) -> tuple[int, int] | None:
+    """Разбирает заголовок Range, возвращает (начало, конец) или None.
+
+    Поддерживается один диапазон, для нескольких диапазонов отдаётся весь
+    файл. Если диапазон за пределами файла, вызывается ValueError.
+    """
+    match = RANGE_RE.match(header.replace(" ", ""))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N - последние N байт
+        start, end = max(size - int(end), 0), size
+    else:
+        start = int(start)
+        end = min(int(end) + 1, size) if end else size
+    if start >= size or start >= end:
+        raise ValueError
+    return start, end
+
+
+def get_accel_url(path: Path) -> str | None:
+    for directory, prefix in getattr(settings, "MEDIA_ACCEL_LOCATIONS", {}).items():
+        try:
+            relative = path.relative_to(Path(directory).resolve())
+        except ValueError:
+            continue
+        return prefix.rstrip("/") + "/" + relative.as_posix()
+    return None
+
+
+def send_file(
+    request,
+    path,
+    etag: str | None = None,
+    cache_control: str = "public, max-age=3600",
+    content_type: str | None = None,
+) -> HttpResponse:
+    """Отдаёт файл с диска, не передавая его содержимое через Python.
+
+    При MEDIA_OFFLOAD="nginx" передачу выполняет nginx (X-Accel-Redirect,
+    внутренние location из MEDIA_ACCEL_LOCATIONS), при "sendfile" - Apache
+    или lighttpd (X-Sendfile). Без прокси файл отдаётся через FileResponse,
+    который сервер передаёт через sendfile. Поддерживаются If-None-Match
+    и Range (один диапазон, с проверкой If-Range).
+    Если файла нет, вызывается FileNotFoundError.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    etag = etag or get_etag(path, stat)
+    if content_type is None:
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    if etag_matches(request.headers.get("If-None-Match", ""), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = get_file_response(request, path, stat, etag, content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    return response
+
+
+def get_file_response(
+    request, path: Path, stat: os.stat_result, etag: str, content_type: str
+) -> HttpResponse:
+    offload = getattr(settings, "MEDIA_OFFLOAD", "")
+    accel_url = get_accel_url(path) if offload == "nginx" else None
+    if accel_url is not None:
+        # Range и условные запросы nginx обрабатывает сам
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = accel_url
+        return response
+    if offload == "sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = str(path)
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = get_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+    file = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end), content_type=content_type)
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end - 1}/{stat.st_size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,87 @@
+import base64
+import json
+
+from django.db.models import Q, QuerySet
+
+
+def get_limit(value, default: int = 50, maximum: int = 100) -> int:
+    try:
+        return min(max(int(value), 1), maximum)
+    except (ValueError, TypeError):
+        return default
+
+
+def get_offset(value) -> int:
+    try:
+        return max(int(value), 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+class KeysetPagination:
+    """Постраничный вывод по значениям ключа сортировки последней записи.
+
+    Следующая страница выбирается условием "после последней записи" по
+    индексу, а не пропуском offset строк, поэтому стоимость запроса не
+    зависит от номера страницы. ordering должен однозначно упорядочивать
+    записи (последним полем обычно идёт id).
+    """
+
+    def __init__(self, ordering: tuple[str, ...]):
+        self.ordering = ordering
+        self.fields = [field.lstrip("-") for field in ordering]
+
+    def encode_cursor(self, obj) -> str:
+        return self.encode_values([getattr(obj, field) for field in self.fields])
+
+    def encode_values(self, values: list) -> str:
+        """Cursor для значений ключа, в том числе без записи с ними."""
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in values
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, queryset: QuerySet, cursor: str) -> list:
+        """Возвращает значения ключа, при некорректном cursor - ValueError."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception as ex:
+            raise ValueError("Некорректный cursor") from ex
+
+    def get_filter(self, values: list) -> Q:
+        # (a, b) < (x, y) раскрывается в a < x OR (a = x AND b < y)
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            lookup = "lt" if field.startswith("-") else "gt"
+            part = Q(**{f"{self.fields[index]}__{lookup}": values[index]})
+            for previous, value in zip(self.fields[:index], values[:index]):
+                part &= Q(**{previous: value})
+            condition |= part
+        return condition
+
+    def paginate(
+        self, queryset: QuerySet, limit: int, cursor: str | None = None, offset=0
+    ) -> tuple[list, str | None]:
+        """Возвращает записи страницы и cursor следующей страницы (или None).
+
+        Без cursor страница выбирается по offset, чтобы клиенты со старыми
+        параметрами limit/offset продолжали работать.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(
+                self.get_filter(self.decode_cursor(queryset, cursor))
+            )
+            offset = 0
+        items = list(queryset[offset : offset + limit + 1])
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        return items, self.encode_cursor(items[-1])
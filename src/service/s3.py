@@ -0,0 +1,285 @@
+import hashlib
+import hmac
+import mimetypes
+import tempfile
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+from urllib.error import HTTPError
+from urllib.parse import quote, urlsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+EMPTY_PAYLOAD = hashlib.sha256(b"").hexdigest()
+READ_SIZE = 64 * 1024
+
+
+class S3Error(OSError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"S3 {status}: {message}")
+        self.status = status
+
+
+def encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+class S3Client:
+    """Минимальный клиент S3-совместимого хранилища (AWS S3, MinIO и т.п.).
+
+    Запросы подписываются Signature Version 4. Тело загружаемых файлов
+    не хешируется (UNSIGNED-PAYLOAD) и передаётся потоком, поэтому файл
+    не читается дважды и не загружается в память целиком.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        addressing_style: str = "path",
+        timeout: int = 60,
+    ):
+        endpoint = urlsplit(endpoint_url)
+        self.scheme = endpoint.scheme or "https"
+        self.host = endpoint.netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.addressing_style = addressing_style
+        self.timeout = timeout
+
+    def get_location(self, key: str) -> tuple[str, str]:
+        # path: host/bucket/key (MinIO), virtual: bucket.host/key (AWS)
+        path = "/" + encode(key, safe="/-_.~")
+        if self.addressing_style == "virtual":
+            return f"{self.bucket}.{self.host}", path
+        return self.host, f"/{encode(self.bucket)}{path}"
+
+    def get_signature(self, date: datetime, string_to_sign: str) -> str:
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (date.strftime("%Y%m%d"), self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    def get_scope(self, date: datetime) -> str:
+        return f"{date.strftime('%Y%m%d')}/{self.region}/s3/aws4_request"
+
+    def get_string_to_sign(
+        self,
+        method: str,
+        path: str,
+        query: dict,
+        headers: dict,
+        payload_hash: str,
+        date: datetime,
+    ) -> str:
+        canonical_query = "&".join(
+            f"{encode(name)}={encode(str(value))}"
+            for name, value in sorted(query.items())
+        )
+        signed_headers = ";".join(sorted(headers))
+        canonical_headers = "".join(
+            f"{name}:{' '.join(str(headers[name]).split())}\n"
+            for name in sorted(headers)
+        )
+        canonical_request = "\n".join(
+            [
+                method,
+                path,
+                canonical_query,
+                canonical_headers,
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        return "\n".join(
+            [
+                ALGORITHM,
+                date.strftime("%Y%m%dT%H%M%SZ"),
+                self.get_scope(date),
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+
+    def sign(
+        self,
+        method: str,
+        key: str,
+        headers: dict | None = None,
+        payload_hash: str = UNSIGNED_PAYLOAD,
+        date: datetime | None = None,
+    ) -> tuple[str, dict]:
+        """Возвращает URL и заголовки запроса с подписью в Authorization."""
+        date = date or datetime.now(dt_timezone.utc)
+        host, path = self.get_location(key)
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        headers["host"] = host
+        headers["x-amz-date"] = date.strftime("%Y%m%dT%H%M%SZ")
+        headers["x-amz-content-sha256"] = payload_hash
+        signature = self.get_signature(
+            date,
+            self.get_string_to_sign(method, path, {}, headers, payload_hash, date),
+        )
+        headers["authorization"] = (
+            f"{ALGORITHM} Credential={self.access_key}/{self.get_scope(date)}, "
+            f"SignedHeaders={';'.join(sorted(headers))}, Signature={signature}"
+        )
+        return f"{self.scheme}://{host}{path}", headers
+
+    def presign(
+        self,
+        method: str,
+        key: str,
+        expires: int = 3600,
+        headers: dict | None = None,
+        date: datetime | None = None,
+    ) -> str:
+        """Ссылка с подписью в параметрах запроса для клиента без ключей.
+
+        Заголовки headers (например, content-length) входят в подпись:
+        запрос с другими значениями хранилище отклонит.
+        """
+        date = date or datetime.now(dt_timezone.utc)
+        host, path = self.get_location(key)
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        headers["host"] = host
+        query = {
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self.access_key}/{self.get_scope(date)}",
+            "X-Amz-Date": date.strftime("%Y%m%dT%H%M%SZ"),
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": ";".join(sorted(headers)),
+        }
+        query["X-Amz-Signature"] = self.get_signature(
+            date,
+            self.get_string_to_sign(
+                method, path, query, headers, UNSIGNED_PAYLOAD, date
+            ),
+        )
+        query_string = "&".join(
+            f"{encode(name)}={encode(value)}" for name, value in sorted(query.items())
+        )
+        return f"{self.scheme}://{host}{path}?{query_string}"
+
+    def request(self, method: str, key: str, body=None, headers: dict | None = None):
+        url, headers = self.sign(
+            method,
+            key,
+            headers,
+            payload_hash=EMPTY_PAYLOAD if body is None else UNSIGNED_PAYLOAD,
+        )
+        # Host подставляет urllib, в подписи он уже учтён
+        headers.pop("host")
+        try:
+            return urlopen(
+                Request(url, data=body, headers=headers, method=method),
+                timeout=self.timeout,
+            )
+        except HTTPError as ex:
+            with ex:
+                raise S3Error(ex.code, ex.read(1024).decode(errors="replace"))
+
+    def put_object(self, key: str, body, size: int, content_type: str) -> None:
+        headers = {"content-length": str(size), "content-type": content_type}
+        self.request("PUT", key, body=body, headers=headers).close()
+
+    def get_object(self, key: str):
+        return self.request("GET", key)
+
+    def head_object(self, key: str) -> dict | None:
+        try:
+            with self.request("HEAD", key) as response:
+                return dict(response.headers)
+        except S3Error as ex:
+            if ex.status == 404:
+                return None
+            raise
+
+    def delete_object(self, key: str) -> None:
+        self.request("DELETE", key).close()
+
+
+@deconstructible
+class S3Storage(Storage):
+    """Хранилище медиафайлов Django в S3-совместимом хранилище.
+
+    Настраивается параметрами S3_* (equestrian/settings.py). Ссылки на файлы
+    ведут на S3_PUBLIC_URL (CDN или публичный bucket), без него - подписанные
+    ссылки на S3_URL_EXPIRES секунд. Файлы загружаются клиентами напрямую
+    по ссылкам get_upload_url (gallery.uploads).
+    """
+
+    def __init__(self, **options):
+        self.client = S3Client(
+            endpoint_url=options.get("endpoint_url", settings.S3_ENDPOINT_URL),
+            bucket=options.get("bucket", settings.S3_BUCKET),
+            access_key=options.get("access_key", settings.S3_ACCESS_KEY),
+            secret_key=options.get("secret_key", settings.S3_SECRET_KEY),
+            region=options.get("region", settings.S3_REGION),
+            addressing_style=options.get(
+                "addressing_style", settings.S3_ADDRESSING_STYLE
+            ),
+        )
+        self.public_url = options.get("public_url", settings.S3_PUBLIC_URL)
+        self.url_expires = options.get("url_expires", settings.S3_URL_EXPIRES)
+
+    def _open(self, name, mode="rb"):
+        # Файл скачивается во временный файл (в памяти до 8 МБ)
+        try:
+            response = self.client.get_object(name)
+        except S3Error as ex:
+            if ex.status == 404:
+                raise FileNotFoundError(name) from ex
+            raise
+        file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        with response:
+            while chunk := response.read(READ_SIZE):
+                file.write(chunk)
+        file.seek(0)
+        return File(file, name=name)
+
+    def _save(self, name, content):
+        if hasattr(content, "seek"):
+            content.seek(0)
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.client.put_object(name, content, content.size, content_type)
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(name)
+
+    def exists(self, name):
+        return self.client.head_object(name) is not None
+
+    def get_head(self, name) -> dict:
+        head = self.client.head_object(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head
+
+    def size(self, name):
+        return int(self.get_head(name)["Content-Length"])
+
+    def get_modified_time(self, name):
+        return parsedate_to_datetime(self.get_head(name)["Last-Modified"])
+
+    def url(self, name):
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{encode(name, safe='/-_.~')}"
+        return self.client.presign("GET", name, expires=self.url_expires)
+
+    def get_upload_url(self, name: str, size: int, expires: int = 3600) -> str:
+        """Подписанная ссылка для загрузки файла размером size байт (PUT)."""
+        return self.client.presign(
+            "PUT", name, expires=expires, headers={"content-length": str(size)}
+        )
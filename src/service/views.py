@@ -0,0 +1,73 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .files import send_file
+
+# Файлы фотографий и их копий называются по SHA-256 содержимого
+# (gallery.blobs), поэтому содержимое по такому адресу не меняется
+CONTENT_ADDRESSED_RE = re.compile(r"^photos/[0-9a-f]{2}/[0-9a-f]{64}(_\d+w)?\.\w+$")
+
+
+@extend_schema(tags=["Медиафайлы"])
+class MediaAPIView(APIView):
+    permission_classes = [AllowAny]
+    # Фотографии галереи доступны всем, как и API галереи. Фотографии
+    # профилей - только вошедшим пользователям, как и API пользователей.
+    # Остальные файлы, в том числе незавершённые загрузки (gallery.uploads),
+    # не отдаются
+    public_prefixes = ("photos/",)
+    authenticated_prefixes = ("profile_pictures/", "profile_photos/")
+    immutable_cache_control = "public, max-age=31536000, immutable"
+    private_cache_control = "private, max-age=3600"
+
+    def has_file_permission(self, request, name: str) -> bool:
+        if name.startswith(self.public_prefixes):
+            return True
+        if name.startswith(self.authenticated_prefixes):
+            return bool(request.user and request.user.is_authenticated)
+        return False
+
+    def get_file_name(self, name: str) -> str | None:
+        """Путь файла относительно MEDIA_ROOT после раскрытия "..",
+        "." и символических ссылок или None, если файл вне MEDIA_ROOT.
+
+        Права проверяются по этому пути, а не по пути из запроса, чтобы
+        photos/../uploads/... не считался файлом из photos/.
+        """
+        try:
+            path = Path(safe_join(settings.MEDIA_ROOT, name)).resolve()
+            return path.relative_to(Path(settings.MEDIA_ROOT).resolve()).as_posix()
+        except (SuspiciousFileOperation, ValueError):
+            return None
+
+    @extend_schema(tags=["Медиафайлы"], summary="Загруженный файл")
+    def get(self, request, *args, **kwargs):
+        name = self.get_file_name(kwargs["path"])
+        if name is None or not self.has_file_permission(request, name):
+            return Response(
+                data={"error": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        options = {}
+        if CONTENT_ADDRESSED_RE.match(name):
+            options["cache_control"] = self.immutable_cache_control
+        elif not name.startswith(self.public_prefixes):
+            # Ответ зависит от пользователя и не сохраняется в общих кэшах
+            options["cache_control"] = self.private_cache_control
+        try:
+            return send_file(
+                request, Path(settings.MEDIA_ROOT).resolve() / name, **options
+            )
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return Response(
+                data={"error": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND
+            )
@@ -1,6 +1,7 @@
 from rest_framework import permissions
 
 from profile_management.models import NewUser
+from profile_management.permissions import user_in_group
 
 
 class StaticInformationAdminPermission(permissions.BasePermission):
@@ -15,4 +16,4 @@ class StaticInformationAdminPermission(permissions.BasePermission):
 def is_equestrian_administrator(user: NewUser | None) -> bool:
     if not user or not getattr(user, "is_authenticated", False):
         return False
-    return bool(user.groups.filter(name="EquestrianAdministrator").exists())
+    return user_in_group(user, "EquestrianAdministrator")